@@ -1,19 +1,86 @@
 from typing import List
+import numpy as np
 from other.graph import DataGraph
+from other.graph_core import top_n
+from other.community import detect_communities
 
 class GraphAnalyzer:
     def __init__(self, data_graph_list: List[DataGraph]):
-        self.data_graph = data_graph
-        self.master_list = [] # TODO 添加函数一键获取
-        self.combine_data_graph() # TODO
+        self.data_graph_list = list(data_graph_list)
+        self.master_list = [master for graph in self.data_graph_list for master in graph.masters]
+        self._cache = {}
+        self.data_graph = self.combine_data_graph()
+
+    def combine_data_graph(self):
+        """
+        把多个账号的 DataGraph 合并为一个图（见 DataGraph.merge），只有一个账号时直接使用该图。
+        """
+        if len(self.data_graph_list) == 1:
+            return self.data_graph_list[0]
+        return DataGraph.merge(self.data_graph_list)
 
     def analyze_top_n_contacts(self, n=10):
-        # 示例：分析联系最多的N个人
-        pass
+        """
+        分析联系最多的N个人与N个群聊（按相连边的实际消息数之和，私聊计入双方的消息，见 DataGraph.edge_msg_counts），
+        并附带发送/接收方向的统计（见 DataGraph.get_send_msg_info / get_receive_msg_info）。
+        结果按图版本缓存。
+        """
+        graph = self.data_graph
+        key = ("top_n_contacts", graph.version, n)
+        if key in self._cache:
+            return self._cache[key]
+
+        core = graph.core
+        weight = core.weighted_degree(graph.edge_msg_counts())
+        is_master = np.isin(np.arange(core.num_nodes), [core.index[m] for m in self.master_list if m in core.index])
+
+        def ranking(group):
+            if group not in core.group_names:
+                return []
+            candidates = (core.node_group == core.group_names.index(group)) & ~is_master
+            values = np.where(candidates, weight, 0)
+            return [
+                {"id": core.ids[i], "label": graph.node_label(core.ids[i]), "count": int(values[i])}
+                for i in top_n(values, n) if values[i] > 0
+            ]
+
+        result = {
+            "top_users": ranking("user"),
+            "top_chatrooms": ranking("chatroom"),
+            "send": graph.get_send_msg_info(n),
+            "receive": graph.get_receive_msg_info(n),
+        }
+        self._cache[key] = result
+        return result
 
-    def analyze_communities(self):
-        # 示例：社区发现算法
-        # TODO 把毕设内容引进来，减少工作量（？）
-        pass
+    def analyze_communities(self, method="louvain", seed=0, n=10, apply=True, **kwargs):
+        """
+        社区发现：method 为 louvain（模块度优化，Leiden 风格保证社区连通）或 label_propagation（快速粗分）。
+        seed 固定时结果可复现。apply=True 时把结果写回 DataGraph 节点属性 community，
+        之后 visualize(color_by='community') 即可按社区着色。
+        返回社区数、模块度、耗时，以及最大的 N 个社区的规模与成员（按加权度排序的前 N 个节点）。
+        """
+        graph = self.data_graph
+        key = ("communities", graph.version, method, seed, n, tuple(sorted(kwargs.items())))
+        if key not in self._cache:
+            core = graph.core
+            result = detect_communities(core, method=method, seed=seed, **kwargs)
+            labels = result["labels"]
+            weight = core.weighted_degree()
+            sizes = np.bincount(labels, minlength=result["num_communities"])
+            communities = []
+            for c in range(min(n, result["num_communities"])):
+                members = np.flatnonzero(labels == c)
+                communities.append({
+                    "community": c,
+                    "size": int(sizes[c]),
+                    "members": [graph.node_label(core.ids[i]) for i in members[top_n(weight[members], n)]],
+                })
+            result["communities"] = communities
+            self._cache[key] = result
+        result = self._cache[key]
+        if apply:
+            graph.set_communities(result["labels"])
+        return result
 
     # 你可以继续添加其它分析方法
\ No newline at end of file
@@ -1,16 +1,22 @@
-from other.database import init_database
+from other.database import init_database, rebuild_pair_daily_stats
 from other.preprocessing import DataPreprocessing
 from other.graph import DataGraph
 
-def init_data():
+def init_data(workers=None):
     # 初始化数据库
     engine, Session = init_database()
 
-    # 创建数据预处理实例
-    dp = DataPreprocessing(r"/Users/lige/data/DYKYRSC/wechat/json")
-    # 存储数据到sqlite
+    # 创建数据预处理实例（流式读取，聊天记录逐个联系人写入）
+    # workers 为解析 JSON 的进程数，None 表示 CPU 核数，1 表示单进程串行解析
+    dp = DataPreprocessing(r"/Users/lige/data/DYKYRSC/wechat/json", stream=True, workers=workers)
+    # 存储数据到sqlite（增量导入：未变化的文件跳过，已存在的消息按指纹去重）
     dp.store_data_to_sqlite(engine, Session)
 
+def rebuild_stats():
+    # 根据wx_msg全量重建每日统计表pair_daily_stats（已有数据库升级时会自动执行一次）
+    engine, Session = init_database()
+    rebuild_pair_daily_stats(engine)
+
 def main():
     # 从聊天记录中构建一个图（Graph），节点为人，边为交流联系。
     # 考虑是否有异质节点（例如将群聊也当作是一个节点）    
@@ -23,6 +29,7 @@ def main():
 
 if __name__ == "__main__":
     # init_data()
+    # rebuild_stats()
     main()
     # TODO 新增算法处理类，传入DataGraph，其中有多个算法方法，输出各种参数
     # TODO delete chatrooms from database WXuser
@@ -8,10 +8,20 @@ import warnings
 import os
 from datetime import datetime
 from llm import GeminiApiPOOL
+from other.cache import TokenCache, ResponseCache
+from other.neo4j_pool import Neo4jConnection
+from other.gazetteer import Gazetteer
+from other.neo4j_batch import warm_schema
+from other.journal import JobJournal
+from other.segmentation import shutdown_executor
 
+import argparse
+import asyncio
+import atexit
 import subprocess
 import threading
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
 from tqdm import tqdm
 
 # 启动 caffeinate 保持唤醒
@@ -36,39 +46,81 @@ def warning_to_loguru(message, category, filename, lineno, file=None, line=None)
 warnings.showwarning = warning_to_loguru
 
 class WxidProcessor:
-    def __init__(self, neo4j_config, llm_api_key_pool, master_user_info):
+    def __init__(self, neo4j_config, llm_api_key_pool, master_user_info, queue_size=0, token_cache=None,
+                 response_cache=None, journal=None):
+        """
+        queue_size > 0 时队列有界，生产者在队列满时阻塞，配合流式读取可限制内存中同时存在的聊天记录数量。
+        token_cache 为各线程共用的持久化分词缓存，重试或重新运行时已分词的消息不再分词。
+        neo4j_config 可包含 pool_size（连接池大小），Neo4j 连接只创建一次，所有线程共用。
+        启动时为 User 与地址节点创建唯一约束；地址节点缓存同样由所有线程共用，启动时从 Neo4j 预热。
+        response_cache 为各线程共用的 LLM 响应缓存，重新运行时未变化的联系人不再调用 API。
+        journal 为持久化的任务日志（other.journal.JobJournal），记录每个联系人的处理状态，中断后可从断点继续。
+        """
         self.neo4j_config = neo4j_config
+        self.neo4j = Neo4jConnection(
+            neo4j_config["url"],
+            neo4j_config["user"],
+            neo4j_config["password"],
+            pool_size=neo4j_config.get("pool_size", 10),
+        )
+        self.neo4j.run(warm_schema)
+        self.gazetteer = Gazetteer()
+        self.neo4j.run(self.gazetteer.warm)
+        self.token_cache = token_cache
+        self.response_cache = response_cache
         self.llm_api_key_pool = llm_api_key_pool
         self.master_user_info = master_user_info
-        self.processed_wxids = set()
-        self.queue = Queue()
+        self.journal = journal
+        self.processed_wxids = journal.done_wxids() if journal is not None else set()
+        self.queue = Queue(maxsize=queue_size)
         self.lock = threading.Lock()
 
+    def new_builder(self):
+        return KGBuilder(
+            self.neo4j_config["url"],
+            self.neo4j_config["user"],
+            self.neo4j_config["password"],
+            self.llm_api_key_pool,
+            token_cache=self.token_cache,
+            connection=self.neo4j,
+            gazetteer=self.gazetteer,
+            response_cache=self.response_cache,
+        )
+
+    def record_result(self, wxid, success, error=None):
+        if self.journal is None:
+            return
+        if success:
+            self.journal.finish(wxid)
+        else:
+            self.journal.fail(wxid, error or "处理失败")
+
     def process_wxid(self):
         while True:
             time.sleep(1)
             try:
-                wxid, user_raw, messages = self.queue.get(timeout=1)  # 1秒超时
-            except Queue.empty:
+                item = self.queue.get(timeout=1)  # 1秒超时
+            except Empty:
+                continue
+            if item is None:  # 生产者放入的结束标记
+                self.queue.task_done()
                 break
+            wxid, user_raw, messages = item
 
             with self.lock:
                 if wxid in self.processed_wxids:
                     self.queue.task_done()
                     continue
 
+            if self.journal is not None:
+                self.journal.start(wxid)
             try:
                 users_raw = {
                     str(master_user_id): self.master_user_info,
                     str(wxid): user_raw,
                 }
 
-                kg = KGBuilder(
-                    self.neo4j_config["url"],
-                    self.neo4j_config["user"],
-                    self.neo4j_config["password"],
-                    self.llm_api_key_pool
-                )
+                kg = self.new_builder()
                 users = kg.filter_user_info(users_raw)
                 success = kg.process_and_push_pair(
                     messages=messages,
@@ -81,57 +133,205 @@ class WxidProcessor:
                         logger.success(f"成功处理用户: {wxid}，还剩{self.queue.qsize()} 个待处理用户。")
                     else:
                         logger.error(f"处理失败: {wxid}")
+                self.record_result(wxid, success)
 
             except Exception as e:
                 logger.error(f"处理用户 {wxid} 时发生错误: {str(e)}")
+                self.record_result(wxid, False, e)
             finally:
                 self.queue.task_done()
 
+    async def process_wxid_async(self, wxid, user_raw, messages, executor=None):
+        """
+        异步处理一个联系人：预处理在 executor 中执行，LLM 异步调用，写入Neo4j在线程池中执行。
+        任务日志的更新可能触发批量写入 SQLite，同样在 executor 中执行，不阻塞事件循环。
+        """
+        with self.lock:
+            if wxid in self.processed_wxids:
+                return
+
+        loop = asyncio.get_running_loop()
+        if self.journal is not None:
+            await loop.run_in_executor(executor, self.journal.start, wxid)
+        try:
+            users_raw = {
+                str(master_user_id): self.master_user_info,
+                str(wxid): user_raw,
+            }
+            kg = self.new_builder()
+            users = kg.filter_user_info(users_raw)
+            success = await kg.process_and_push_pair_async(messages=messages, users=users, executor=executor)
+
+            with self.lock:
+                if success:
+                    self.processed_wxids.add(wxid)
+                    logger.success(f"成功处理用户: {wxid}，已完成 {len(self.processed_wxids)} 个用户。")
+                else:
+                    logger.error(f"处理失败: {wxid}")
+            await loop.run_in_executor(executor, self.record_result, wxid, success)
+
+        except Exception as e:
+            logger.error(f"处理用户 {wxid} 时发生错误: {str(e)}")
+            await loop.run_in_executor(executor, self.record_result, wxid, False, e)
+
+    async def run_async(self, items, concurrency=32, executor=None):
+        """
+        异步执行模式：items 为 (wxid, user_raw, messages) 的可迭代对象（可为流式读取的生成器，在 executor 中逐个读取）。
+        信号量限制同时处理的联系人数，即在途的LLM请求数与同时驻留内存的聊天记录数。
+        返回处理的联系人数。
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.BoundedSemaphore(concurrency)
+        iterator = iter(items)
+        finished = object()
+        tasks = set()
+        count = 0
+
+        async def run_one(item):
+            try:
+                await self.process_wxid_async(*item, executor=executor)
+            finally:
+                semaphore.release()
+
+        while True:
+            await semaphore.acquire()
+            item = await loop.run_in_executor(executor, next, iterator, finished)
+            if item is finished:
+                semaphore.release()
+                break
+            task = asyncio.create_task(run_one(item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            count += 1
+
+        await asyncio.gather(*tasks)
+        return count
+
+
+def iter_pending(dp, journal=None, retry_failed_only=False):
+    """
+    流式读取待处理的联系人 (wxid, user_raw, messages)，跳过 master 与无资料、无聊天记录的联系人。
+    每个联系人只返回一次，目录中有多个聊天记录文件时与原先一致取最后一个（见 DataPreprocessing.iter_contacts）。
+    journal 不为空时跳过已完成的联系人（retry_failed_only=True 时只返回上次失败的联系人），
+    判断在读取聊天记录之前进行，已完成联系人的文件不会被解析；返回的联系人登记为 pending。
+    """
+    wxid_set = set(dp.wxid_list)
+    for wxid, messages in dp.iter_contacts():
+        if wxid == master_user_id or wxid not in wxid_set:
+            continue
+        if journal is not None and not journal.is_unfinished(wxid, retry_failed_only):
+            continue
+
+        user_raw = dp.users.get(wxid, {})
+        if not user_raw:
+            continue
+
+        messages = list(messages)
+        if not messages:
+            continue
+
+        if journal is not None:
+            journal.mark_pending(wxid)
+        yield wxid, user_raw, messages
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="逐个联系人生成知识图谱并写入Neo4j")
+    parser.add_argument("--data-dir", default=r"/Users/lige/data/DYKYRSC/wechat/json", help="聊天记录JSON目录")
+    parser.add_argument("--api-keys", default=r"/Users/lige/Desktop/api_key.xlsx", help="API key 表格")
+    parser.add_argument("--mode", choices=["async", "thread"], default="async",
+                        help="async：事件循环 + 信号量并发；thread：原有的多线程队列")
+    parser.add_argument("--concurrency", type=int, default=32, help="async 模式下同时处理的联系人数（在途LLM请求数）")
+    parser.add_argument("--threads", type=int, default=3, help="thread 模式下的工作线程数")
+    parser.add_argument("--cpu-workers", type=int, default=os.cpu_count() or 1,
+                        help="async 模式下执行预处理与读取聊天记录的线程数")
+    parser.add_argument("--pool-size", type=int, default=6, help="Neo4j连接池大小")
+    parser.add_argument("--rpm", type=int, default=10, help="每个 API key 每分钟请求数上限")
+    parser.add_argument("--tpm", type=int, default=250000, help="每个 API key 每分钟 token 数上限")
+    parser.add_argument("--llm-cache", default=os.path.join("data", "llm_cache.db"), help="LLM 响应缓存路径")
+    parser.add_argument("--no-llm-cache", action="store_true", help="不使用 LLM 响应缓存")
+    parser.add_argument("--llm-cache-bypass", action="store_true",
+                        help="忽略已缓存的响应重新请求（新结果仍写入缓存）")
+    parser.add_argument("--journal", default=os.path.join("data", "jobs.db"), help="任务日志路径，用于断点续跑")
+    parser.add_argument("--retry-failed", action="store_true", help="只重新处理上次失败的联系人")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    dp = DataPreprocessing(r"/Users/lige/data/DYKYRSC/wechat/json")
+    args = parse_args()
+
+    # 流式读取：只预先加载 users.json，聊天记录逐个联系人读取
+    dp = DataPreprocessing(args.data_dir, stream=True)
     master_user_info = dp.users.get(master_user_id, {})
-    llm_api_key_pool = GeminiApiPOOL(r"/Users/lige/Desktop/api_key.xlsx")
+    llm_api_key_pool = GeminiApiPOOL(args.api_keys, rpm=args.rpm, tpm=args.tpm)
 
     # Neo4j配置
     neo4j_config = {
         "url": NEO4J_URL,
         "user": NEO4J_USER,
-        "password": NEO4J_PASS
+        "password": NEO4J_PASS,
+        "pool_size": args.pool_size,
     }
 
-    # 创建处理器实例
-    processor = WxidProcessor(neo4j_config, llm_api_key_pool, master_user_info)
-
-    # 添加待处理的wxid到队列
-    skipped_count = 0
     total_users = len(dp.wxid_list) - 1  # 减去master用户
+    response_cache = None if args.no_llm_cache else ResponseCache(args.llm_cache, bypass=args.llm_cache_bypass)
+    journal = JobJournal(args.journal)
+    atexit.register(journal.flush)  # Ctrl+C 或异常退出时写入最后一批状态
+    logger.info(f"任务日志: {journal.summary()}")
+    pending = iter_pending(dp, journal, retry_failed_only=args.retry_failed)
 
-    for wxid in dp.wxid_list:
-        if wxid == master_user_id:
-            continue
+    if args.mode == "async":
+        processor = WxidProcessor(
+            neo4j_config, llm_api_key_pool, master_user_info, token_cache=TokenCache(), response_cache=response_cache,
+            journal=journal,
+        )
+        with ThreadPoolExecutor(max_workers=args.cpu_workers) as executor:
+            queued_count = asyncio.run(
+                processor.run_async(pending, concurrency=args.concurrency, executor=executor)
+            )
+        logger.info(f"总用户数: {total_users}, 跳过 {total_users - queued_count} 个无数据或已完成用户, 处理 {queued_count} 个用户")
+    else:
+        num_threads = args.threads
 
-        user_raw = dp.users.get(wxid, {})
-        messages = dp.msgs.get(wxid, [])
+        # 创建处理器实例，队列有界，避免所有联系人的聊天记录同时驻留内存
+        processor = WxidProcessor(
+            neo4j_config, llm_api_key_pool, master_user_info, queue_size=num_threads * 2, token_cache=TokenCache(),
+            response_cache=response_cache,
+            journal=journal,
+        )
 
-        if not user_raw or not messages:
-            skipped_count += 1
-            continue
+        # 先启动线程，再边读取边入队
+        threads = []
+        for _ in range(num_threads):
+            t = threading.Thread(target=processor.process_wxid)
+            t.daemon = True
+            t.start()
+            threads.append(t)
 
-        processor.queue.put((wxid, user_raw, messages))
+        # 添加待处理的wxid到队列
+        queued_count = 0
+        for item in pending:
+            processor.queue.put(item)
+            queued_count += 1
 
-    logger.info(f"总用户数: {total_users}, 跳过 {skipped_count} 个无数据用户, 待处理 {total_users - skipped_count} 个用户")
+        skipped_count = total_users - queued_count
+        logger.info(f"总用户数: {total_users}, 跳过 {skipped_count} 个无数据或已完成用户, 待处理 {queued_count} 个用户")
 
-    # 创建并启动线程
-    num_threads = 3  # 可以根据需要调整线程数
-    threads = []
-    for _ in range(num_threads):
-        t = threading.Thread(target=processor.process_wxid)
-        t.daemon = True
-        t.start()
-        threads.append(t)
+        # 放入结束标记，等待队列处理完成
+        for _ in threads:
+            processor.queue.put(None)
+        processor.queue.join()
 
-    # 等待队列处理完成
-    processor.queue.join()
+    # 所有联系人处理完毕，关闭共享的分词进程池
+    shutdown_executor()
+    logger.info(f"API key 使用情况: {llm_api_key_pool.stats()}")
+    logger.info(f"分词缓存: {processor.token_cache.stats()}")
+    if response_cache is not None:
+        logger.info(f"LLM响应缓存: {response_cache.stats()}")
+    logger.info(f"地址缓存: {processor.gazetteer.stats()}")
+    journal.close()
+    logger.info(f"任务日志: {journal.summary()}")
+    processor.neo4j.close()
 
 
 # TODO 如果有多个实体的话，将这些联系和节点强制绑定关系，不知道为什么，非用户实体总是默认和master绑定关系，而和其它user不绑定
@@ -1,17 +1,33 @@
 import json
 import re
-import jieba
+import asyncio
 from collections import Counter, defaultdict
-from py2neo import Graph, Node, Relationship
 from other.constant import NEO4J_URL, NEO4J_USER, NEO4J_PASS, output_json_example
 from loguru import logger
-from llm import build_prompt, call_llm
+from llm import build_prompt, call_llm, call_llm_async, DEFAULT_MODEL
+from other.segmentation import segment_counts, DEFAULT_WORKERS
+from other.neo4j_batch import Neo4jBatchWriter
+from other.neo4j_pool import Neo4jConnection
 import datetime
 
 class KGBuilder:
-    def __init__(self, neo4j_url, neo4j_user, neo4j_pass, llm_api_key_pool):
-        self.graph = Graph(neo4j_url, auth=(neo4j_user, neo4j_pass))
+    def __init__(self, neo4j_url, neo4j_user, neo4j_pass, llm_api_key_pool, token_cache=None, connection=None,
+                 gazetteer=None, response_cache=None, model=DEFAULT_MODEL):
+        """
+        connection 为共享的 Neo4jConnection（见 other.neo4j_pool）；为空时按 url/user/pass 自建一个。
+        gazetteer 为共享的地址节点缓存（见 other.gazetteer），已写入的地址节点不再重复合并。
+        response_cache 为持久化的 LLM 响应缓存（other.cache.ResponseCache），prompt 不变时不再调用 API。
+        """
+        self.connection = connection or Neo4jConnection(neo4j_url, neo4j_user, neo4j_pass)
         self.llm_api_key_pool = llm_api_key_pool
+        self.token_cache = token_cache  # 可选的持久化分词缓存（other.cache.TokenCache）
+        self.gazetteer = gazetteer
+        self.response_cache = response_cache
+        self.model = model
+
+    @property
+    def graph(self):
+        return self.connection.graph
 
     @staticmethod
     def filter_user_info(user_dict):
@@ -46,17 +62,18 @@ class KGBuilder:
         return clean_data
 
     @staticmethod
-    def extract_keywords_and_stats(messages_clean):
+    def extract_keywords_and_stats(messages_clean, workers=DEFAULT_WORKERS, token_cache=None):
         """
         Extracts keywords and statistical information from a list of cleaned message dictionaries.
 
         Args:
             messages_clean (list): A list of dictionaries, each representing a message with at least
                 'CreateTime' (str, format 'YYYY-MM-DD ...') and 'clean_msg' (str, cleaned message text).
+            workers (int): Number of segmentation processes (see other.segmentation.segment_counts).
+            token_cache (TokenCache, optional): Persistent token cache; cached messages skip segmentation.
 
         Returns:
             dict: A dictionary containing:
-                - "all_words" (list): All valid words extracted from messages.
                 - "word_counter" (Counter): Frequency count of all valid words.
                 - "day_counter" (Counter): Count of messages per day (key: 'YYYY-MM-DD').
                 - "month_counter" (Counter): Count of messages per month (key: 'YYYY-MM').
@@ -65,17 +82,9 @@ class KGBuilder:
                 - "most_common_words" (list): Top 20 most common valid words and their counts.
 
         Notes:
-            - Uses jieba for Chinese word segmentation.
+            - Uses jieba for Chinese word segmentation, batched across a shared process pool.
             - Filters out stopwords and punctuation.
         """
-        stopwords = set([
-            "我", "你", "的", "了", "在", "是", "和", "也", "有", "就", "不", "都", "吗", "啊", "吧", "哦", "呢", "着", "很", "还", "但", "与", "及", "或", "被", "为", "到", "说", "要", "会", "去", "他", "她", "它", "我们", "他们", "你们", "自己"
-        ])
-        punctuation = set("，。！？、；：“”‘’（）《》〈〉【】[]{}——-…,.!?;:\"'()<>[]{}")
-        def is_valid_word(word):
-            return word not in stopwords and word not in punctuation and re.match(r'\w', word)
-        all_words = []
-        word_counter = Counter()
         day_counter = Counter()
         month_counter = Counter()
         day_to_msgs = defaultdict(list)
@@ -83,17 +92,15 @@ class KGBuilder:
             date = m['CreateTime'].split(' ')[0]
             day_counter[date] += 1
             day_to_msgs[date].append(m)
-            words = jieba.lcut(m['clean_msg'])
-            valid_words = [w for w in words if is_valid_word(w)]
-            all_words.extend(valid_words)
-            word_counter.update(valid_words)
+        word_counter = segment_counts(
+            (m['clean_msg'] for m in messages_clean), workers=workers, cache=token_cache
+        )
         for day in day_counter:
             month = day[:7]
             month_counter[month] += day_counter[day]
         most_active_days = [d for d, _ in day_counter.most_common(5)]
         most_common_words = word_counter.most_common(20)
         return {
-            "all_words": all_words,
             "word_counter": word_counter,
             "day_counter": day_counter,
             "month_counter": month_counter,
@@ -120,24 +127,6 @@ class KGBuilder:
             print("未找到JSON数据")
             return None
 
-    def push_to_neo4j(self, kg_json):
-        node_map = {}
-        for node in kg_json.get("nodes", []):
-            node_id = node.get("id") or node.get("wxid")
-            label = node.get("label", "User")
-            n = Node(label, **{k: v for k, v in node.items() if k != "label"})
-            self.graph.merge(n, label, "id")
-            node_map[node_id] = n
-        for rel in kg_json.get("relations", []):
-            start_id = rel.get("start")
-            end_id = rel.get("end")
-            start_node = node_map.get(start_id)
-            end_node = node_map.get(end_id)
-            if start_node and end_node:
-                r = Relationship(start_node, rel.get("type", "RELATES_TO"), end_node, **rel.get("properties", {}))
-                self.graph.merge(r)
-
-
     def compress_sample_msgs(self, day_to_msgs, most_active_days, max_days=5, max_per_day=100):
         """
         对消息最多的几天的消息进行压缩，减少token消耗。
@@ -162,6 +151,30 @@ class KGBuilder:
         return json.dumps({"messages": compressed}, ensure_ascii=False)
 
 
+    def build_pair_prompt(self, messages, users, output_json_example=output_json_example):
+        """
+        消息预处理、分词统计与构建prompt（CPU密集部分，异步流程中放到执行器中运行）。
+        """
+        wxid_list = list(users.keys())
+        user1_wxid, user2_wxid = wxid_list[:2]
+
+        # 消息预处理
+        messages_clean = self.preprocess_messages(messages)
+
+        # 信息抽取
+        stats = self.extract_keywords_and_stats(messages_clean, token_cache=self.token_cache)
+        sample_msgs_json = self.compress_sample_msgs(stats["day_to_msgs"], stats["most_active_days"])
+
+        # 构建prompt
+        return build_prompt(
+            json.dumps(users[user1_wxid], ensure_ascii=False),
+            json.dumps(users[user2_wxid], ensure_ascii=False),
+            json.dumps(dict(stats["month_counter"]), ensure_ascii=False),
+            json.dumps(stats["most_common_words"], ensure_ascii=False),
+            sample_msgs_json,
+            output_json_example
+        )
+
     def generate_knowledge_graph(
             self,
             messages,
@@ -173,115 +186,44 @@ class KGBuilder:
             处理两人关系，生成知识图谱JSON。
             返回：(result_json) 元组
             """
-            if api_key is None:
-                api_key = self.llm_api_key_pool.get_api_key()
-    
-            wxid_list = list(users.keys())
-            user1_wxid, user2_wxid = wxid_list[:2]
-    
-            # 消息预处理
-            messages_clean = self.preprocess_messages(messages)
-    
-            # 信息抽取
-            stats = self.extract_keywords_and_stats(messages_clean)
-            sample_msgs_json = self.compress_sample_msgs(stats["day_to_msgs"], stats["most_active_days"])
-    
-            # 构建prompt
-            prompt = build_prompt(
-                json.dumps(users[user1_wxid], ensure_ascii=False),
-                json.dumps(users[user2_wxid], ensure_ascii=False),
-                json.dumps(dict(stats["month_counter"]), ensure_ascii=False),
-                json.dumps(stats["most_common_words"], ensure_ascii=False),
-                sample_msgs_json,
-                output_json_example
-            )
-    
+            prompt = self.build_pair_prompt(messages, users, output_json_example)
+
             # LLM调用
-            response_text = call_llm(prompt, api_key=api_key)
-    
+            response_text = self.request_llm(prompt, api_key)
+
             # 提取JSON
             result_json = self.extract_json_from_text(response_text)
             return result_json
-    
 
-    def push_address_nodes_and_relations(self, result_json):
+    def request_llm(self, prompt, api_key=None):
+        """
+        调用LLM，返回原始响应文本；未指定 api_key 时由 key 池按配额与健康状况调度。
+        """
+        if api_key is None:
+            return call_llm(prompt, model=self.model, key_pool=self.llm_api_key_pool)
+        return call_llm(prompt, api_key=api_key, model=self.model)
+
+    async def request_llm_async(self, prompt, api_key=None):
+        if api_key is None:
+            return await call_llm_async(prompt, model=self.model, key_pool=self.llm_api_key_pool)
+        return await call_llm_async(prompt, api_key=api_key, model=self.model)
+
+    def cached_result(self, prompt, user1_wxid, user2_wxid):
         """
-        检查所有User节点，若有country/province/city属性，则新建对应的Country/Province/City节点，并建立归属关系。
-        同时将User节点与最详细的地点节点建立WECHAT_ADDRESS关系。
+        查询响应缓存，命中时返回缓存的知识图谱JSON，否则返回 None。
         """
-        # 用于缓存已创建的地址节点，避免重复创建
-        country_nodes = {}
-        province_nodes = {}
-        city_nodes = {}
-
-        for node in result_json.get("nodes", []):
-            if node.get("label") != "User":
-                continue
-            country = node.get("country", None)
-            province = node.get("province", None)
-            city = node.get("city", None)
-            # 只处理有地址信息的节点
-            if not country and not province and not city:
-                continue
-
-            # 创建Country节点
-            country_node = None
-            if country is not None:
-                country_key = country
-                if country_key in country_nodes:
-                    country_node = country_nodes[country_key]
-                else:
-                    country_node = Node("Country", countryName=country)
-                    self.graph.merge(country_node, "Country", "countryName")
-                    country_nodes[country_key] = country_node
-
-            # 创建Province节点
-            province_node = None
-            if province is not None:
-                province_key = (country, province)
-                if province_key in province_nodes:
-                    province_node = province_nodes[province_key]
-                else:
-                    province_node = Node("Province", countryName=country, provinceName=province)
-                    self.graph.merge(province_node, "Province", ("provinceName", "countryName"))
-                    province_nodes[province_key] = province_node
-
-            # 创建City节点
-            city_node = None
-            if city is not None:
-                city_key = (country, province, city)
-                if city_key in city_nodes:
-                    city_node = city_nodes[city_key]
-                else:
-                    city_node = Node("City", countryName=country, provinceName=province, cityName=city)
-                    self.graph.merge(city_node, "City", ("provinceName", "countryName", "cityName"))
-                    city_nodes[city_key] = city_node
-
-            # 建立归属关系
-            # City 属于 Province
-            if city_node and province_node:
-                rel = Relationship(city_node, "LOCATED_IN_PROVINCE", province_node)
-                self.graph.merge(rel)
-            # City 属于 Country
-            if city_node and country_node:
-                rel = Relationship(city_node, "LOCATED_IN_COUNTRY", country_node)
-                self.graph.merge(rel)
-            # Province 属于 Country
-            if province_node and country_node:
-                rel = Relationship(province_node, "LOCATED_IN_COUNTRY", country_node)
-                self.graph.merge(rel)
-
-            # 新增：User节点与地点建立WECHAT_ADDRESS关系
-            user_id = node.get("id") or node.get("wxid")
-            user_label = node.get("label", "User")
-            user_node = Node(user_label, **{k: v for k, v in node.items() if k != "label"})
-            self.graph.merge(user_node, user_label, "id")
-
-            # 优先city，其次province，再次country
-            address_node = city_node or province_node or country_node
-            if address_node:
-                rel = Relationship(user_node, "WECHAT_ADDRESS", address_node)
-                self.graph.merge(rel)
+        if self.response_cache is None:
+            return None
+        result_json = self.response_cache.get(prompt, self.model)
+        if result_json is not None:
+            logger.info(f"LLM响应缓存命中：{user1_wxid} <-> {user2_wxid}")
+        return result_json
+
+    def cache_result(self, prompt, response_text, result_json):
+        # 只缓存通过验证的结果
+        if self.response_cache is not None:
+            self.response_cache.put(prompt, self.model, response_text, result_json)
+    
 
     def write_to_neo4j(self, result_json, user1_wxid, user2_wxid):
         """
@@ -289,8 +231,14 @@ class KGBuilder:
         """
         try:
             if result_json:
-                self.push_address_nodes_and_relations(result_json)  # 写入地址相关节点和关系
-                self.push_to_neo4j(result_json)  # 写入知识图谱节点和关系
+                # 知识图谱节点和关系、地址相关节点和关系在同一个事务中批量写入，连接中断时重连重试
+                def write(graph):
+                    writer = Neo4jBatchWriter(graph)
+                    writer.add_kg(result_json)
+                    writer.add_addresses(result_json, gazetteer=self.gazetteer)
+                    writer.flush()
+
+                self.connection.run(write)
                 node_count = len(result_json.get("nodes", []))
                 edge_count = len(result_json.get("relations", []))
                 logger.info(f"KG写入Neo4j成功：{user1_wxid} <-> {user2_wxid}，节点数：{node_count}，边数：{edge_count}")
@@ -389,7 +337,8 @@ class KGBuilder:
                               output_json_example=output_json_example, 
                               api_key=None):
         """
-        完整处理流程的包装方法，包含重试逻辑
+        完整处理流程的包装方法，包含重试逻辑。
+        prompt 只构建一次；响应缓存命中时直接写入，不调用LLM；验证通过的结果写入缓存。
         """
         max_retries = 10
         retry_count = 0
@@ -397,16 +346,21 @@ class KGBuilder:
         wxid_list = list(users.keys())
         user1_wxid, user2_wxid = wxid_list[:2]
 
+        prompt = self.build_pair_prompt(messages, users, output_json_example)
+        result_json = self.cached_result(prompt, user1_wxid, user2_wxid)
+        if result_json is not None:
+            return self.write_to_neo4j(result_json, user1_wxid, user2_wxid)
+
         while retry_count < max_retries:
-            result_json = self.generate_knowledge_graph(
-                messages, users, output_json_example, api_key
-            )
+            response_text = self.request_llm(prompt, api_key)
+            result_json = self.extract_json_from_text(response_text)
             
             # 验证生成的知识图谱
             is_valid, error_msg = self.validate_kg_json(result_json)
             
 
             if is_valid:
+                self.cache_result(prompt, response_text, result_json)
                 return self.write_to_neo4j(result_json, user1_wxid, user2_wxid)
             else:
                 retry_count += 1
@@ -416,4 +370,40 @@ class KGBuilder:
                     logger.error(f"达到最大重试次数({max_retries})，处理失败: {user1_wxid} <-> {user2_wxid}")
                     return False
                 
-        return False
\ No newline at end of file
+        return False
+
+    async def process_and_push_pair_async(self,
+                                          messages,
+                                          users,
+                                          output_json_example=output_json_example,
+                                          api_key=None,
+                                          executor=None):
+        """
+        process_and_push_pair 的异步版本：预处理只做一次，LLM 异步调用与重试，
+        响应缓存读写与写入Neo4j（阻塞I/O）放到默认线程池执行。
+        """
+        max_retries = 10
+
+        wxid_list = list(users.keys())
+        user1_wxid, user2_wxid = wxid_list[:2]
+
+        loop = asyncio.get_running_loop()
+        prompt = await loop.run_in_executor(executor, self.build_pair_prompt, messages, users, output_json_example)
+        result_json = await loop.run_in_executor(None, self.cached_result, prompt, user1_wxid, user2_wxid)
+        if result_json is not None:
+            return await loop.run_in_executor(None, self.write_to_neo4j, result_json, user1_wxid, user2_wxid)
+
+        for retry_count in range(1, max_retries + 1):
+            response_text = await self.request_llm_async(prompt, api_key)
+            result_json = self.extract_json_from_text(response_text)
+
+            # 验证生成的知识图谱
+            is_valid, error_msg = self.validate_kg_json(result_json)
+
+            if is_valid:
+                await loop.run_in_executor(None, self.cache_result, prompt, response_text, result_json)
+                return await loop.run_in_executor(None, self.write_to_neo4j, result_json, user1_wxid, user2_wxid)
+            logger.warning(f"知识图谱Json验证失败 (第{retry_count}次尝试): {error_msg}")
+
+        logger.error(f"达到最大重试次数({max_retries})，处理失败: {user1_wxid} <-> {user2_wxid}")
+        return False
@@ -1,9 +1,34 @@
 import time
+import asyncio
+import threading
 from google import genai
 import pandas as pd
 import random
+from collections import Counter
 from loguru import logger
 
+DEFAULT_MODEL = "gemini-2.5-flash"
+
+# 每个 API key 复用一个 genai.Client（同步与 client.aio 异步调用共用），避免每次调用重新建立连接
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key):
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = genai.Client(api_key=api_key)
+        return client
+
+
+def backoff_delay(attempt, retry_delay=5, max_delay=60):
+    """
+    第 attempt 次（从 0 开始）失败后的等待时间：指数退避加全抖动，
+    避免大量并发请求在同一时刻失败后又在同一时刻重试。
+    """
+    return random.uniform(0, min(max_delay, retry_delay * 2 ** attempt))
+
 def build_prompt(user1_info, user2_info, month_counter_json, most_common_words_json, sample_msgs_json, output_json_example) -> str:
     prompt = (
         "你是一个信息抽取系统，用于从我提供的微信聊天数据中提取实体、关系和属性，以便我之后建立 Neo4j 知识图谱。\n"
@@ -36,7 +61,19 @@ def build_prompt(user1_info, user2_info, month_counter_json, most_common_words_j
     return prompt
 
 
-def call_llm(prompt, api_key, model="gemini-2.5-flash", max_retries=3, retry_delay=5):
+def estimate_tokens(text):
+    """
+    粗略估计 prompt 的 token 数（中文约一字一个 token），用于每分钟 token 配额的预占。
+    """
+    return len(text) if text else 0
+
+
+def response_tokens(response, default=None):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or default
+
+
+def call_llm(prompt, api_key=None, model=DEFAULT_MODEL, max_retries=3, retry_delay=5, key_pool=None):
     """
     调用LLM API并自动重试
     
@@ -46,10 +83,12 @@ def call_llm(prompt, api_key, model="gemini-2.5-flash", max_retries=3, retry_del
         model: 模型名称
         max_retries: 最大重试次数
         retry_delay: 重试间隔（秒）
+        key_pool: GeminiApiPOOL，给定时每次尝试向其租用一个 key 并回报结果，
+            出错的 key 进入冷却，重试换用其他 key，不再原地等待 retry_delay
     """
-    client = genai.Client(api_key=api_key)
-    
     for attempt in range(max_retries):
+        lease = key_pool.acquire(estimate_tokens(prompt)) if key_pool is not None else None
+        client = get_client(lease.api_key if lease else api_key)
         start_time = time.time()
         try:
             response = client.models.generate_content(
@@ -57,15 +96,21 @@ def call_llm(prompt, api_key, model="gemini-2.5-flash", max_retries=3, retry_del
                 contents=prompt
             )
             end_time = time.time()
+            if lease:
+                lease.release(tokens_used=response_tokens(response))
             logger.info(f"LLM调用完成，用时 {end_time - start_time:.2f} 秒")
             return response.text
             
         except Exception as e:
             end_time = time.time()
+            if lease:
+                lease.release(error=e)
             logger.error(f"LLM调用失败（第{attempt + 1}次尝试），用时 {end_time - start_time:.2f} 秒")
             logger.error(f"错误详情：{e}")
             
             if attempt < max_retries - 1:
+                if lease and classify_error(e) != "other":
+                    continue  # 该 key 已进入冷却，下一次租用会换到其他 key
                 logger.info(f"等待 {retry_delay} 秒后重试...")
                 time.sleep(retry_delay)
                 continue
@@ -73,14 +118,327 @@ def call_llm(prompt, api_key, model="gemini-2.5-flash", max_retries=3, retry_del
                 logger.error(f"达到最大重试次数 ({max_retries})，调用失败")
                 return None
 
+
+async def call_llm_async(prompt, api_key=None, model=DEFAULT_MODEL, max_retries=3, retry_delay=5, max_delay=60,
+                         key_pool=None):
+    """
+    call_llm 的异步版本：使用复用的 client.aio 发送请求，失败时以带抖动的指数退避异步等待后重试，
+    等待期间不占用线程，可同时保持大量请求在途。失败返回 None。
+    key_pool 同 call_llm，租用 key 时异步等待配额。
+    """
+    for attempt in range(max_retries):
+        lease = await key_pool.acquire_async(estimate_tokens(prompt)) if key_pool is not None else None
+        client = get_client(lease.api_key if lease else api_key)
+        start_time = time.time()
+        try:
+            response = await client.aio.models.generate_content(
+                model=model,
+                contents=prompt
+            )
+            if lease:
+                lease.release(tokens_used=response_tokens(response))
+            logger.info(f"LLM调用完成，用时 {time.time() - start_time:.2f} 秒")
+            return response.text
+
+        except Exception as e:
+            if lease:
+                lease.release(error=e)
+            logger.error(f"LLM调用失败（第{attempt + 1}次尝试），用时 {time.time() - start_time:.2f} 秒")
+            logger.error(f"错误详情：{e}")
+
+            if attempt < max_retries - 1:
+                if lease and classify_error(e) != "other":
+                    continue
+                delay = backoff_delay(attempt, retry_delay, max_delay)
+                logger.info(f"等待 {delay:.1f} 秒后重试...")
+                await asyncio.sleep(delay)
+            else:
+                logger.error(f"达到最大重试次数 ({max_retries})，调用失败")
+                return None
+
+
+# 按错误类型的 key 冷却时间（秒）：限流时按连续错误次数指数增长，认证错误长时间停用，服务端错误短暂避开
+ERROR_COOLDOWNS = {"rate_limit": 60, "auth": 3600, "server": 10, "other": 0}
+MAX_COOLDOWN = 600
+# 健康分低于该值的 key 只在没有其他可用 key 时使用
+MIN_HEALTH = 0.3
+# 出错后健康分随时间向 1.0 恢复，与 1.0 的差距每 HEALTH_HALF_LIFE 秒减半；
+# 限流的 key 冷却结束后很快回到正常排序，不会因为没有被选中、没有成功调用而一直排在最后
+HEALTH_HALF_LIFE = 60
+
+
+# google-genai APIError.status（gRPC 状态名）到错误类型的对应，用于没有 HTTP 状态码的异常
+STATUS_KINDS = {
+    "RESOURCE_EXHAUSTED": "rate_limit",
+    "PERMISSION_DENIED": "auth",
+    "UNAUTHENTICATED": "auth",
+    "UNAVAILABLE": "server",
+    "INTERNAL": "server",
+    "DEADLINE_EXCEEDED": "server",
+}
+
+
+def error_status_code(error):
+    """
+    异常携带的 HTTP 状态码：google-genai APIError.code，或 httpx 等异常的 status_code / response.status_code。
+    """
+    for code in (
+        getattr(error, "code", None),
+        getattr(error, "status_code", None),
+        getattr(getattr(error, "response", None), "status_code", None),
+    ):
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def classify_error(error):
+    """
+    把 API 异常归类为 rate_limit / auth / server / other。
+    优先按状态码判断，其次按 APIError.status，连接与超时错误视为 server（暂时性错误），不匹配错误消息文本。
+    """
+    code = error_status_code(error)
+    if code is not None:
+        if code == 429:
+            return "rate_limit"
+        if code in (401, 403):
+            return "auth"
+        if code >= 500:
+            return "server"
+        return "other"
+    status = getattr(error, "status", None)
+    if isinstance(status, str) and status in STATUS_KINDS:
+        return STATUS_KINDS[status]
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return "server"
+    return "other"
+
+
+class TokenBucket:
+    """
+    按分钟配额的令牌桶：容量为每分钟配额，每秒匀速补充 配额/60。per_minute 为 None 时不限。
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute) if per_minute else None
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """
+        距离可以取出 amount 还需等待的秒数（超过容量的请求按容量计，避免永远等待）。
+        """
+        if self.capacity is None:
+            return 0.0
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) * 60 / self.capacity
+
+    def consume(self, amount):
+        # 允许为负：实际用量超过预占时记为欠额，之后补充时先还清
+        if self.capacity is not None:
+            self.level -= amount
+
+    def utilisation(self, now):
+        if self.capacity is None:
+            return 0.0
+        self.refill(now)
+        return max(0.0, 1 - self.level / self.capacity)
+
+
+class KeyState:
+    def __init__(self, api_key, rpm, tpm):
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.health = 1.0
+        self.health_updated = time.monotonic()
+        self.cooldown_until = 0.0
+        self.consecutive_errors = 0
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.errors = Counter()
+
+
+    def current_health(self, now):
+        """
+        当前健康分：上次更新后按 HEALTH_HALF_LIFE 向 1.0 恢复。
+        """
+        return 1 - (1 - self.health) * 0.5 ** ((now - self.health_updated) / HEALTH_HALF_LIFE)
+
+    def update_health(self, now, success):
+        health = self.current_health(now)
+        self.health = health * 0.8 + 0.2 if success else health * 0.5
+        self.health_updated = now
+
+
+class KeyLease:
+    """
+    租用的 key：用 api_key 发送请求后调用 release(tokens_used=...) 或 release(error=...) 回报结果。
+    也可用作上下文管理器，退出时按是否有异常自动回报。
+    """
+
+    def __init__(self, pool, state, reserved_tokens):
+        self.pool = pool
+        self.state = state
+        self.reserved_tokens = reserved_tokens
+        self.released = False
+
+    @property
+    def api_key(self):
+        return self.state.api_key
+
+    def release(self, tokens_used=None, error=None):
+        if not self.released:
+            self.released = True
+            self.pool.release(self, tokens_used=tokens_used, error=error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(error=exc)
+        return False
+
+
 class GeminiApiPOOL():
-    def __init__(self, api_keys_file):
+    """
+    API key 调度器：每个 key 有每分钟请求数（rpm）与每分钟 token 数（tpm）两个令牌桶、健康分与冷却时间。
+    - acquire / acquire_async：租用一个 key，在配额未满、不在冷却中的 key 里选在途请求最少、健康分最高的；
+      都不可用时等待到最早可用的时刻；
+    - release：回报结果，成功时按实际 token 用量修正预占，失败时按错误类型（见 classify_error）降低健康分并冷却，
+      健康分随时间自行恢复（见 HEALTH_HALF_LIFE）；
+    - stats：每个 key 的利用率、在途数、错误数等统计。
+    默认配额为 gemini-2.5-flash 免费档（10 RPM、250000 TPM），可按实际档位调整。
+    """
+
+    def __init__(self, api_keys_file, rpm=10, tpm=250000):
         self.api_keys_file = api_keys_file
         self.api_keys = self.load_api_keys()
+        self.condition = threading.Condition()
+        self.states = [KeyState(key, rpm, tpm) for key in dict.fromkeys(self.api_keys)]
 
     def load_api_keys(self):
         df = pd.read_excel(self.api_keys_file)
         return df['api_key'].tolist()
-    
+
+    def try_acquire(self, tokens=0):
+        """
+        立即尝试租用，返回 (KeyLease 或 None, 建议等待秒数)。
+        """
+        now = time.monotonic()
+        with self.condition:
+            ready = []
+            wait = None
+            for state in self.states:
+                delay = max(
+                    state.cooldown_until - now,
+                    state.requests.wait_time(1, now),
+                    state.tokens.wait_time(tokens, now),
+                )
+                if delay <= 0:
+                    ready.append(state)
+                elif wait is None or delay < wait:
+                    wait = delay
+            if not ready:
+                return None, wait if wait is not None else 1.0
+            health = {id(st): st.current_health(now) for st in ready}
+            state = min(ready, key=lambda st: (health[id(st)] < MIN_HEALTH, st.in_flight, -health[id(st)],
+                                                st.requests.utilisation(now)))
+            state.requests.consume(1)
+            state.tokens.consume(tokens)
+            state.in_flight += 1
+            state.total_requests += 1
+            return KeyLease(self, state, tokens), 0.0
+
+    def acquire(self, tokens=0, timeout=None):
+        """
+        租用一个 key（阻塞等待配额），tokens 为本次请求预计的 token 数。超时抛出 TimeoutError。
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            lease, wait = self.try_acquire(tokens)
+            if lease:
+                return lease
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("没有可用的 API key")
+                wait = min(wait, remaining)
+            with self.condition:
+                # release 时会唤醒等待者；最多等待到最早可用的时刻
+                self.condition.wait(wait)
+
+    async def acquire_async(self, tokens=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            lease, wait = self.try_acquire(tokens)
+            if lease:
+                return lease
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("没有可用的 API key")
+                wait = min(wait, remaining)
+            await asyncio.sleep(min(wait, 1.0))
+
+    def release(self, lease, tokens_used=None, error=None):
+        state = lease.state
+        now = time.monotonic()
+        with self.condition:
+            state.in_flight -= 1
+            if error is None:
+                if tokens_used is not None:
+                    state.tokens.refill(now)
+                    state.tokens.consume(tokens_used - lease.reserved_tokens)
+                state.total_tokens += tokens_used if tokens_used is not None else lease.reserved_tokens
+                state.update_health(now, success=True)
+                state.consecutive_errors = 0
+            else:
+                kind = classify_error(error)
+                state.errors[kind] += 1
+                # 冷却开始前已发出的并发请求陆续失败时，只算一次，不重复加长冷却
+                if state.cooldown_until <= now:
+                    state.consecutive_errors += 1
+                state.update_health(now, success=False)
+                cooldown = ERROR_COOLDOWNS[kind]
+                if kind == "rate_limit":
+                    cooldown = min(MAX_COOLDOWN, cooldown * 2 ** (state.consecutive_errors - 1))
+                if cooldown:
+                    state.cooldown_until = max(state.cooldown_until, now + cooldown)
+                    logger.warning(f"API key ...{state.api_key[-4:]} 出现{kind}错误，冷却 {cooldown} 秒")
+            self.condition.notify_all()
+
     def get_api_key(self):
-        return random.choice(self.api_keys)
+        """
+        兼容旧接口：选出当前最合适的 key 并立即归还（不回报结果，不影响健康分）。
+        需要按结果调度时使用 acquire。
+        """
+        lease = self.acquire()
+        with self.condition:
+            lease.state.in_flight -= 1
+            lease.released = True
+        return lease.api_key
+
+    def stats(self):
+        now = time.monotonic()
+        with self.condition:
+            return {
+                f"...{state.api_key[-4:]}": {
+                    "in_flight": state.in_flight,
+                    "requests": state.total_requests,
+                    "tokens": state.total_tokens,
+                    "rpm_utilisation": round(state.requests.utilisation(now), 3),
+                    "tpm_utilisation": round(state.tokens.utilisation(now), 3),
+                    "health": round(state.current_health(now), 3),
+                    "cooldown": round(max(0.0, state.cooldown_until - now), 1),
+                    "errors": dict(state.errors),
+                }
+                for state in self.states
+            }
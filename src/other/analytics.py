@@ -0,0 +1,223 @@
+import os
+import json
+import itertools
+import numpy as np
+from other.database import database_fingerprint
+from other.graph_core import top_n
+
+# 列式缓存格式版本，内容结构变化时递增
+MSG_COLUMNS_VERSION = 1
+
+# 按 id 顺序逐列读取消息，三次查询的行一一对应。
+# 时间与发送方向在 SQLite 中合并为一个整数（秒 * 2 + is_sender），Python 侧只接收单列，不构造 ORM 对象。
+MSG_TIME_SQL = """
+SELECT CAST(strftime('%s', CreateTime) AS INTEGER) * 2 + COALESCE(is_sender, 0)
+FROM wx_msg WHERE CreateTime IS NOT NULL ORDER BY id
+"""
+MSG_COLUMN_SQL = "SELECT {column} FROM wx_msg WHERE CreateTime IS NOT NULL ORDER BY id"
+
+
+def query_msg_columns(session):
+    """
+    从数据库批量读取消息列，返回 dict：
+    time（int64，秒）、is_sender（bool）、talker_code / room_code（int32），
+    talkers / rooms（编号 -> wxid / room_name，str 数组）。
+    字符串列用字典编号（每个取值只保存一次），直接使用 DBAPI 游标以避免逐行构造 Row 对象。
+    """
+    cursor = session.connection().connection.driver_connection.cursor()
+    try:
+        cursor.execute(MSG_TIME_SQL)
+        packed = np.fromiter(itertools.chain.from_iterable(cursor), dtype=np.int64)
+
+        def encode(column):
+            codes = {}
+            cursor.execute(MSG_COLUMN_SQL.format(column=column))
+            values = np.fromiter((codes.setdefault(value, len(codes)) for (value,) in cursor), dtype=np.int32)
+            return values, np.array([name or "" for name in codes], dtype=str)
+
+        talker_code, talkers = encode("talker")
+        room_code, rooms = encode("room_name")
+    finally:
+        cursor.close()
+    return {
+        "time": packed >> 1,
+        "is_sender": (packed & 1).astype(bool),
+        "talker_code": talker_code,
+        "room_code": room_code,
+        "talkers": talkers,
+        "rooms": rooms,
+    }
+
+
+def concat_msg_columns(parts):
+    """
+    拼接多个数据库的消息列，发言人与会话按名称重新编号。
+    """
+    if len(parts) == 1:
+        return parts[0]
+    columns = {
+        "time": np.concatenate([p["time"] for p in parts]),
+        "is_sender": np.concatenate([p["is_sender"] for p in parts]),
+    }
+    for code, names in (("talker_code", "talkers"), ("room_code", "rooms")):
+        merged, inverse = np.unique(np.concatenate([p[names] for p in parts]), return_inverse=True)
+        offsets = np.cumsum([0] + [len(p[names]) for p in parts])
+        columns[names] = merged
+        columns[code] = np.concatenate(
+            [inverse[offsets[i]:offsets[i + 1]][p[code]] for i, p in enumerate(parts)]
+        ).astype(np.int32)
+    return columns
+
+
+class MsgAnalytics:
+    """
+    “什么时候和谁聊天”的统计。消息按列读入 numpy 数组（见 query_msg_columns），
+    列式数据按数据库指纹缓存为 npz，之后的统计全部由 bincount 完成，不遍历消息。
+    - hour_weekday：7 x 24 的星期 x 小时消息数（周一为 0）
+    - months：按月的消息数
+    - contact_hour_weekday / contact_months：每个会话（或发言人）的上述直方图
+    """
+
+    def __init__(self, sessions, cache_file=None, label=None):
+        """
+        sessions 为一个或多个数据库的 Session（多个账号合并时各读一次再拼接）；
+        cache_file 为列式缓存路径（None 表示不缓存）；label 为 id -> 展示名 的函数，用于导出。
+        """
+        if not isinstance(sessions, (list, tuple)):
+            sessions = [sessions]
+        self.sessions = list(sessions)
+        self.cache_file = cache_file
+        self.label = label or (lambda node_id: node_id)
+        self.version = "|".join(database_fingerprint(session) for session in self.sessions)
+        self.columns = self.load_columns()
+
+        time = self.columns["time"]
+        # 1970-01-01 是周四，换算为周一=0；时间按数据库中记录的本地时间处理
+        days = np.floor_divide(time, 86400)
+        self.hour = (np.floor_divide(time, 3600) % 24).astype(np.int8)
+        self.weekday = ((days + 3) % 7).astype(np.int8)
+        month = time.astype("datetime64[s]").astype("datetime64[M]")
+        if len(month):
+            self.month_start = month.min()
+            self.month_code = (month - self.month_start).astype(np.int64)
+            self.month_labels = np.arange(self.month_start, month.max() + 1).astype(str)
+        else:
+            self.month_start = None
+            self.month_code = np.zeros(0, dtype=np.int64)
+            self.month_labels = np.zeros(0, dtype=str)
+
+    def load_columns(self):
+        """
+        读取列式缓存；缓存不存在或数据库指纹变化时重新查询并写回。
+        """
+        if self.cache_file and os.path.exists(self.cache_file):
+            try:
+                with np.load(self.cache_file) as data:
+                    if int(data["cache_version"]) == MSG_COLUMNS_VERSION and str(data["fingerprint"]) == self.version:
+                        return {key: data[key] for key in
+                                ("time", "is_sender", "talker_code", "room_code", "talkers", "rooms")}
+            except Exception:
+                pass
+
+        columns = concat_msg_columns([query_msg_columns(session) for session in self.sessions])
+        if self.cache_file:
+            tmp_file = self.cache_file + ".tmp.npz"
+            np.savez(tmp_file, cache_version=MSG_COLUMNS_VERSION, fingerprint=self.version, **columns)
+            os.replace(tmp_file, self.cache_file)
+        return columns
+
+    def mask(self, direction=None):
+        """
+        direction 为 'send' / 'receive' 时只统计发送 / 接收的消息，None 为全部。
+        """
+        if direction is None:
+            return slice(None)
+        return self.columns["is_sender"] == (direction == "send")
+
+    def contact_code(self, by="room"):
+        if by == "room":
+            return self.columns["room_code"], self.columns["rooms"]
+        return self.columns["talker_code"], self.columns["talkers"]
+
+    def hour_weekday(self, direction=None):
+        m = self.mask(direction)
+        cells = self.weekday[m].astype(np.int64) * 24 + self.hour[m]
+        return np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+
+    def months(self, direction=None):
+        m = self.mask(direction)
+        return np.bincount(self.month_code[m], minlength=len(self.month_labels))
+
+    def contact_totals(self, by="room", direction=None):
+        code, names = self.contact_code(by)
+        return np.bincount(code[self.mask(direction)], minlength=len(names))
+
+    def contact_hour_weekday(self, by="room", direction=None, contacts=None):
+        """
+        每个会话（by='room'）或发言人（by='talker'）的星期 x 小时直方图，形状 (联系人数, 7, 24)。
+        contacts 为联系人编号数组时只统计这些联系人，第一维与 contacts 对齐。
+        """
+        code, m, count = self.contact_rows(by, direction, contacts)
+        cells = (code.astype(np.int64) * 7 + self.weekday[m]) * 24 + self.hour[m]
+        return np.bincount(cells, minlength=count * 7 * 24).reshape(count, 7, 24)
+
+    def contact_months(self, by="room", direction=None, contacts=None):
+        """
+        每个会话或发言人的按月消息数，形状 (联系人数, 月份数)，contacts 同上。
+        """
+        code, m, count = self.contact_rows(by, direction, contacts)
+        num_months = len(self.month_labels)
+        cells = code.astype(np.int64) * num_months + self.month_code[m]
+        return np.bincount(cells, minlength=count * num_months).reshape(count, num_months)
+
+    def contact_rows(self, by, direction, contacts):
+        """
+        筛选参与统计的消息，返回 (行对应的联系人位置, 行掩码, 联系人数)。
+        """
+        code, names = self.contact_code(by)
+        m = np.ones(len(code), dtype=bool) if direction is None else self.mask(direction)
+        if contacts is None:
+            return code[m], m, len(names)
+        position = np.full(len(names), -1, dtype=np.int64)
+        position[np.asarray(contacts, dtype=np.int64)] = np.arange(len(contacts))
+        m &= position[code] >= 0
+        return position[code[m]], m, len(contacts)
+
+    def summary(self, n=20, by="room", direction=None):
+        """
+        汇总为可直接 JSON 序列化的字典：全局直方图 + 消息最多的 N 个联系人的直方图。
+        """
+        code, names = self.contact_code(by)
+        totals = self.contact_totals(by, direction)
+        top = np.array([i for i in top_n(totals, n) if totals[i] > 0], dtype=np.int64)
+        per_hour_weekday = self.contact_hour_weekday(by, direction, contacts=top)
+        per_month = self.contact_months(by, direction, contacts=top)
+        contacts = [
+            {
+                "id": str(names[i]),
+                "label": self.label(str(names[i])),
+                "total": int(totals[i]),
+                "hour_weekday": per_hour_weekday[k].tolist(),
+                "months": per_month[k].tolist(),
+            }
+            for k, i in enumerate(top)
+        ]
+        return {
+            "direction": direction or "all",
+            "total": int(totals.sum()),
+            "month_labels": self.month_labels.tolist(),
+            "hour_weekday": self.hour_weekday(direction).tolist(),
+            "months": self.months(direction).tolist(),
+            "contacts": contacts,
+        }
+
+    def export_json(self, output_path="msg_analytics.json", n=20, by="room"):
+        """
+        导出全部 / 发送 / 接收三组统计到 JSON 文件，供可视化页面读取。
+        """
+        data = {direction or "all": self.summary(n=n, by=by, direction=direction)
+                for direction in (None, "send", "receive")}
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(output_path)
+        return data
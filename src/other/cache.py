@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from sqlalchemy import create_engine, event, text
+
+# 批量查询时 IN (...) 的参数个数上限（SQLite 默认最多 999 个绑定参数）
+QUERY_CHUNK = 500
+# 分词结果中词与词之间的分隔符
+TOKEN_SEP = "\x1f"
+
+
+def text_hash(value):
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SqliteLRUCache:
+    """
+    SQLite 持久化缓存的公共部分：建表、命中统计与按大小的 LRU 淘汰。
+    子类的表需包含 size（条目字节数）与 last_used（最近使用时间）两列。
+    - 总大小在打开时统计一次，之后由子类写入时通过 _added 累加增量，只在淘汰后重新统计；
+    - 超过 max_bytes 时按 last_used 从旧到新删除，淘汰到 max_bytes 的 90%。
+    多个线程可共用一个实例，写操作由锁串行化。
+    """
+
+    table = None
+    schema = ()
+
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+        event.listen(self.engine, "connect", self._on_connect)
+        with self.engine.begin() as conn:
+            for statement in self.schema:
+                conn.execute(text(statement))
+            self.total_bytes = self._count_bytes(conn)
+
+    @staticmethod
+    def _on_connect(dbapi_conn, _):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _count_bytes(self, conn):
+        return conn.execute(text(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}")).scalar()
+
+    def _added(self, conn, delta):
+        """
+        写入后调用（持有 self.lock，与写入在同一事务中）：累加大小变化，超过上限时淘汰。
+        """
+        self.total_bytes += delta
+        if self.total_bytes > self.max_bytes:
+            self._evict(conn, self.total_bytes - int(self.max_bytes * 0.9))
+
+    def _evict(self, conn, need):
+        """
+        按 last_used 从旧到新删除条目，直到释放至少 need 字节。
+        """
+        freed = 0
+        while freed < need:
+            rows = conn.execute(
+                text(f"SELECT rowid, size FROM {self.table} ORDER BY last_used LIMIT :n"), {"n": QUERY_CHUNK}
+            ).all()
+            if not rows:
+                break
+            victims = []
+            for rowid, size in rows:
+                victims.append({"rowid": rowid})
+                freed += size
+                if freed >= need:
+                    break
+            conn.execute(text(f"DELETE FROM {self.table} WHERE rowid = :rowid"), victims)
+        # 淘汰后重新统计一次，校正其他进程写入等带来的偏差
+        self.total_bytes = self._count_bytes(conn)
+
+    def _record(self, hits, misses):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "bytes": self.total_bytes,
+        }
+
+
+class TokenCache(SqliteLRUCache):
+    """
+    持久化的分词缓存：SQLite 表 token_cache，按 (消息哈希, 分词器版本) 保存过滤后的分词结果。
+    - get_many / put_many 批量读写，一次查询处理一批消息；
+    - 总大小超过 max_bytes 时按最近使用时间淘汰（LRU），见 SqliteLRUCache；
+    - 分词器版本变化（jieba 版本、停用词等）后旧条目不再命中，随 LRU 自然淘汰。
+    """
+
+    table = "token_cache"
+    schema = (
+        "CREATE TABLE IF NOT EXISTS token_cache ("
+        " msg_hash TEXT NOT NULL,"
+        " version TEXT NOT NULL,"
+        " tokens TEXT NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " last_used REAL NOT NULL,"
+        " PRIMARY KEY (msg_hash, version))",
+        "CREATE INDEX IF NOT EXISTS ix_token_cache_last_used ON token_cache (last_used)",
+    )
+
+    def __init__(self, path=os.path.join("data", "token_cache.db"), max_bytes=256 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    def get_many(self, texts, version):
+        """
+        批量查询 version 版本分词器的结果，返回 {消息: 词列表}，只包含命中的消息；命中条目的最近使用时间一并更新。
+        """
+        texts = list(texts)
+        keys = {text_hash(t): t for t in texts}
+        found = {}
+        now = time.time()
+        hashes = list(keys)
+        with self.engine.begin() as conn:
+            for i in range(0, len(hashes), QUERY_CHUNK):
+                chunk = hashes[i:i + QUERY_CHUNK]
+                params = {f"h{k}": h for k, h in enumerate(chunk)}
+                placeholders = ", ".join(f":h{k}" for k in range(len(chunk)))
+                rows = conn.execute(
+                    text(f"SELECT msg_hash, tokens FROM token_cache WHERE version = :version AND msg_hash IN ({placeholders})"),
+                    {"version": version, **params},
+                ).all()
+                for msg_hash, tokens in rows:
+                    found[keys[msg_hash]] = tokens.split(TOKEN_SEP) if tokens else []
+                if rows:
+                    conn.execute(
+                        text("UPDATE token_cache SET last_used = :now WHERE version = :version AND msg_hash = :h"),
+                        [{"now": now, "version": version, "h": msg_hash} for msg_hash, _ in rows],
+                    )
+        self._record(len(found), len(keys) - len(found))
+        return found
+
+    def put_many(self, tokens_by_text, version):
+        """
+        批量写入 version 版本分词器的结果 {消息: 词列表}，写入后按需淘汰。
+        """
+        if not tokens_by_text:
+            return
+        now = time.time()
+        rows = {}
+        for value, tokens in tokens_by_text.items():
+            joined = TOKEN_SEP.join(tokens)
+            rows[text_hash(value)] = {
+                "h": text_hash(value),
+                "version": version,
+                "tokens": joined,
+                "size": len(joined.encode("utf-8")) + 64,  # 64 字节近似主键与索引开销
+                "now": now,
+            }
+        with self.lock, self.engine.begin() as conn:
+            # 已存在的条目只更新最近使用时间，新条目的大小累加到 total_bytes（按主键查询，不扫描全表）
+            hashes = list(rows)
+            existing = set()
+            for i in range(0, len(hashes), QUERY_CHUNK):
+                chunk = hashes[i:i + QUERY_CHUNK]
+                params = {f"h{k}": h for k, h in enumerate(chunk)}
+                placeholders = ", ".join(f":h{k}" for k in range(len(chunk)))
+                existing.update(conn.execute(
+                    text(f"SELECT msg_hash FROM token_cache WHERE version = :version AND msg_hash IN ({placeholders})"),
+                    {"version": version, **params},
+                ).scalars())
+            new_rows = [row for h, row in rows.items() if h not in existing]
+            if existing:
+                conn.execute(
+                    text("UPDATE token_cache SET last_used = :now WHERE version = :version AND msg_hash = :h"),
+                    [rows[h] for h in existing],
+                )
+            if new_rows:
+                conn.execute(
+                    text(
+                        "INSERT INTO token_cache (msg_hash, version, tokens, size, last_used)"
+                        " VALUES (:h, :version, :tokens, :size, :now)"
+                        " ON CONFLICT (msg_hash, version) DO NOTHING"
+                    ),
+                    new_rows,
+                )
+            self._added(conn, sum(row["size"] for row in new_rows))
+
+
+class ResponseCache(SqliteLRUCache):
+    """
+    持久化的 LLM 响应缓存：SQLite 表 llm_cache，按 (模型, prompt 哈希) 保存原始响应文本与通过验证的知识图谱 JSON。
+    只缓存验证通过的结果，prompt 不变（崩溃后重跑、同一数据重新运行）时不再调用 API。
+    - bypass=True 时读取总是未命中（强制重新请求），新结果仍写入并覆盖旧条目；
+    - 总大小超过 max_bytes 时按最近使用时间淘汰（LRU），见 SqliteLRUCache。
+    """
+
+    table = "llm_cache"
+    schema = (
+        "CREATE TABLE IF NOT EXISTS llm_cache ("
+        " model TEXT NOT NULL,"
+        " prompt_hash TEXT NOT NULL,"
+        " response TEXT NOT NULL,"
+        " result_json TEXT NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " created REAL NOT NULL,"
+        " last_used REAL NOT NULL,"
+        " PRIMARY KEY (model, prompt_hash))",
+        "CREATE INDEX IF NOT EXISTS ix_llm_cache_last_used ON llm_cache (last_used)",
+    )
+
+    def __init__(self, path=os.path.join("data", "llm_cache.db"), max_bytes=512 * 1024 * 1024, bypass=False):
+        super().__init__(path, max_bytes)
+        self.bypass = bypass
+
+    def get(self, prompt, model):
+        """
+        返回缓存的知识图谱 JSON（dict），未命中或 bypass 时返回 None。
+        """
+        row = None
+        if not self.bypass:
+            key = {"model": model, "h": text_hash(prompt)}
+            with self.engine.begin() as conn:
+                row = conn.execute(
+                    text("SELECT result_json FROM llm_cache WHERE model = :model AND prompt_hash = :h"), key
+                ).first()
+                if row:
+                    conn.execute(
+                        text("UPDATE llm_cache SET last_used = :now WHERE model = :model AND prompt_hash = :h"),
+                        {"now": time.time(), **key},
+                    )
+        self._record(1 if row else 0, 0 if row else 1)
+        return json.loads(row[0]) if row else None
+
+    def put(self, prompt, model, response, result_json):
+        """
+        写入一条通过验证的结果：response 为原始响应文本，result_json 为解析并验证后的 dict。
+        """
+        result = json.dumps(result_json, ensure_ascii=False)
+        response = response or ""
+        now = time.time()
+        key = {"model": model, "h": text_hash(prompt)}
+        size = len(response.encode("utf-8")) + len(result.encode("utf-8")) + 96
+        with self.lock, self.engine.begin() as conn:
+            # 覆盖已有条目时只累加大小差值（按主键查询，不扫描全表）
+            old_size = conn.execute(
+                text("SELECT size FROM llm_cache WHERE model = :model AND prompt_hash = :h"), key
+            ).scalar() or 0
+            conn.execute(
+                text(
+                    "INSERT INTO llm_cache (model, prompt_hash, response, result_json, size, created, last_used)"
+                    " VALUES (:model, :h, :response, :result, :size, :now, :now)"
+                    " ON CONFLICT (model, prompt_hash) DO UPDATE SET"
+                    " response = excluded.response, result_json = excluded.result_json,"
+                    " size = excluded.size, created = excluded.created, last_used = excluded.last_used"
+                ),
+                {**key, "response": response, "result": result, "size": size, "now": now},
+            )
+            self._added(conn, size - old_size)
+
+    def stats(self):
+        return {**super().stats(), "bypass": self.bypass}
@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text
+import hashlib
+from contextlib import contextmanager
+from sqlalchemy import bindparam, create_engine, inspect, select, text, Column, Integer, String, Boolean, DateTime, Text, Float, Index
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 # 定义 ORM 基类
@@ -15,6 +18,15 @@ class WxMsg(Base):
     src = Column(String)
     extra = Column(Text)
     CreateTime = Column(DateTime)
+    fingerprint = Column(String)  # 消息指纹，见 msg_fingerprint()，用于增量导入去重
+    is_chatroom = Column(Boolean, default=False)  # room_name 是否为群聊（后缀 @chatroom），导入时写入
+
+    __table_args__ = (
+        Index('ux_wx_msg_fingerprint', 'fingerprint', unique=True),
+        Index('ix_wx_msg_talker_room', 'talker', 'room_name'),
+        Index('ix_wx_msg_room_time', 'room_name', 'CreateTime'),
+        Index('ix_wx_msg_chatroom_talker_room', 'is_chatroom', 'talker', 'room_name'),
+    )
 
 class WxUser(Base):
     __tablename__ = 'wx_user'
@@ -38,14 +50,225 @@ class WxUserChatroom(Base):
     wxid = Column(String, nullable=False)         # 用户wxid
     room_name = Column(String, nullable=False)    # 聊天房id
 
+class SourceFile(Base):
+    """
+    导入清单：记录每个已导入的聊天记录文件，文件未变化时增量导入直接跳过。
+    """
+    __tablename__ = 'source_file'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    path = Column(String, unique=True, nullable=False)
+    size = Column(Integer)
+    mtime = Column(Float)
+    hash = Column(String)
+    msg_count = Column(Integer)
+    ingested_at = Column(DateTime)
+
+
+class PairDailyStat(Base):
+    """
+    按 (talker, room_name, 日期, is_sender) 预聚合的消息数，导入时增量维护。
+    图的边权重与活跃度统计直接读取该表，不再扫描 wx_msg。
+    """
+    __tablename__ = 'pair_daily_stats'
+    talker = Column(String, primary_key=True)
+    room_name = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)  # YYYY-MM-DD，CreateTime 为空时为 ''
+    is_sender = Column(Boolean, primary_key=True)
+    is_chatroom = Column(Boolean)
+    msg_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_pair_daily_stats_chatroom_pair', 'is_chatroom', 'talker', 'room_name'),
+        Index('ix_pair_daily_stats_day', 'day'),
+    )
+
+
+# 数据库结构版本，记录在 SQLite 的 PRAGMA user_version 中，旧库由 migrate_database 逐步升级
+SCHEMA_VERSION = 3
+
+
+def is_chatroom_name(room_name):
+    """
+    判断 room_name 是否为群聊。
+    """
+    return bool(room_name) and room_name.endswith("@chatroom")
+
+
+def msg_fingerprint(talker, room_name, is_sender, type_name, create_time, msg):
+    """
+    计算消息指纹：(talker, room_name, is_sender, type_name, CreateTime, msg 的哈希)。
+    create_time 为 datetime 或 None，msg 为写入数据库的字符串形式。
+    """
+    create_time = create_time.strftime("%Y-%m-%d %H:%M:%S") if create_time else ""
+    msg_hash = hashlib.blake2b((msg or "").encode("utf-8"), digest_size=16).hexdigest()
+    key = "\x1f".join([talker or "", room_name or "", str(int(bool(is_sender))), type_name or "", create_time, msg_hash])
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _add_msg_fingerprints(conn, batch_size=5000):
+    """
+    迁移到版本 1：为旧库补充 fingerprint 列并回填，删除重复消息（保留最早的一条），再建唯一索引。
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("wx_msg")}
+    if "fingerprint" not in columns:
+        conn.exec_driver_sql("ALTER TABLE wx_msg ADD COLUMN fingerprint VARCHAR")
+
+    table = WxMsg.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.talker, table.c.room_name, table.c.is_sender,
+                   table.c.type_name, table.c.CreateTime, table.c.msg)
+            .where(table.c.id > last_id, table.c.fingerprint.is_(None))
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            table.update().where(table.c.id == bindparam("_id")).values(fingerprint=bindparam("_fp")),
+            [dict(_id=r.id, _fp=msg_fingerprint(*r[1:])) for r in rows],
+        )
+        last_id = rows[-1].id
+
+    conn.exec_driver_sql(
+        "DELETE FROM wx_msg WHERE id NOT IN (SELECT MIN(id) FROM wx_msg GROUP BY fingerprint)"
+    )
+    for index in table.indexes:
+        if index.name == 'ux_wx_msg_fingerprint':
+            index.create(conn, checkfirst=True)
+
+
+def _add_chatroom_flag_and_indexes(conn):
+    """
+    迁移到版本 2：补充 is_chatroom 列并回填，创建 wx_msg 上的查询索引。
+    """
+    columns = {c["name"] for c in inspect(conn).get_columns("wx_msg")}
+    if "is_chatroom" not in columns:
+        conn.exec_driver_sql("ALTER TABLE wx_msg ADD COLUMN is_chatroom BOOLEAN")
+    conn.exec_driver_sql("UPDATE wx_msg SET is_chatroom = (room_name LIKE '%@chatroom')")
+    for index in WxMsg.__table__.indexes:
+        index.create(conn, checkfirst=True)
+    conn.exec_driver_sql("ANALYZE wx_msg")
+
+
+def aggregate_pair_daily_stats(conn, after_id=0):
+    """
+    将 id > after_id 的消息累加进 pair_daily_stats。导入时每批写入后调用，after_id 为写入前的最大 id。
+    """
+    conn.exec_driver_sql(
+        """
+        INSERT INTO pair_daily_stats (talker, room_name, day, is_sender, is_chatroom, msg_count)
+        SELECT COALESCE(talker, ''), COALESCE(room_name, ''), COALESCE(date(CreateTime), ''),
+               COALESCE(is_sender, 0), MAX(COALESCE(is_chatroom, 0)), COUNT(*)
+        FROM wx_msg
+        WHERE id > ?
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (talker, room_name, day, is_sender)
+        DO UPDATE SET msg_count = msg_count + excluded.msg_count
+        """,
+        (after_id,),
+    )
+
+
+def max_msg_id(conn):
+    """
+    wx_msg 当前的最大 id（空表为 0）。
+    """
+    return conn.exec_driver_sql("SELECT COALESCE(MAX(id), 0) FROM wx_msg").scalar()
+
+
+def rebuild_pair_daily_stats(bind):
+    """
+    清空并根据 wx_msg 全量重建 pair_daily_stats（用于已有数据库或统计表损坏时）。
+    bind 可以是 Engine 或 Connection。
+    """
+    if isinstance(bind, Engine):
+        with bind.begin() as conn:
+            return rebuild_pair_daily_stats(conn)
+    PairDailyStat.__table__.create(bind, checkfirst=True)
+    bind.exec_driver_sql("DELETE FROM pair_daily_stats")
+    aggregate_pair_daily_stats(bind)
+
+
+# 每个版本对应的迁移函数，版本号从 1 开始
+MIGRATIONS = {
+    1: _add_msg_fingerprints,
+    2: _add_chatroom_flag_and_indexes,
+    3: rebuild_pair_daily_stats,
+}
+
+
+def migrate_database(engine):
+    """
+    将旧版本的数据库升级到 SCHEMA_VERSION。新建的数据库直接标记为最新版本。
+    """
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            print(f"数据库迁移：版本 {target - 1} -> {target}")
+            MIGRATIONS[target](conn)
+        conn.exec_driver_sql(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+
+# 导入数据时使用的 SQLite 参数：WAL 日志、关闭同步刷盘、更大的页缓存（负数单位为 KiB）
+INGEST_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "OFF",
+    "cache_size": -256000,
+    "temp_store": "MEMORY",
+}
+
+
+def database_fingerprint(bind):
+    """
+    数据库内容指纹：结构版本 + 各表行数与最大 id。bind 可以是 Session 或 Connection。
+    数据有任何导入、删除都会改变指纹，用于判断基于数据库生成的缓存是否过期。
+    """
+    parts = [f"schema={SCHEMA_VERSION}"]
+    for table in ("wx_msg", "wx_user", "pair_daily_stats"):
+        key = "rowid" if table == "pair_daily_stats" else "id"
+        count, max_id = bind.execute(text(f"SELECT COUNT(*), COALESCE(MAX({key}), 0) FROM {table}")).one()
+        parts.append(f"{table}={count}:{max_id}")
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def apply_sqlite_pragmas(conn, pragmas=INGEST_PRAGMAS):
+    """
+    在给定连接上设置 SQLite PRAGMA（只对当前连接生效）。
+    """
+    for key, value in pragmas.items():
+        conn.exec_driver_sql(f"PRAGMA {key}={value}")
+    conn.commit()
+
+
+@contextmanager
+def ingest_connection(engine, pragmas=INGEST_PRAGMAS):
+    """
+    导入专用连接：设置 pragmas 后交给调用方，用完后丢弃（invalidate），不归还连接池。
+    synchronous=OFF 等设置只对该连接生效，之后从连接池取得的连接仍使用默认设置，不影响正常写入的持久性。
+    """
+    with engine.connect() as conn:
+        try:
+            apply_sqlite_pragmas(conn, pragmas)
+            yield conn
+        finally:
+            conn.invalidate()
+
 
 # 初始化数据库函数
 def init_database(db_path='sqlite:///wxdata.db'):
     # 创建数据库引擎
     engine = create_engine(db_path, echo=False)
 
+    # 已有数据库先升级结构，再创建缺失的表（新建的数据库无需迁移）
+    if inspect(engine).has_table(WxMsg.__tablename__):
+        migrate_database(engine)
+
     # 创建所有表（如果不存在）
     Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version={SCHEMA_VERSION}")
 
     # 创建会话工厂
     Session = sessionmaker(bind=engine)
@@ -0,0 +1,62 @@
+import threading
+from loguru import logger
+from other.neo4j_batch import ADDRESS_KEYS, quote
+
+
+class Gazetteer:
+    """
+    进程级的地址节点缓存：记录 Neo4j 中已经存在的 Country / Province / City 节点（按合并键取值）。
+    地址节点及其 LOCATED_IN_* 归属关系只在某个地点第一次出现时写入，之后的联系人只写 User -> 地址 的关系。
+    - warm：启动时从 Neo4j 读入已有的地址节点（合并键上的唯一约束由 neo4j_batch.warm_schema 创建）；
+    - unknown：过滤出尚未写入的地点；
+    - add：事务提交成功后登记新写入的地点（提交失败的不登记，下次仍会写入）。
+    多个线程共用一个实例，读写由锁保护；两个线程同时写入同一新地点时 MERGE 与唯一约束保证只有一个节点。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.known = set()  # {(标签, 合并键取值元组)}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def place_key(label, props):
+        return label, tuple(props.get(k) for k in ADDRESS_KEYS[label])
+
+    def warm(self, graph):
+        """
+        读入已有地址节点。返回读入的节点数。
+        """
+        loaded = set()
+        for label, keys in ADDRESS_KEYS.items():
+            columns = ", ".join(f"n.{quote(k)}" for k in keys)
+            for record in graph.run(f"MATCH (n:{quote(label)}) RETURN {columns}"):
+                loaded.add((label, tuple(record)))
+        with self.lock:
+            self.known |= loaded
+        logger.info(f"地址缓存预热完成：{len(loaded)} 个地址节点")
+        return len(loaded)
+
+    def unknown(self, place_keys):
+        """
+        返回 place_keys 中尚未写入 Neo4j 的地点（保持原顺序）。
+        """
+        place_keys = list(place_keys)
+        with self.lock:
+            result = [key for key in place_keys if key not in self.known]
+            self.misses += len(result)
+            self.hits += len(place_keys) - len(result)
+        return result
+
+    def add(self, place_keys):
+        with self.lock:
+            self.known.update(place_keys)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "places": len(self.known),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
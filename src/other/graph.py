@@ -1,26 +1,45 @@
 from pyvis.network import Network
-from other.database import WxUser, WxMsg
+from sqlalchemy import func, true, false
+from other.database import WxUser, PairDailyStat, database_fingerprint
+from other.graph_core import GraphCore, merge_cores, top_n
+from other.layout import compute_layout, load_positions, save_positions
+from other.temporal import TemporalGraph
+from other.analytics import MsgAnalytics
+import numpy as np
 import os
+import copy
+import hashlib
 from datetime import datetime
 import pickle
-from copy import deepcopy
-import json
+
+# 图缓存格式版本，缓存内容结构变化时递增，使旧缓存失效
+GRAPH_CACHE_VERSION = 2
+
 
 class DataGraph:
-    def __init__(self, Session, master):
+    def __init__(self, Session, master, cache_dir="data"):
         """
         初始化图，添加用户节点和交流边。
+        图数据保存在紧凑的 GraphCore（整数 id + 数组）中，pyvis 网络只在访问 self.net 时生成。
+        图数据按 master 缓存在 cache_dir 下，缓存中记录数据库指纹，数据库变化后自动重建。
         """
-        self.net = Network()
+        self.core = GraphCore()
+        self._net = None
+        self._analytics_cache = {}
         self.master = master
+        self.masters = [master]
+        # 合并图（见 merge）的来源图与逐来源的边权重，单个账号时来源就是自己
+        self.sources = [self]
+        self.source_weight = None
         self.session = Session()
-        
-        # 检查是否已有存储的网络文件（改为只存储节点和边的数据）
-        os.makedirs("data", exist_ok=True)
-        nodes_filename = f"data/net_{self.master}_nodes.json"
-        edges_filename = f"data/net_{self.master}_edges.json"
-        if os.path.exists(nodes_filename) and os.path.exists(edges_filename):
-            self.net = self.load_net_data(nodes_filename, edges_filename)
+        self.cache_dir = cache_dir
+        self.version = database_fingerprint(self.session)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache_filename = self.cache_filename()
+        core = self.load_net_data(cache_filename)
+        if core is not None:
+            self.core = core
         else:
             # 添加用户节点与群聊节点
             self.add_node_to_net()
@@ -28,220 +47,550 @@ class DataGraph:
             # 添加交流边
             self.add_edges_to_net()
 
-    def save_net_data(self, net, nodes_filename, edges_filename):
-        # 保存节点
-        with open(nodes_filename, "w") as f:
-            json.dump([
-                dict(n_id=node_id, **net.get_node(node_id)) for node_id in net.node_ids
-            ], f)
-        # 保存边
-        with open(edges_filename, "w") as f:
-            json.dump(list(net.edges), f)
-
-    def load_net_data(self, nodes_filename, edges_filename):
-        net = Network()
-        # 读取节点
-        with open(nodes_filename, "r") as f:
-            nodes = json.load(f)
-        for node in nodes:
-            n_id = node.pop('n_id')
-            net.add_node(n_id, **node)
-        # 读取边
-        with open(edges_filename, "r") as f:
-            edges = json.load(f)
-        for edge in edges:
-            edge_args = edge.copy()
-            if 'from' in edge_args:
-                from_ = edge_args.pop('from')
-            elif 'from_' in edge_args:
-                from_ = edge_args.pop('from_')
-            else:
-                raise ValueError("Edge missing 'from' field")
-            to = edge_args.pop('to')
-            net.add_edge(from_, to, **edge_args)
-        return net
+            self.save_net_data(self.core, cache_filename)
+
+    @classmethod
+    def merge(cls, graphs):
+        """
+        把多个账号（每个 master 一个 DataGraph）合并为一个图，同一个人或群聊跨账号去重，
+        边权重为各账号之和，逐账号的权重保存在 source_weight（列顺序与 masters 一致）。
+        合并结果不写缓存：输入图各自有缓存，合并本身与边数成线性。graphs 为空时抛出 ValueError。
+        """
+        graphs = list(graphs)
+        if not graphs:
+            raise ValueError("DataGraph.merge 至少需要一个图")
+        graph = cls.__new__(cls)
+        graph.core, graph.source_weight = merge_cores([g.core for g in graphs])
+        graph._net = None
+        graph._analytics_cache = {}
+        graph.sources = list(graphs)
+        graph.masters = [m for g in graphs for m in g.masters]
+        graph.master = "+".join(graph.masters)
+        graph.session = graphs[0].session
+        graph.cache_dir = graphs[0].cache_dir
+        graph.version = hashlib.blake2b(
+            "|".join(g.version for g in graphs).encode("utf-8"), digest_size=16
+        ).hexdigest()
+        return graph
+
+    def with_core(self, core):
+        """
+        共用数据库与配置、但图数据换成 core 的 DataGraph（如某个时间窗口内的图），不写缓存。
+        """
+        graph = copy.copy(self)
+        graph.core = core
+        graph._net = None
+        graph._analytics_cache = {}
+        graph.source_weight = None
+        return graph
+
+    def temporal(self, interval="month"):
+        """
+        按时间段（day / week / month / year）切片的图，见 TemporalGraph；按图版本缓存。
+        """
+        key = ("temporal", self.version, interval)
+        if key not in self._analytics_cache:
+            self._analytics_cache[key] = TemporalGraph(self, interval=interval)
+        return self._analytics_cache[key]
+
+    def analytics(self):
+        """
+        按时间（星期 x 小时、月份）与联系人统计消息，见 MsgAnalytics；列式数据缓存在 cache_dir 下。
+        """
+        key = ("analytics", self.version)
+        if key not in self._analytics_cache:
+            databases = {str(source.session.get_bind().url): source.session for source in self.sources}
+            self._analytics_cache[key] = MsgAnalytics(
+                list(databases.values()),
+                cache_file=os.path.join(self.cache_dir, f"msg_columns_{self.master}.npz"),
+                label=self.node_label,
+            )
+        return self._analytics_cache[key]
+
+    def edge_weight_by_source(self, a, b):
+        """
+        节点 a、b 之间的边在各账号中的权重 {master: weight}；没有这条边时返回空字典。
+        """
+        core = self.core
+        if a not in core.index or b not in core.index:
+            return {}
+        keys = core.edge_keys(core.src, core.dst)
+        target = core.edge_keys(np.array([core.index[a]]), np.array([core.index[b]]))[0]
+        hits = np.flatnonzero(keys == target)
+        if len(hits) == 0:
+            return {}
+        if self.source_weight is None:
+            return {self.master: int(core.weight[hits[0]])}
+        return {master: int(w) for master, w in zip(self.masters, self.source_weight[hits[0]])}
+
+    def edge_msg_counts(self):
+        """
+        每条边对应的实际消息数（与 core 的边对齐）：私聊边为双方消息数之和，
+        而 core.weight 中私聊边只保留最先加入的那个方向的权重；群聊边与 core.weight 相同。
+        一次 GROUP BY 查询 pair_daily_stats，合并图按来源账号逐个读取。按图版本缓存。
+        """
+        key = ("edge_msg_counts", self.version)
+        if key not in self._analytics_cache:
+            counts = np.zeros(self.core.num_edges, dtype=np.int64)
+            for source in self.sources:
+                rows = (
+                    source.session.query(
+                        PairDailyStat.talker,
+                        PairDailyStat.room_name,
+                        PairDailyStat.is_chatroom,
+                        func.sum(PairDailyStat.msg_count),
+                    )
+                    .group_by(PairDailyStat.talker, PairDailyStat.room_name, PairDailyStat.is_chatroom)
+                    .all()
+                )
+                # 私聊边为 master - 联系人（两个方向的消息都落在同一条边上），群聊边为 发言人 - 群聊
+                edge = self.core.find_edges(
+                    [room_name if is_chatroom else source.master for _, room_name, is_chatroom, _ in rows],
+                    [talker if is_chatroom else room_name for talker, room_name, is_chatroom, _ in rows],
+                )
+                found = edge >= 0
+                np.add.at(counts, edge[found], np.array([count for *_, count in rows], dtype=np.int64)[found])
+            self._analytics_cache[key] = counts
+        return self._analytics_cache[key]
+
+    @property
+    def net(self):
+        """
+        按需由 GraphCore 生成的 pyvis 网络（生成后缓存，图数据变化时失效）。
+        """
+        if self._net is None:
+            self._net = self.core.to_pyvis()
+        return self._net
+
+    def cache_filename(self):
+        return os.path.join(self.cache_dir, f"net_{self.master}.pkl")
+
+    def save_net_data(self, core, filename):
+        """
+        以 pickle 二进制格式保存 GraphCore 的数组数据，附带数据库指纹与缓存版本。
+        先写临时文件再替换，避免中断时留下损坏的缓存。
+        """
+        data = {
+            "cache_version": GRAPH_CACHE_VERSION,
+            "fingerprint": self.version,
+            "master": self.master,
+            "core": core.to_state(),
+        }
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_filename, filename)
+
+    def load_net_data(self, filename):
+        """
+        读取缓存，一次性还原 GraphCore 的数组（不逐个添加节点和边）。
+        缓存不存在、格式版本不符或数据库指纹已变化时返回 None。
+        """
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, "rb") as f:
+                data = pickle.load(f)
+        except Exception:
+            return None
+        if (
+            data.get("cache_version") != GRAPH_CACHE_VERSION
+            or data.get("fingerprint") != self.version
+            or data.get("master") != self.master
+        ):
+            return None
+        return GraphCore.from_state(data["core"])
 
     def add_node_to_net(self):
         def add_users_to_net():
             """
-            从数据库读取用户数据，并添加到 pyvis 网络中，所有字段作为参数。
+            从数据库读取用户数据，按列批量加入图中，所有字段作为节点属性。
             """
             users = self.session.query(WxUser).filter(~WxUser.wxid.like('%@chatroom')).all()
-            for user in users:
-                label = f"{user.nickname or ''} ({user.wxid})"
-                self.net.add_node(
-                    user.wxid,
-                    label=label,
-                    group='user',
-                    nickname=user.nickname,
-                    remark=user.remark,
-                    account=user.account,
-                    gender=user.gender,
-                    signature=user.signature,
-                    country=user.country,
-                    province=getattr(user, 'province', ''),
-                    city=getattr(user, 'city', ''),
-                    mobile=getattr(user, 'mobile', '')
-                )
+            self.core.add_nodes(
+                [user.wxid for user in users],
+                group='user',
+                label=[f"{user.nickname or ''} ({user.wxid})" for user in users],
+                nickname=[user.nickname for user in users],
+                remark=[user.remark for user in users],
+                account=[user.account for user in users],
+                gender=[user.gender for user in users],
+                signature=[user.signature for user in users],
+                country=[user.country for user in users],
+                province=[getattr(user, 'province', '') for user in users],
+                city=[getattr(user, 'city', '') for user in users],
+                mobile=[getattr(user, 'mobile', '') for user in users],
+            )
 
         def add_chatroom_to_net():
             """
-            从数据库读取群聊数据，并添加到 pyvis 网络中，所有字段作为参数。
+            从数据库读取群聊数据，按列批量加入图中。
             """
-            # 读取wx_msg表
-            # 找到其中room_name字段中后缀为“@chatroom”的所有非重复字段，每一个非重复字段都是一个群聊
+            # 读取每日统计表pair_daily_stats（与wx_msg同步维护，行数少得多）
+            # 找到其中群聊（is_chatroom，即room_name后缀为“@chatroom”）的所有非重复room_name，每一个都是一个群聊
             chatrooms = (
-                self.session.query(WxMsg.room_name)
-                .filter(WxMsg.room_name.like('%@chatroom'))
+                self.session.query(PairDailyStat.room_name)
+                .filter(PairDailyStat.is_chatroom == true())
                 .distinct()
                 .all()
             )
             # 添加群聊节点
             # 每个群聊节点的label为room_name，group为chatroom
-            for (room_name,) in chatrooms:
-                self.net.add_node(
-                    room_name,
-                    label=room_name,
-                    group='chatroom'
-                )
-                
+            room_names = [room_name for (room_name,) in chatrooms]
+            self.core.add_nodes(room_names, group='chatroom', label=room_names)
+
         # 添加用户节点
         add_users_to_net()
         # 添加群聊节点
         add_chatroom_to_net()
-
+        self._net = None
 
     def add_edges_to_net(self):
         """
-        从数据库读取消息数据，并添加到 pyvis 网络中，所有字段作为参数。
-        有两种消息数据，一种是私聊，一种是群聊
+        从数据库读取消息数据，按列批量加入图中，权重等于消息数。
+        有两种消息数据，一种是私聊，一种是群聊。
+        每种边只需一次对 pair_daily_stats 的 GROUP BY (talker, room_name) + SUM 查询；
+        端点不存在的边被跳过，无向图中同一对节点只保留第一条边（见 GraphCore.add_edges）。
         """
-        # 读取wx_msg表
-        def create_private_edges():
+        def query_pair_counts(is_chatroom):
             """
-            创建私聊边
+            一次查询得到所有 (talker, room_name) 及其消息数，从每日统计表汇总，不扫描消息表。
             """
-            # 浏览一遍，对所有私聊关系建立权重，权重等于私聊次数
-            private_edges = (
-                self.session.query(WxMsg.talker, WxMsg.room_name)
-                .filter(~WxMsg.room_name.like('%@chatroom'))
-                .group_by(WxMsg.talker, WxMsg.room_name)
+            return (
+                self.session.query(PairDailyStat.talker, PairDailyStat.room_name, func.sum(PairDailyStat.msg_count))
+                .filter(PairDailyStat.is_chatroom == (true() if is_chatroom else false()))
+                .group_by(PairDailyStat.talker, PairDailyStat.room_name)
                 .all()
             )
-            # 检查room_name对应对应的用户wxid是否存在self.net中
-            private_edges = [
-                (talker, room_name) for talker, room_name in private_edges
-                if talker in self.net.node_ids and room_name in self.net.node_ids
-            ]
+
+        # 读取pair_daily_stats表
+        def create_private_edges():
+            """
+            创建私聊边，权重等于私聊次数
+            """
+            if self.master not in self.core.index:
+                return
             # 对每一个私聊关系建立边
             # 如果talker是主节点，则边的方向为主节点->用户，否则为用户->主节点
-            for talker, room_name in private_edges:
-                weight = (
-                    self.session.query(WxMsg)
-                    .filter(WxMsg.talker == talker, WxMsg.room_name == room_name)
-                    .count()
-                )
-                if talker == self.master:
-                    self.net.add_edge(
-                        self.master,
-                        room_name,
-                        weight=weight,
-                        group='private_msg'
-                    )
-                else:
-                    self.net.add_edge(
-                        room_name,
-                        self.master,
-                        weight=weight,
-                        group='private_msg'
-                    )
+            rows = [
+                (talker, room_name, weight)
+                for talker, room_name, weight in query_pair_counts(is_chatroom=False)
+                if talker in self.core.index
+            ]
+            self.core.add_edges(
+                [self.master if talker == self.master else room_name for talker, room_name, _ in rows],
+                [room_name if talker == self.master else self.master for talker, room_name, _ in rows],
+                [weight for _, _, weight in rows],
+                group='private_msg',
+            )
 
         def create_chatroom_edges():
             """
-            创建群聊边
+            创建群聊边，权重等于在群聊中的发言次数
             """
-            # 浏览一遍，对所有私聊关系建立权重，权重等于私聊次数
-            chatroom_edges = (
-                self.session.query(WxMsg.talker, WxMsg.room_name)
-                .filter(WxMsg.room_name.like('%@chatroom'))
-                .group_by(WxMsg.talker, WxMsg.room_name)
-                .all()
+            rows = query_pair_counts(is_chatroom=True)
+            self.core.add_edges(
+                [talker for talker, _, _ in rows],
+                [room_name for _, room_name, _ in rows],
+                [weight for _, _, weight in rows],
+                group='chatroom_msg',
             )
-            # 检查room_name对应对应的用户wxid是否存在self.net中
-            chatroom_edges = [
-                (talker, room_name) for talker, room_name in chatroom_edges
-                if talker in self.net.node_ids and room_name in self.net.node_ids
-            ]
-            # 对每一个群聊关系建立边
-            # 如果talker是主节点，则边的方向为主节点->用户，否则为用户->主节点
-            for talker, room_name in chatroom_edges:
-                weight = (
-                    self.session.query(WxMsg)
-                    .filter(WxMsg.talker == talker, WxMsg.room_name == room_name)
-                    .count()
-                )
-                self.net.add_edge(
-                    talker,
-                    room_name,
-                    weight=weight,
-                    group='chatroom_msg'
-                )
-        
+
         create_private_edges()
         create_chatroom_edges()
-    
-    def get_send_msg_info(self):
+        self._net = None
+
+    def load_msg_stats(self):
+        """
+        从 pair_daily_stats 一次性读取按 (room_name, day, is_sender) 汇总的消息数，转换为列数组：
+        rooms / days 为去重后的取值，room_code / day_code 为每行对应的下标。
+        结果按图版本（数据库指纹）缓存。
+        """
+        key = ("msg_stats", self.version)
+        if key not in self._analytics_cache:
+            # 合并图把各来源账号的统计行拼接在一起（共用同一个数据库的来源只读一次）
+            databases = {str(source.session.get_bind().url): source for source in self.sources}
+            rows = [row for source in databases.values() for row in source.query_msg_stats()]
+            room_name, day, is_sender, is_chatroom, msg_count = (
+                list(column) for column in (zip(*rows) if rows else ([],) * 5)
+            )
+            rooms, room_code = np.unique(np.array(room_name, dtype=str), return_inverse=True)
+            days, day_code = np.unique(np.array(day, dtype=str), return_inverse=True)
+            room_is_chatroom = np.zeros(len(rooms), dtype=bool)
+            room_is_chatroom[room_code] = np.array(is_chatroom, dtype=bool)
+            self._analytics_cache[key] = {
+                "rooms": rooms,
+                "room_code": room_code,
+                "room_is_chatroom": room_is_chatroom,
+                "days": days,
+                "day_code": day_code,
+                "is_sender": np.array(is_sender, dtype=bool),
+                "msg_count": np.array(msg_count, dtype=np.int64),
+            }
+        return self._analytics_cache[key]
+
+    def query_msg_stats(self):
+        """
+        按 (room_name, day, is_sender) 汇总本账号数据库中的消息数。
+        """
+        return (
+            self.session.query(
+                PairDailyStat.room_name,
+                PairDailyStat.day,
+                PairDailyStat.is_sender,
+                func.max(PairDailyStat.is_chatroom),
+                func.sum(PairDailyStat.msg_count),
+            )
+            .group_by(PairDailyStat.room_name, PairDailyStat.day, PairDailyStat.is_sender)
+            .all()
+        )
+
+    def node_label(self, node_id):
+        """
+        节点的展示名（图中不存在时为 id 本身）。
+        """
+        i = self.core.index.get(node_id)
+        if i is None:
+            return node_id
+        label = self.core.node_attrs.get("label")
+        return label[i] if label is not None and label[i] else node_id
+
+    def get_msg_info(self, is_sender, n=10):
+        """
+        按方向统计消息：is_sender=True 为发送，False 为接收。
+        - total：消息总数
+        - top_users：私聊消息最多的 N 人
+        - top_chatrooms：群聊消息最多的 N 个群
+        - top_days / top_months：消息最多的 N 天 / N 个月
+        - weekday：周一到周日的消息数
+        全部由 load_msg_stats 的数组经 bincount + argpartition 计算，结果按图版本缓存。
+        """
+        key = ("msg_info", self.version, bool(is_sender), n)
+        if key in self._analytics_cache:
+            return self._analytics_cache[key]
+
+        stats = self.load_msg_stats()
+        mask = stats["is_sender"] == bool(is_sender)
+        counts = stats["msg_count"][mask]
+        per_room = np.bincount(stats["room_code"][mask], weights=counts, minlength=len(stats["rooms"]))
+        per_day = np.bincount(stats["day_code"][mask], weights=counts, minlength=len(stats["days"]))
+
+        def ranking(values, names, candidates=None, label=False):
+            if candidates is not None:
+                values = np.where(candidates, values, 0)
+            result = []
+            for i in top_n(values, n):
+                if values[i] <= 0:
+                    break
+                name = str(names[i])
+                item = {"id": name, "count": int(values[i])}
+                if label:
+                    item["label"] = self.node_label(name)
+                result.append(item)
+            return result
+
+        # 日期 -> 月份 / 星期（空日期不参与）
+        valid_day = stats["days"] != ""
+        day_dates = np.array(stats["days"][valid_day], dtype="datetime64[D]")
+        months, month_code = np.unique(day_dates.astype("datetime64[M]").astype(str), return_inverse=True)
+        per_month = np.bincount(month_code, weights=per_day[valid_day], minlength=len(months))
+        # 1970-01-01 是周四，换算为周一=0
+        weekday_code = (day_dates.astype(np.int64) + 3) % 7
+        per_weekday = np.bincount(weekday_code, weights=per_day[valid_day], minlength=7)
+
+        info = {
+            "total": int(counts.sum()),
+            "top_users": ranking(per_room, stats["rooms"], ~stats["room_is_chatroom"], label=True),
+            "top_chatrooms": ranking(per_room, stats["rooms"], stats["room_is_chatroom"], label=True),
+            "top_days": ranking(per_day, stats["days"], valid_day),
+            "top_months": ranking(per_month, months),
+            "weekday": per_weekday.astype(np.int64).tolist(),
+        }
+        self._analytics_cache[key] = info
+        return info
+
+    def get_send_msg_info(self, n=10):
         """
         发送消息信息
         - 总共发送信息数量
         - 发送信息最多的N人
         - 发送信息最多的N个群聊
-        - 发送信息最多的N个时间段（不在这个函数）
+        - 发送信息最多的N个时间段（天 / 月 / 星期）
         """
-        ...
+        return self.get_msg_info(is_sender=True, n=n)
 
-    def get_receive_msg_info(self):
+    def get_receive_msg_info(self, n=10):
         """
-        接收消息次数
+        接收消息信息，内容同 get_send_msg_info
         """
-        ...
+        return self.get_msg_info(is_sender=False, n=n)
 
+    def set_communities(self, labels):
+        """
+        把社区发现结果（每个节点的社区编号）写入节点属性 community，visualize(color_by='community') 按其着色。
+        """
+        self.core.set_node_column("community", np.asarray(labels).tolist())
+        self._net = None
 
+    def prune_mask(self, min_weight=10, min_degree=3):
+        """
+        计算展示用的节点与边掩码（布尔数组），不修改图数据：
+        1. 删除总权重 < min_weight 且边数 < min_degree 的节点及其相连的边；
+        2. 删除剩余的孤立点（没有任何边的节点）。
+        度与权重由数组一次性统计，整体为 O(V + E)。
+        """
+        core = self.core
+        removed = (core.weighted_degree() < min_weight) & (core.degree() < min_degree)
+        edge_mask = ~removed[core.src] & ~removed[core.dst]
+        kept = np.bincount(core.src[edge_mask], minlength=core.num_nodes) + np.bincount(
+            core.dst[edge_mask], minlength=core.num_nodes
+        )
+        node_mask = kept > 0
+        return node_mask, edge_mask
 
-    def visualize(self, output_path="graph.html", pattern='physics'):
-        # 克隆已有的self.net到一个临时的net上
-        temp_net = deepcopy(self.net)
+    def prune_net(self, min_weight=10, min_degree=3):
+        """
+        生成用于展示的过滤后的 pyvis 网络，规则见 prune_mask。
+        """
+        node_mask, edge_mask = self.prune_mask(min_weight=min_weight, min_degree=min_degree)
+        return self.core.to_pyvis(node_mask, edge_mask)
 
-        # 统计每个节点的所有相连边的权重和数量
-        nodes_to_remove = []
-        edges_to_remove = []
+    def layout_filename(self, suffix=""):
+        return os.path.join(self.cache_dir, f"layout_{self.master}{suffix}.npz")
 
-        for node_id in list(temp_net.node_ids):
-            connected_edges = [e for e in temp_net.edges if e['from'] == node_id or e['to'] == node_id]
-            total_weight = sum(e.get('weight', 1) for e in connected_edges)
-            edge_count = len(connected_edges)
-            if total_weight < 10 and edge_count < 3:
-                nodes_to_remove.append(node_id)
-                edges_to_remove.extend(connected_edges)
+    def apply_static_layout(self, net, core, node_mask=None, edge_mask=None, layout_file=None,
+                            engine="numpy", iterations=60, positions=None):
+        """
+        在 Python 中预先计算布局，把坐标写入 net 的节点并关闭物理模拟，浏览器打开后无需再模拟。
+        layout_file 中保存的历史位置作为初始位置，计算结果再合并写回，使多次运行的布局保持稳定。
+        positions 为已载入的 {节点 id: (x, y)} 时直接使用并原地更新，不读写 layout_file，
+        由调用方在多次调用后统一保存（见 visualize_lod）。
+        """
+        save = positions is None
+        if save:
+            layout_file = layout_file or self.layout_filename()
+            positions = load_positions(layout_file)
+        nodes, pos = compute_layout(core, node_mask, edge_mask, previous=positions, engine=engine, iterations=iterations)
+        computed = {core.ids[i]: (float(x), float(y)) for i, (x, y) in zip(nodes, pos)}
+        for node in net.nodes:
+            if node['id'] in computed:
+                node['x'], node['y'] = computed[node['id']]
+        net.toggle_physics(False)
+        positions.update(computed)
+        if save:
+            save_positions(layout_file, positions)
+
+    def chatroom_clusters(self):
+        """
+        按群聊对节点分簇：群聊节点自成一簇，用户归入其发言最多的群聊，
+        没有群聊发言的用户与 master 归入私聊簇。
+        返回长度为节点数的数组，值为簇对应群聊的节点下标，私聊簇为 -1。
+        """
+        core = self.core
+        cluster = np.full(core.num_nodes, -1, dtype=np.int64)
+        if 'chatroom' not in core.group_names:
+            return cluster
+        is_room = core.node_group == core.group_names.index('chatroom')
+        cluster[is_room] = np.flatnonzero(is_room)
+        if 'chatroom_msg' in core.edge_group_names:
+            e = np.flatnonzero(core.edge_group == core.edge_group_names.index('chatroom_msg'))
+            src_is_room = is_room[core.src[e]]
+            user = np.where(src_is_room, core.dst[e], core.src[e])
+            room = np.where(src_is_room, core.src[e], core.dst[e])
+            # 每个用户取发言次数最多的群聊
+            order = np.lexsort((-core.weight[e], user))
+            user, room = user[order], room[order]
+            first = np.flatnonzero(np.r_[True, user[1:] != user[:-1]]) if len(user) else np.zeros(0, dtype=np.int64)
+            cluster[user[first]] = room[first]
+        for master in self.masters:
+            if master in core.index:
+                cluster[core.index[master]] = -1
+        return cluster
 
-        # 删除节点和对应的边
-        for node_id in nodes_to_remove:
-            if node_id in temp_net.node_ids:
-                temp_net.node_ids.remove(node_id)
-                # 还需要从nodes列表中移除对应的node
-                temp_net.nodes = [node for node in temp_net.nodes if node['id'] != node_id]
-        for edge in edges_to_remove:
-            if edge in temp_net.edges:
-                temp_net.edges.remove(edge)
+    def visualize_lod(self, output_dir="graph_lod", min_weight=10, min_degree=3, engine="numpy", iterations=60):
+        """
+        分层（level-of-detail）输出：
+        - output_dir/index.html：每个群聊簇（见 chatroom_clusters）聚合为一个节点，边权重为簇间消息数之和，
+          悬停节点可打开该簇的详情页；
+        - output_dir/cluster_{k}.html：簇内的节点与边。
+        所有页面均使用预先计算的静态布局，关闭物理模拟。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        core = self.core
+        node_mask, edge_mask = self.prune_mask(min_weight=min_weight, min_degree=min_degree)
+        cluster = self.chatroom_clusters()
+        cluster_keys, node_cluster = np.unique(cluster[node_mask], return_inverse=True)
+        nodes = np.flatnonzero(node_mask)
+        edges = np.flatnonzero(edge_mask)
+        # 每个节点所在簇的序号 k（未展示的节点为 -1）
+        node_k = np.full(core.num_nodes, -1, dtype=np.int64)
+        node_k[nodes] = node_cluster
+        src_k, dst_k = node_k[core.src[edges]], node_k[core.dst[edges]]
 
-        # 删除孤立点（没有任何边的节点）
-        isolated_nodes = [
-            node_id for node_id in list(temp_net.node_ids)
-            if not any(e['from'] == node_id or e['to'] == node_id for e in temp_net.edges)
-        ]
-        for node_id in isolated_nodes:
-            temp_net.node_ids.remove(node_id)
+        def cluster_id(key):
+            return "private" if key < 0 else core.ids[key]
+
+        # 顶层：簇节点 + 簇间聚合边
+        members = np.bincount(node_cluster, minlength=len(cluster_keys))
+        top = GraphCore()
+        top_ids = [cluster_id(key) for key in cluster_keys]
+        top.add_nodes(
+            top_ids,
+            group='cluster',
+            label=[f"{'私聊' if key < 0 else core.ids[key]} ({m})" for key, m in zip(cluster_keys, members)],
+            value=members.tolist(),
+            title=[f'<a href="cluster_{k}.html">{top_ids[k]}：{m} 个节点</a>' for k, m in enumerate(members)],
+        )
+        between = src_k != dst_k
+        lo = np.minimum(src_k[between], dst_k[between])
+        hi = np.maximum(src_k[between], dst_k[between])
+        pair_keys, pair_index = np.unique(lo * len(cluster_keys) + hi, return_inverse=True)
+        pair_weight = np.bincount(pair_index, weights=core.weight[edges][between], minlength=len(pair_keys))
+        top.add_edges(
+            [top_ids[key // len(cluster_keys)] for key in pair_keys],
+            [top_ids[key % len(cluster_keys)] for key in pair_keys],
+            pair_weight.astype(np.int64),
+            group='cluster_link',
+        )
+        top_net = top.to_pyvis(net=Network(cdn_resources="remote"))
+        self.apply_static_layout(top_net, top, layout_file=self.layout_filename("_clusters"),
+                                 engine=engine, iterations=iterations)
+        top_net.write_html(os.path.join(output_dir, "index.html"))
+
+        # 详情页：按簇分组节点与簇内边，只需一次排序
+        inner = edges[src_k == dst_k]
+        inner_k = src_k[src_k == dst_k]
+        node_order = np.argsort(node_cluster, kind="stable")
+        node_bounds = np.searchsorted(node_cluster[node_order], np.arange(len(cluster_keys) + 1))
+        edge_order = np.argsort(inner_k, kind="stable")
+        edge_bounds = np.searchsorted(inner_k[edge_order], np.arange(len(cluster_keys) + 1))
+        # 详情页共用一份布局文件：循环前载入一次，各簇原地更新，循环结束后保存一次
+        lod_file = self.layout_filename("_lod")
+        lod_positions = load_positions(lod_file)
+        for k in range(len(cluster_keys)):
+            page_nodes = nodes[node_order[node_bounds[k]:node_bounds[k + 1]]]
+            page_edges = inner[edge_order[edge_bounds[k]:edge_bounds[k + 1]]]
+            net = core.to_pyvis(page_nodes, page_edges, net=Network(cdn_resources="remote"))
+            self.apply_static_layout(net, core, page_nodes, page_edges, positions=lod_positions,
+                                     engine=engine, iterations=iterations)
+            net.write_html(os.path.join(output_dir, f"cluster_{k}.html"))
+        save_positions(lod_file, lod_positions)
+        print(os.path.join(output_dir, "index.html"))
+
+    def visualize(self, output_path="graph.html", pattern='physics', min_weight=10, min_degree=3,
+                  layout_engine="numpy", layout_iterations=60, color_by=None):
+        """
+        输出 pyvis HTML。总权重 < min_weight 且边数 < min_degree 的节点以及孤立点不展示。
+        pattern='static' 时在 Python 中预先计算布局（layout_engine 为 numpy 或 networkx），
+        坐标写入 HTML 并关闭物理模拟，大图在浏览器中也能快速打开。
+        color_by='community' 时按社区着色（需先调用 set_communities，或 GraphAnalyzer.analyze_communities）。
+        """
+        node_mask, edge_mask = self.prune_mask(min_weight=min_weight, min_degree=min_degree)
+        temp_net = self.core.to_pyvis(node_mask, edge_mask, group_by=color_by)
 
+        if pattern == 'static':
+            self.apply_static_layout(temp_net, self.core, node_mask, edge_mask,
+                                     engine=layout_engine, iterations=layout_iterations)
         if pattern == 'physics':
             temp_net.show_buttons(filter_=['physics'])
         if pattern == 'force':
@@ -261,11 +610,5 @@ class DataGraph:
                 }
             }
             """)
-        # 保存self.net到本地data目录下，命名为"net+当前master id"
-        os.makedirs("data", exist_ok=True)
-        # 保存节点和边数据
-        nodes_filename = f"data/net_{self.master}_nodes.json"
-        edges_filename = f"data/net_{self.master}_edges.json"
-        self.save_net_data(self.net, nodes_filename, edges_filename)
         temp_net.write_html(output_path)
         print(output_path)
@@ -0,0 +1,340 @@
+import numpy as np
+from pyvis.network import Network
+from pyvis.node import Node
+from pyvis.edge import Edge
+
+
+def as_indices(selection, size):
+    """
+    将布尔掩码或下标数组统一转换为下标数组；selection 为 None 时返回全部下标。
+    """
+    if selection is None:
+        return np.arange(size)
+    selection = np.asarray(selection)
+    if selection.dtype == bool:
+        return np.flatnonzero(selection)
+    return selection.astype(np.int64)
+
+
+def top_n(values, n):
+    """
+    返回 values 中最大的 n 个元素的下标（按值降序）。
+    使用 argpartition 选出前 n 个再排序，代价为 O(len(values) + n log n)，不对全部元素排序。
+    """
+    values = np.asarray(values)
+    n = min(int(n), len(values))
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    idx = np.argpartition(-values, n - 1)[:n]
+    return idx[np.argsort(-values[idx], kind="stable")]
+
+
+class GraphCore:
+    """
+    紧凑的内存图结构，DataGraph 的内部表示。
+    - 节点 id（wxid / room_name）被映射为连续的整数下标，ids[i] 为第 i 个节点的原始 id；
+    - 节点属性按列存储：node_group 为 int8 编码，其余属性为与 ids 对齐的 numpy 数组；
+    - 边存储为 src/dst/weight/edge_group 四个数组，邻接关系按需构建为 CSR（indptr/indices）。
+    pyvis / networkx 对象只在渲染或外部分析时由 to_pyvis() / to_networkx() 生成。
+    """
+
+    def __init__(self, directed=False):
+        self.directed = directed
+        self.ids = []
+        self.index = {}
+        self.group_names = []       # 节点类型编码 -> 名称（如 user / chatroom）
+        self.group_attrs = {}       # 节点类型编码 -> 该类型拥有的属性列名（保持写入顺序）
+        self.node_group = np.zeros(0, dtype=np.int8)
+        self.node_attrs = {}        # 属性列名 -> 长度为节点数的 object 数组
+        self.edge_group_names = []  # 边类型编码 -> 名称（如 private_msg / chatroom_msg）
+        self.src = np.zeros(0, dtype=np.int32)
+        self.dst = np.zeros(0, dtype=np.int32)
+        self.weight = np.zeros(0, dtype=np.int64)
+        self.edge_group = np.zeros(0, dtype=np.int8)
+        self._csr = None
+
+    @property
+    def num_nodes(self):
+        return len(self.ids)
+
+    @property
+    def num_edges(self):
+        return len(self.src)
+
+    @staticmethod
+    def _code(names, name):
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def add_nodes(self, ids, group, **columns):
+        """
+        批量添加同一类型的节点，columns 为与 ids 等长的属性列。已存在的 id 被跳过（先加入者优先）。
+        """
+        group_code = self._code(self.group_names, group)
+        attrs = self.group_attrs.setdefault(group_code, [])
+        for name in columns:
+            if name not in attrs:
+                attrs.append(name)
+
+        new_rows = []
+        for row, node_id in enumerate(ids):
+            if node_id in self.index:
+                continue
+            self.index[node_id] = len(self.ids)
+            self.ids.append(node_id)
+            new_rows.append(row)
+        if not new_rows:
+            return
+
+        count = len(new_rows)
+        old_n = len(self.node_group)
+        self.node_group = np.concatenate([self.node_group, np.full(count, group_code, dtype=np.int8)])
+        for name in set(self.node_attrs) | set(columns):
+            column = self.node_attrs.get(name, np.full(old_n, None, dtype=object))
+            values = np.full(count, None, dtype=object)
+            if name in columns:
+                source = columns[name]
+                values[:] = [source[row] for row in new_rows]
+            self.node_attrs[name] = np.concatenate([column, values])
+        self._csr = None
+
+    def set_node_column(self, name, values):
+        """
+        为所有节点设置（或覆盖）一列属性，values 与 ids 等长；该列对所有节点类型可见。
+        """
+        column = np.full(self.num_nodes, None, dtype=object)
+        column[:] = list(values)
+        self.node_attrs[name] = column
+        for group_code in range(len(self.group_names)):
+            attrs = self.group_attrs.setdefault(group_code, [])
+            if name not in attrs:
+                attrs.append(name)
+
+    def edge_keys(self, src, dst):
+        """
+        边的整数键；无向图中 (u, v) 与 (v, u) 的键相同。
+        """
+        src = src.astype(np.int64)
+        dst = dst.astype(np.int64)
+        if not self.directed:
+            src, dst = np.minimum(src, dst), np.maximum(src, dst)
+        return src * max(self.num_nodes, 1) + dst
+
+    def add_edges(self, sources, targets, weights, group):
+        """
+        批量添加同一类型的边。端点不存在的边被跳过；同一对节点只保留最先加入的一条边
+        （无向图中不区分方向，与 pyvis add_edge 的去重规则一致）。
+        """
+        src = np.fromiter((self.index.get(s, -1) for s in sources), dtype=np.int64, count=len(sources))
+        dst = np.fromiter((self.index.get(t, -1) for t in targets), dtype=np.int64, count=len(targets))
+        weight = np.asarray(weights, dtype=np.int64).reshape(-1)
+        valid = (src >= 0) & (dst >= 0)
+        src, dst, weight = src[valid], dst[valid], weight[valid]
+
+        all_keys = np.concatenate([self.edge_keys(self.src, self.dst), self.edge_keys(src, dst)])
+        _, first = np.unique(all_keys, return_index=True)
+        keep = np.zeros(len(all_keys), dtype=bool)
+        keep[first] = True
+        keep = keep[self.num_edges:]
+
+        group_code = self._code(self.edge_group_names, group)
+        self.src = np.concatenate([self.src, src[keep].astype(np.int32)])
+        self.dst = np.concatenate([self.dst, dst[keep].astype(np.int32)])
+        self.weight = np.concatenate([self.weight, weight[keep]])
+        self.edge_group = np.concatenate([self.edge_group, np.full(int(keep.sum()), group_code, dtype=np.int8)])
+        self._csr = None
+
+    def csr(self):
+        """
+        返回 (indptr, indices, edge_ids)：节点 i 的邻居为 indices[indptr[i]:indptr[i+1]]，
+        edge_ids 为对应边在 src/dst 数组中的下标。无向图中每条边在两个端点下各出现一次。
+        """
+        if self._csr is None:
+            edge_ids = np.arange(self.num_edges, dtype=np.int64)
+            if self.directed:
+                rows, cols, eids = self.src, self.dst, edge_ids
+            else:
+                rows = np.concatenate([self.src, self.dst])
+                cols = np.concatenate([self.dst, self.src])
+                eids = np.concatenate([edge_ids, edge_ids])
+            order = np.argsort(rows, kind="stable")
+            indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=self.num_nodes), out=indptr[1:])
+            self._csr = (indptr, cols[order].astype(np.int32), eids[order])
+        return self._csr
+
+    def degree(self, node=None):
+        """
+        节点的度（相连边数）。node 为空时返回所有节点的度数组。
+        """
+        indptr = self.csr()[0]
+        if node is None:
+            return np.diff(indptr)
+        i = self.index[node]
+        return int(indptr[i + 1] - indptr[i])
+
+    def find_edges(self, sources, targets):
+        """
+        批量查找边：返回与 sources / targets 等长的边下标数组，端点或边不存在时为 -1（无向图中不区分方向）。
+        """
+        src = np.fromiter((self.index.get(s, -1) for s in sources), dtype=np.int64, count=len(sources))
+        dst = np.fromiter((self.index.get(t, -1) for t in targets), dtype=np.int64, count=len(targets))
+        result = np.full(len(src), -1, dtype=np.int64)
+        valid = np.flatnonzero((src >= 0) & (dst >= 0))
+        if self.num_edges == 0 or len(valid) == 0:
+            return result
+        edge_keys = self.edge_keys(self.src, self.dst)
+        order = np.argsort(edge_keys, kind="stable")
+        sorted_keys = edge_keys[order]
+        keys = self.edge_keys(src[valid], dst[valid])
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        hit = sorted_keys[pos] == keys
+        result[valid[hit]] = order[pos[hit]]
+        return result
+
+    def weighted_degree(self, weight=None):
+        """
+        所有节点相连边的权重之和。weight 为与边对齐的权重数组，默认为 self.weight。
+        """
+        n = self.num_nodes
+        weight = self.weight if weight is None else weight
+        return (
+            np.bincount(self.src, weights=weight, minlength=n)
+            + np.bincount(self.dst, weights=weight, minlength=n)
+        ).astype(np.int64)
+
+    def neighbors(self, node):
+        """
+        返回节点的邻居 id 列表，O(deg)。
+        """
+        indptr, indices, _ = self.csr()
+        i = self.index[node]
+        return [self.ids[j] for j in indices[indptr[i]:indptr[i + 1]]]
+
+    def node_options(self, i):
+        """
+        第 i 个节点的属性字典（含 group）。
+        """
+        group_code = int(self.node_group[i])
+        options = {"group": self.group_names[group_code]}
+        for name in self.group_attrs.get(group_code, []):
+            options[name] = self.node_attrs[name][i]
+        return options
+
+    def to_pyvis(self, node_mask=None, edge_mask=None, net=None, group_by=None):
+        """
+        生成 pyvis Network，节点与边的字典与 add_node/add_edge 生成的一致。
+        node_mask / edge_mask 为布尔数组或下标数组，用于只输出子图。
+        group_by 为属性列名时，用该列的值作为节点的 group（pyvis 按 group 着色），如 community。
+        """
+        net = net or Network(directed=self.directed)
+        nodes = as_indices(node_mask, self.num_nodes)
+        edges = as_indices(edge_mask, self.num_edges)
+
+        for i in nodes:
+            options = self.node_options(i)
+            if group_by is not None:
+                options["group"] = str(self.node_attrs[group_by][i])
+            n_id = self.ids[i]
+            label = options.pop("label", None)
+            node = Node(n_id, "dot", label=label if label else n_id, font_color=net.font_color, **options)
+            net.nodes.append(node.options)
+            net.node_ids.append(n_id)
+            net.node_map[n_id] = node.options
+
+        ids = self.ids
+        for e in edges:
+            edge = Edge(
+                ids[self.src[e]], ids[self.dst[e]], self.directed,
+                weight=int(self.weight[e]), group=self.edge_group_names[self.edge_group[e]],
+            )
+            net.edges.append(edge.options)
+        return net
+
+    def to_networkx(self):
+        """
+        生成 networkx 图（节点属性与边的 weight/group 一并写入）。
+        """
+        import networkx as nx
+
+        graph = nx.DiGraph() if self.directed else nx.Graph()
+        graph.add_nodes_from((self.ids[i], self.node_options(i)) for i in range(self.num_nodes))
+        graph.add_edges_from(
+            (self.ids[s], self.ids[d], {"weight": int(w), "group": self.edge_group_names[g]})
+            for s, d, w, g in zip(self.src, self.dst, self.weight, self.edge_group)
+        )
+        return graph
+
+    def to_state(self):
+        """
+        序列化为只包含列表与 numpy 数组的字典，用于缓存。
+        """
+        return {
+            "directed": self.directed,
+            "ids": self.ids,
+            "group_names": self.group_names,
+            "group_attrs": self.group_attrs,
+            "node_group": self.node_group,
+            "node_attrs": self.node_attrs,
+            "edge_group_names": self.edge_group_names,
+            "src": self.src,
+            "dst": self.dst,
+            "weight": self.weight,
+            "edge_group": self.edge_group,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        core = cls(directed=state["directed"])
+        for key, value in state.items():
+            setattr(core, key, value)
+        core.index = {node_id: i for i, node_id in enumerate(core.ids)}
+        return core
+
+
+def merge_cores(cores):
+    """
+    把多个 GraphCore 合并为一个，节点按原始 id（wxid / room_name）共享同一张下标表去重：
+    - 节点按输入顺序加入，同一 id 的类型与属性以最先出现者为准；
+    - 同一对节点的边合并为一条，weight 为各来源权重之和，类型与方向以最先出现者为准。
+    返回 (merged, source_weight)：source_weight[e, s] 为合并后第 e 条边在第 s 个输入中的权重。
+    节点与边都只遍历一次，边的合并为一次 np.unique。
+    """
+    merged = GraphCore(directed=cores[0].directed if cores else False)
+    for core in cores:
+        for code, name in enumerate(core.group_names):
+            rows = np.flatnonzero(core.node_group == code)
+            merged.add_nodes(
+                [core.ids[i] for i in rows],
+                group=name,
+                **{attr: core.node_attrs[attr][rows] for attr in core.group_attrs.get(code, [])},
+            )
+
+    src, dst, weight, group, source = [], [], [], [], []
+    for s, core in enumerate(cores):
+        mapping = np.fromiter((merged.index[node_id] for node_id in core.ids), dtype=np.int64, count=core.num_nodes)
+        group_map = np.array(
+            [merged._code(merged.edge_group_names, name) for name in core.edge_group_names], dtype=np.int8
+        )
+        src.append(mapping[core.src])
+        dst.append(mapping[core.dst])
+        weight.append(core.weight)
+        group.append(group_map[core.edge_group] if len(group_map) else np.zeros(0, dtype=np.int8))
+        source.append(np.full(core.num_edges, s, dtype=np.int64))
+    if not cores:
+        return merged, np.zeros((0, 0), dtype=np.int64)
+    src, dst, weight = np.concatenate(src), np.concatenate(dst), np.concatenate(weight)
+    group, source = np.concatenate(group), np.concatenate(source)
+
+    keys = merged.edge_keys(src, dst)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    merged.src = src[first].astype(np.int32)
+    merged.dst = dst[first].astype(np.int32)
+    merged.edge_group = group[first].astype(np.int8)
+    merged.weight = np.bincount(inverse, weights=weight, minlength=len(first)).astype(np.int64)
+    source_weight = np.bincount(
+        inverse * len(cores) + source, weights=weight, minlength=len(first) * len(cores)
+    ).astype(np.int64).reshape(len(first), len(cores))
+    merged._csr = None
+    return merged, source_weight
@@ -0,0 +1,164 @@
+import os
+import time
+import threading
+from sqlalchemy import create_engine, event, text
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobJournal:
+    """
+    持久化的任务日志：SQLite 表 jobs，每个联系人（wxid）一行，记录状态（pending / running / done / failed）、
+    尝试次数、最近一次错误与创建 / 更新时间，进程中断后重新运行可以从断点继续。
+    - 状态变化先记在内存中，累计 batch_size 条时立即写入，另有后台线程每 flush_interval 秒写入一次，
+      没有新的状态变化（如所有联系人都在长时间运行）时也按时落盘，每次写入为一个事务；
+      事务保证一批要么全部写入要么全部没有，进程崩溃最多丢失最后一批尚未写入的状态变化，
+      这些联系人重启后视为未完成重新处理（写入 Neo4j 为 MERGE，LLM 响应有缓存，重复处理没有副作用）；
+    - 上次运行中断时停留在 running 的联系人同样视为未完成。
+    多个线程可共用一个实例，由锁保护。
+    """
+
+    def __init__(self, path=os.path.join("data", "jobs.db"), batch_size=50, flush_interval=5.0):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # 串行化批量写入，避免旧状态的批次晚于新状态提交
+        self.dirty = set()
+        self.closed = threading.Event()
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30})
+        event.listen(self.engine, "connect", self._on_connect)
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " wxid TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " last_error TEXT,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            ))
+            rows = conn.execute(text("SELECT wxid, state, attempts, last_error, created, updated FROM jobs")).all()
+        self.jobs = {
+            row.wxid: {
+                "state": row.state,
+                "attempts": row.attempts,
+                "last_error": row.last_error,
+                "created": row.created,
+                "updated": row.updated,
+            }
+            for row in rows
+        }
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                pass  # 写入失败的状态已放回，下次一并写入
+
+    @staticmethod
+    def _on_connect(dbapi_conn, _):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA synchronous=NORMAL")
+
+    def state(self, wxid):
+        with self.lock:
+            job = self.jobs.get(wxid)
+            return job["state"] if job else None
+
+    def is_unfinished(self, wxid, retry_failed_only=False):
+        """
+        是否需要（重新）处理：默认为除 done 之外的全部状态；
+        retry_failed_only=True 时只处理失败过且尚未完成的（重试中途中断、已回到 pending / running 的也算）。
+        """
+        with self.lock:
+            job = self.jobs.get(wxid)
+            if job is None:
+                return not retry_failed_only
+            if retry_failed_only:
+                return job["state"] != DONE and job["last_error"] is not None
+            return job["state"] != DONE
+
+    def done_wxids(self):
+        with self.lock:
+            return {wxid for wxid, job in self.jobs.items() if job["state"] == DONE}
+
+    def _update(self, wxid, state, error=None, attempt=False):
+        now = time.time()
+        with self.lock:
+            job = self.jobs.get(wxid)
+            if job is None:
+                job = self.jobs[wxid] = {"state": state, "attempts": 0, "last_error": None, "created": now}
+            job["state"] = state
+            job["updated"] = now
+            if attempt:
+                job["attempts"] += 1
+            if error is not None:
+                job["last_error"] = str(error)[:2000]
+            self.dirty.add(wxid)
+            need_flush = len(self.dirty) >= self.batch_size
+        if need_flush:
+            self.flush()
+
+    def mark_pending(self, wxid):
+        """
+        登记入队的联系人；已有记录（如 failed）只改状态，保留尝试次数与错误信息。
+        """
+        self._update(wxid, PENDING)
+
+    def start(self, wxid):
+        self._update(wxid, RUNNING, attempt=True)
+
+    def finish(self, wxid):
+        self._update(wxid, DONE)
+
+    def fail(self, wxid, error):
+        self._update(wxid, FAILED, error=error)
+
+    def flush(self):
+        """
+        把内存中的状态变化在一个事务中批量写入。
+        """
+        with self.flush_lock:
+            with self.lock:
+                rows = [{"wxid": wxid, **self.jobs[wxid]} for wxid in self.dirty]
+                self.dirty = set()
+            if not rows:
+                return 0
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(
+                        text(
+                            "INSERT INTO jobs (wxid, state, attempts, last_error, created, updated)"
+                            " VALUES (:wxid, :state, :attempts, :last_error, :created, :updated)"
+                            " ON CONFLICT (wxid) DO UPDATE SET"
+                            " state = excluded.state, attempts = excluded.attempts,"
+                            " last_error = excluded.last_error, updated = excluded.updated"
+                        ),
+                        rows,
+                    )
+            except Exception:
+                # 写入失败时放回，下次一并写入
+                with self.lock:
+                    self.dirty.update(row["wxid"] for row in rows)
+                raise
+            return len(rows)
+
+    def summary(self):
+        with self.lock:
+            counts = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self.jobs.values():
+                counts[job["state"]] = counts.get(job["state"], 0) + 1
+            return counts
+
+    def close(self):
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        self.engine.dispose()
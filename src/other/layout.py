@@ -0,0 +1,170 @@
+import os
+import numpy as np
+from other.graph_core import as_indices
+
+
+def _grid_repulsion(pos, k, grid):
+    """
+    网格近似的斥力：把节点按坐标分到 grid x grid 个格子里，
+    - 远场：格子之间按质心与质量（格子内节点数）计算斥力，同一格子内的节点共享该力；
+    - 近场：同一格子内的节点受“去掉自己后的格内质心”的斥力。
+    每次迭代的代价为 O(格子数^2 + V)，与 V^2 无关。
+    """
+    lo = pos.min(axis=0)
+    span = max(float((pos.max(axis=0) - lo).max()), 1e-9)
+    cell_xy = np.minimum(((pos - lo) / span * grid).astype(np.int64), grid - 1)
+    cell = cell_xy[:, 0] * grid + cell_xy[:, 1]
+
+    mass = np.bincount(cell, minlength=grid * grid).astype(np.float64)
+    sums = np.stack([
+        np.bincount(cell, weights=pos[:, 0], minlength=grid * grid),
+        np.bincount(cell, weights=pos[:, 1], minlength=grid * grid),
+    ], axis=1)
+    occupied = np.flatnonzero(mass)
+    cell_mass = mass[occupied]
+    centroids = sums[occupied] / cell_mass[:, None]
+
+    # 远场：非空格子两两之间
+    d = centroids[:, None, :] - centroids[None, :, :]
+    d2 = (d ** 2).sum(axis=-1)
+    np.fill_diagonal(d2, np.inf)
+    cell_force = (d * (k * k * cell_mass[None, :] / d2)[..., None]).sum(axis=1)
+    far = np.zeros((grid * grid, 2))
+    far[occupied] = cell_force
+    disp = far[cell]
+
+    # 近场：相对去掉自身后的格内质心
+    own_mass = mass[cell] - 1
+    has_peer = own_mass > 0
+    own_centroid = (sums[cell][has_peer] - pos[has_peer]) / own_mass[has_peer, None]
+    d = pos[has_peer] - own_centroid
+    d2 = (d ** 2).sum(axis=-1) + 1e-9
+    disp[has_peer] += d * (k * k * own_mass[has_peer] / d2)[:, None]
+    return disp
+
+
+def force_layout(n, src, dst, weight=None, iterations=60, seed=0, init_pos=None, grid=32):
+    """
+    向量化的 Fruchterman-Reingold 力导向布局。
+    n 为节点数，src/dst 为边端点下标（0..n-1），weight 为边权重（按 log1p 缩放引力）。
+    init_pos 为 (n, 2) 数组，NaN 行表示没有历史位置；有历史位置时降低初始温度，使布局保持稳定。
+    返回 (n, 2) 坐标数组（像素单位，中心在原点）。
+    """
+    rng = np.random.default_rng(seed)
+    if n == 0:
+        return np.zeros((0, 2))
+    k = 100.0  # 理想边长
+    size = np.sqrt(n) * k
+    pos = rng.uniform(-size / 2, size / 2, (n, 2))
+    temperature = size / 10
+    if init_pos is not None:
+        known = ~np.isnan(init_pos).any(axis=1)
+        pos[known] = init_pos[known]
+        if known.all():
+            temperature = size / 50
+        elif known.any():
+            temperature = size / 20
+    if n == 1:
+        return pos - pos.mean(axis=0)
+
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    w = np.ones(len(src)) if weight is None else np.log1p(np.asarray(weight, dtype=np.float64))
+    w = w / max(float(w.mean()), 1e-9) if len(w) else w
+
+    for it in range(iterations):
+        disp = _grid_repulsion(pos, k, grid)
+
+        # 引力：沿边拉近两个端点
+        d = pos[src] - pos[dst]
+        dist = np.sqrt((d ** 2).sum(axis=1)) + 1e-9
+        f = d * (dist / k * w)[:, None]
+        for axis in range(2):
+            disp[:, axis] -= np.bincount(src, weights=f[:, axis], minlength=n)
+            disp[:, axis] += np.bincount(dst, weights=f[:, axis], minlength=n)
+
+        # 位移不超过当前温度，温度线性下降
+        length = np.sqrt((disp ** 2).sum(axis=1)) + 1e-9
+        t = temperature * (1 - it / iterations)
+        pos += disp * (np.minimum(length, t) / length)[:, None]
+
+    return pos - pos.mean(axis=0)
+
+
+def networkx_layout(n, src, dst, weight=None, iterations=50, seed=0, init_pos=None):
+    """
+    使用 networkx.spring_layout 计算布局，参数与返回值同 force_layout。
+    节点数超过 500 时 networkx 需要安装 scipy。
+    """
+    import networkx as nx
+
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n))
+    weights = np.ones(len(src)) if weight is None else np.log1p(np.asarray(weight, dtype=np.float64))
+    graph.add_weighted_edges_from(zip(np.asarray(src).tolist(), np.asarray(dst).tolist(), weights.tolist()))
+    size = np.sqrt(max(n, 1)) * 100.0
+    pos = None
+    if init_pos is not None:
+        known = ~np.isnan(init_pos).any(axis=1)
+        if known.any():
+            scale = max(float(np.abs(init_pos[known]).max()), 1e-9)
+            pos = {i: init_pos[i] / scale for i in np.flatnonzero(known)}
+            rng = np.random.default_rng(seed)
+            pos.update({i: rng.uniform(-1, 1, 2) for i in np.flatnonzero(~known)})
+    layout = nx.spring_layout(graph, pos=pos, iterations=iterations, seed=seed, weight="weight", scale=size / 2)
+    return np.array([layout[i] for i in range(n)]).reshape(n, 2)
+
+
+LAYOUT_ENGINES = {
+    "numpy": force_layout,
+    "networkx": networkx_layout,
+}
+
+
+def compute_layout(core, node_mask=None, edge_mask=None, previous=None, engine="numpy", iterations=60, seed=0):
+    """
+    计算 GraphCore（或其子图）的静态布局。
+    node_mask / edge_mask 为布尔掩码或下标数组；previous 为 {节点 id: (x, y)} 的历史位置，
+    作为初始位置使多次运行的布局保持一致。
+    返回 (nodes, pos)：nodes 为参与布局的节点下标（升序），pos 为对应的 (len(nodes), 2) 坐标。
+    """
+    nodes = np.sort(as_indices(node_mask, core.num_nodes))
+    edges = as_indices(edge_mask, core.num_edges)
+    # 全局下标 -> 布局内下标（二分查找，代价只与子图大小有关）
+    src_global, dst_global = core.src[edges], core.dst[edges]
+    src = np.searchsorted(nodes, src_global)
+    dst = np.searchsorted(nodes, dst_global)
+    padded = np.append(nodes, -1)  # 越界的查找结果落在 -1 上，必然不相等
+    valid = (padded[src] == src_global) & (padded[dst] == dst_global)
+
+    init_pos = None
+    if previous:
+        init_pos = np.array([previous.get(core.ids[i], (np.nan, np.nan)) for i in nodes], dtype=np.float64)
+        init_pos = init_pos.reshape(len(nodes), 2)
+
+    pos = LAYOUT_ENGINES[engine](
+        len(nodes), src[valid], dst[valid], core.weight[edges][valid],
+        iterations=iterations, seed=seed, init_pos=init_pos,
+    )
+    return nodes, pos
+
+
+def load_positions(filename):
+    """
+    读取保存的布局，返回 {节点 id: (x, y)}；文件不存在时返回空字典。
+    """
+    if not os.path.exists(filename):
+        return {}
+    with np.load(filename) as data:
+        return {node_id: (x, y) for node_id, (x, y) in zip(data["ids"].tolist(), data["pos"].tolist())}
+
+
+def save_positions(filename, positions):
+    """
+    保存 {节点 id: (x, y)} 布局，供下次运行作为初始位置。
+    """
+    ids = list(positions)
+    pos = np.array([positions[node_id] for node_id in ids], dtype=np.float64).reshape(len(ids), 2)
+    tmp_filename = filename + ".tmp.npz"
+    np.savez(tmp_filename, ids=np.array(ids, dtype=str), pos=pos)
+    os.replace(tmp_filename, filename)
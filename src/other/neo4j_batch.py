@@ -0,0 +1,241 @@
+import threading
+from collections import OrderedDict
+from loguru import logger
+
+# 地址节点的合并键（与原先 graph.merge 使用的主键一致）
+ADDRESS_KEYS = {
+    "Country": ("countryName",),
+    "Province": ("provinceName", "countryName"),
+    "City": ("provinceName", "countryName", "cityName"),
+}
+
+# 启动时即可确定合并键的标签；LLM 生成的其他标签在第一次写入时再创建约束
+SCHEMA_KEYS = {"User": ("id",), **ADDRESS_KEYS}
+
+# 已创建唯一约束的 (数据库地址, 标签, 键)，进程内只创建一次
+_schema_done = set()
+_schema_lock = threading.Lock()
+
+
+def quote(name):
+    """
+    Cypher 标识符（标签、关系类型、属性名）转义，标识符不能参数化，只能拼接。
+    """
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def key_map(var, keys):
+    return "{" + ", ".join(f"{quote(k)}: {var}.{quote(k)}" for k in keys) + "}"
+
+
+def ensure_constraint(graph, label, keys):
+    """
+    为 (标签, 合并键) 创建唯一约束（多键时为复合唯一约束），每个数据库每个进程只执行一次。
+    """
+    keys = tuple(keys)
+    marker = (str(getattr(graph.service, "uri", id(graph))), label, keys)
+    with _schema_lock:
+        if marker in _schema_done:
+            return
+        _schema_done.add(marker)
+    props = ", ".join(f"n.{quote(k)}" for k in keys)
+    cypher = f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{quote(label)}) REQUIRE ({props}) IS UNIQUE"
+    try:
+        graph.run(cypher)
+    except Exception as e:
+        logger.warning(f"创建唯一约束失败 {label}{keys}: {e}")
+
+
+def warm_schema(graph):
+    """
+    启动时为 SCHEMA_KEYS 中的标签创建唯一约束；知识图谱中其他标签（由 LLM 生成，事先未知）
+    在 Neo4jBatchWriter.flush 第一次遇到时创建。
+    """
+    for label, keys in SCHEMA_KEYS.items():
+        ensure_constraint(graph, label, keys)
+
+
+class Neo4jBatchWriter:
+    """
+    批量写入知识图谱：节点按 (标签, 合并键) 分组、关系按 (类型, 两端标签与合并键) 分组，
+    每组一条参数化的 UNWIND $rows AS row MERGE ... 语句，全部语句在一个事务中执行。
+    一对联系人（或一批联系人）的写入只需少量往返，而不是每个节点、每条关系一次。
+    节点与关系的属性都用 SET += 合并，与 py2neo graph.merge 生成的语句（SET _ += ...）一致：
+    新属性覆盖同名旧属性，本次没有给出的旧属性保留，重新运行后关系上可能留有上次写入的属性。
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = OrderedDict()      # (label, keys) -> {合并键取值: row}
+        self.relations = OrderedDict()  # (type, start_label, start_keys, end_label, end_keys) -> [row]
+        self.gazetteer = None
+        self.new_places = set()         # 本批新写入的地点，提交成功后登记到 gazetteer
+
+    def add_node(self, label, keys, props):
+        group = self.nodes.setdefault((label, tuple(keys)), {})
+        key = tuple(props.get(k) for k in keys)
+        if key in group:
+            group[key]["props"].update(props)
+        else:
+            group[key] = {"key": {k: props.get(k) for k in keys}, "props": dict(props)}
+
+    def add_relation(self, rel_type, start, end, props=None):
+        """
+        start / end 为 (标签, 合并键, 属性字典)，只使用其中合并键的取值定位节点。
+        """
+        (start_label, start_keys, start_props), (end_label, end_keys, end_props) = start, end
+        self.relations.setdefault(
+            (rel_type, start_label, tuple(start_keys), end_label, tuple(end_keys)), []
+        ).append({
+            "start": {k: start_props.get(k) for k in start_keys},
+            "end": {k: end_props.get(k) for k in end_keys},
+            "props": props or {},
+        })
+
+    def add_kg(self, kg_json):
+        """
+        加入 LLM 生成的知识图谱：节点按 id 合并，关系两端都在本图谱节点中时才写入。
+        """
+        node_labels = {}
+        for node in kg_json.get("nodes", []):
+            node_id = node.get("id") or node.get("wxid")
+            label = node.get("label", "User")
+            self.add_node(label, ("id",), {k: v for k, v in node.items() if k != "label"})
+            node_labels[node_id] = label
+        for rel in kg_json.get("relations", []):
+            start_label = node_labels.get(rel.get("start"))
+            end_label = node_labels.get(rel.get("end"))
+            if start_label and end_label:
+                self.add_relation(
+                    rel.get("type", "RELATES_TO"),
+                    (start_label, ("id",), {"id": rel.get("start")}),
+                    (end_label, ("id",), {"id": rel.get("end")}),
+                    rel.get("properties", {}),
+                )
+
+    def add_addresses(self, kg_json, gazetteer=None):
+        """
+        为有 country/province/city 的 User 节点加入地址节点、地址之间的归属关系，
+        以及 User 到最详细地址（City > Province > Country）的 WECHAT_ADDRESS 关系。
+        User 节点本身由 add_kg 合并，这里只引用其 id。
+        合并键中有缺失值（如有城市但没有省份）的地点无法按合并键匹配，跳过该地点及与之相连的关系，
+        并记录跳过的个数；User 的 WECHAT_ADDRESS 关系指向其余地点中最详细的一个。
+        gazetteer 为共享的地址缓存（other.gazetteer.Gazetteer）时，已写入过的地点不再合并节点与归属关系，
+        只写 WECHAT_ADDRESS；归属关系挂在更详细的地点上，随该地点第一次出现时一并写入。
+        """
+        users = []
+        skipped = 0
+        for node in kg_json.get("nodes", []):
+            if node.get("label") != "User":
+                continue
+            country = node.get("country", None)
+            province = node.get("province", None)
+            city = node.get("city", None)
+            if not country and not province and not city:
+                continue
+
+            places = {}
+            if country is not None:
+                places["Country"] = {"countryName": country}
+            if province is not None:
+                places["Province"] = {"countryName": country, "provinceName": province}
+            if city is not None:
+                places["City"] = {"countryName": country, "provinceName": province, "cityName": city}
+            complete = {
+                label: props for label, props in places.items()
+                if all(props.get(k) is not None for k in ADDRESS_KEYS[label])
+            }
+            skipped += len(places) - len(complete)
+            if complete:
+                users.append((node.get("id") or node.get("wxid"), complete))
+        if skipped:
+            logger.warning(f"跳过 {skipped} 个合并键不完整的地址节点（缺少国家或省份）")
+
+        candidates = {}
+        for _, places in users:
+            for label, props in places.items():
+                candidates.setdefault((label, tuple(props.get(k) for k in ADDRESS_KEYS[label])), None)
+        new = set(candidates if gazetteer is None else gazetteer.unknown(candidates))
+        if gazetteer is not None:
+            self.gazetteer = gazetteer
+            self.new_places |= new
+
+        written = set()
+        for user_id, places in users:
+            def ref(label):
+                return label, ADDRESS_KEYS[label], places[label]
+
+            def is_new(label):
+                # 每个新地点在本批中只写一次节点与归属关系
+                key = (label, tuple(places[label].get(k) for k in ADDRESS_KEYS[label]))
+                return key in new and key not in written
+
+            for label, props in places.items():
+                if is_new(label):
+                    self.add_node(label, ADDRESS_KEYS[label], props)
+
+            if "City" in places and is_new("City"):
+                if "Province" in places:
+                    self.add_relation("LOCATED_IN_PROVINCE", ref("City"), ref("Province"))
+                if "Country" in places:
+                    self.add_relation("LOCATED_IN_COUNTRY", ref("City"), ref("Country"))
+            if "Province" in places and "Country" in places and is_new("Province"):
+                self.add_relation("LOCATED_IN_COUNTRY", ref("Province"), ref("Country"))
+
+            written.update((label, tuple(props.get(k) for k in ADDRESS_KEYS[label])) for label, props in places.items())
+
+            address = next((label for label in ("City", "Province", "Country") if label in places), None)
+            if address:
+                self.add_relation("WECHAT_ADDRESS", ("User", ("id",), {"id": user_id}), ref(address))
+
+    def statements(self):
+        """
+        生成 (cypher, rows) 列表：先合并全部节点，再合并全部关系。
+        """
+        result = []
+        for (label, keys), group in self.nodes.items():
+            cypher = (
+                f"UNWIND $rows AS row MERGE (n:{quote(label)} {key_map('row.key', keys)}) "
+                f"SET n += row.props"
+            )
+            result.append((cypher, list(group.values())))
+        for (rel_type, start_label, start_keys, end_label, end_keys), rows in self.relations.items():
+            cypher = (
+                f"UNWIND $rows AS row "
+                f"MATCH (a:{quote(start_label)} {key_map('row.start', start_keys)}) "
+                f"MATCH (b:{quote(end_label)} {key_map('row.end', end_keys)}) "
+                f"MERGE (a)-[r:{quote(rel_type)}]->(b) SET r += row.props"  # 与 py2neo 一致，不清除旧属性
+            )
+            result.append((cypher, rows))
+        return result
+
+    def ensure_schema(self):
+        """
+        为本批出现的 (标签, 合并键) 创建唯一约束，见 ensure_constraint；
+        启动时已由 warm_schema 创建过的直接跳过。
+        """
+        for label, keys in self.nodes:
+            ensure_constraint(self.graph, label, keys)
+
+    def flush(self):
+        """
+        在一个事务中执行全部语句，失败时回滚并抛出异常。返回执行的语句数。
+        """
+        statements = self.statements()
+        if not statements:
+            return 0
+        self.ensure_schema()
+        tx = self.graph.begin()
+        try:
+            for cypher, rows in statements:
+                tx.run(cypher, rows=rows)
+            self.graph.commit(tx)
+        except Exception:
+            self.graph.rollback(tx)
+            raise
+        if self.gazetteer is not None and self.new_places:
+            self.gazetteer.add(self.new_places)
+        self.nodes.clear()
+        self.relations.clear()
+        self.new_places = set()
+        return len(statements)
@@ -0,0 +1,85 @@
+import time
+import threading
+from py2neo import Graph
+from py2neo.errors import ConnectionBroken, ConnectionUnavailable, ServiceUnavailable, TransientError
+from loguru import logger
+
+# 这些错误通常是连接或服务暂时不可用，重连后重试即可
+RETRYABLE_ERRORS = (ConnectionBroken, ConnectionUnavailable, ServiceUnavailable, TransientError, ConnectionError)
+
+
+class Neo4jConnection:
+    """
+    线程安全的共享 Neo4j 连接：内部只有一个 py2neo Graph（自带连接池，大小为 pool_size），
+    由 WxidProcessor 创建一次、所有工作线程共用，避免每个联系人都重新握手与认证。
+    - graph：取得连接，距离上次检查超过 check_interval 秒时先做健康检查（RETURN 1），失败则重连；
+    - run(func)：执行 func(graph)，遇到连接类错误时重连并重试，最多 max_retries 次。
+    """
+
+    def __init__(self, url, user, password, pool_size=10, check_interval=30, max_retries=3, retry_delay=1):
+        self.url = url
+        self.auth = (user, password)
+        self.pool_size = pool_size
+        self.check_interval = check_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self._graph = None
+        self._checked_at = 0.0
+
+    def _connect(self):
+        self._graph = Graph(self.url, auth=self.auth, max_size=self.pool_size)
+        self._checked_at = time.monotonic()
+        logger.info(f"已连接Neo4j：{self.url}（连接池大小 {self.pool_size}）")
+
+    def _close(self):
+        if self._graph is not None:
+            try:
+                self._graph.service.connector.close()
+            except Exception:
+                pass
+            self._graph = None
+
+    @property
+    def graph(self):
+        with self.lock:
+            if self._graph is None:
+                self._connect()
+            elif time.monotonic() - self._checked_at > self.check_interval:
+                try:
+                    self._graph.run("RETURN 1").evaluate()
+                    self._checked_at = time.monotonic()
+                except Exception as e:
+                    logger.warning(f"Neo4j健康检查失败，重新连接：{e}")
+                    self._close()
+                    self._connect()
+            return self._graph
+
+    def reconnect(self, failed_graph=None):
+        """
+        重新建立连接。failed_graph 为出错时使用的 Graph，若其他线程已经重连过则不再重复。
+        """
+        with self.lock:
+            if failed_graph is not None and self._graph is not failed_graph:
+                return
+            self._close()
+            self._connect()
+
+    def run(self, func):
+        """
+        执行 func(graph) 并返回其结果，连接类错误时重连后重试。
+        """
+        for attempt in range(1, self.max_retries + 1):
+            graph = self.graph
+            try:
+                return func(graph)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Neo4j连接错误（第{attempt}次），重连后重试：{e}")
+                time.sleep(self.retry_delay * attempt)
+                self.reconnect(graph)
+
+    def close(self):
+        with self.lock:
+            self._close()
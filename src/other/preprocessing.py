@@ -1,7 +1,171 @@
 import os
 import json
-from other.database import WxMsg, WxUser, WxUserChatroom
+import datetime
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+from collections import deque
+from itertools import islice
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from other.database import (
+    WxMsg, WxUser, WxUserChatroom, SourceFile,
+    aggregate_pair_daily_stats, ingest_connection, is_chatroom_name, max_msg_id, msg_fingerprint,
+)
 
+try:
+    import ijson  # 可选依赖，用于增量解析超大的聊天记录文件
+except ImportError:
+    ijson = None
+
+try:
+    import orjson  # 可选依赖，更快的 JSON 解码器
+except ImportError:
+    orjson = None
+
+# 超过该大小（字节）的聊天记录文件，在安装了 ijson 时改为增量解析
+BIG_FILE_SIZE = 64 * 1024 * 1024
+
+# 批量写入消息时每批的行数
+DEFAULT_BATCH_SIZE = 5000
+
+
+def is_skipped_folder(name):
+    """
+    公众号（gh_）、以 @ 开头的系统会话以及企业微信（@openim）的文件夹不参与导入。
+    """
+    return name.startswith("gh_") or name.startswith("@") or name.endswith("@openim")
+
+
+def read_file_bytes(path):
+    """
+    读取整个文件，返回 (内容, meta)。meta 为读取时的 size/mtime/hash，
+    哈希按实际读到的字节计算，导入清单据此记录，保证清单与导入的消息对应同一份内容。
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        raw = f.read()
+    meta = {"size": len(raw), "mtime": stat.st_mtime, "hash": hashlib.blake2b(raw, digest_size=16).hexdigest()}
+    return raw, meta
+
+
+def decode_json(raw, encoding="utf-8"):
+    """
+    解码 JSON 字节串，安装了 orjson 且编码为 utf-8 时使用 orjson。
+    """
+    if orjson is not None and encoding.lower().replace("-", "") == "utf8":
+        return orjson.loads(raw)
+    return json.loads(raw.decode(encoding))
+
+
+def load_json_file(path, encoding="utf-8"):
+    """
+    读取单个 JSON 文件，返回 (path, data, ok, meta)，meta 见 read_file_bytes。
+    定义在模块级以便在子进程中调用。
+    """
+    try:
+        raw, meta = read_file_bytes(path)
+        return path, decode_json(raw, encoding), True, meta
+    except Exception:
+        return path, None, False, None
+
+
+def is_big_file(path):
+    """
+    安装了 ijson 且超过 BIG_FILE_SIZE 的聊天记录文件增量解析，不整体载入内存。
+    """
+    return ijson is not None and os.path.getsize(path) > BIG_FILE_SIZE
+
+
+def iter_load_json_files(paths, encoding="utf-8", workers=None, prefetch=4, local=None):
+    """
+    用进程池并行解析 JSON 文件（workers 为 None 时为 CPU 核数），按路径顺序产出 load_json_file 的结果。
+    最多提前提交 workers * prefetch 个文件，已解析而未取走的文件数有上界，流式导入时内存占用仍然有限。
+    local(path) 为真的文件不提交给进程池，产出 (path, None, None, None)，由调用方在当前进程中读取。
+    """
+    workers = workers or os.cpu_count() or 1
+    paths = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def submit():
+            path = next(paths, None)
+            if path is not None:
+                future = None if local and local(path) else executor.submit(load_json_file, path, encoding)
+                pending.append((path, future))
+
+        for _ in range(workers * prefetch):
+            submit()
+        while pending:
+            path, future = pending.popleft()
+            submit()
+            yield future.result() if future is not None else (path, None, None, None)
+
+
+class HashingReader:
+    """
+    包装二进制文件对象，在被 ijson 增量读取的同时累计大小与哈希。
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def read(self, n=-1):
+        data = self.f.read(n)
+        self.size += len(data)
+        self.digest.update(data)
+        return data
+
+
+def iter_batches(iterable, batch_size):
+    """
+    将任意可迭代对象切分为长度不超过 batch_size 的列表。
+    """
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_create_times(values):
+    """
+    批量把 "YYYY-MM-DD HH:MM:SS" 字符串解析为 datetime，空值或无法解析的值为 None。
+    整批交给 numpy 解析，只有存在非法值时才退回逐条 strptime。
+    """
+    values = [v if isinstance(v, str) else None for v in values]
+    try:
+        return np.array(values, dtype="datetime64[s]").tolist()
+    except ValueError:
+        pass
+    parsed = []
+    for v in values:
+        try:
+            parsed.append(datetime.datetime.strptime(v, "%Y-%m-%d %H:%M:%S") if v else None)
+        except ValueError:
+            parsed.append(None)
+    return parsed
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的哈希，用于判断导入清单中的文件是否变化。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def safe_json(val):
+    if isinstance(val, (dict, list)):
+        return json.dumps(val, ensure_ascii=False)
+    return val
 
 
 class DataPreprocessing:
@@ -9,138 +173,346 @@ class DataPreprocessing:
     数据预处理类，用于读取指定文件夹下的所有文件。
     """
 
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, stream=False, workers=1):
+        """
+        stream=True 时只读取 users.json，聊天记录不再一次性载入内存（self.msgs 为 None），
+        需要通过 iter_msgs() 逐个联系人读取，内存占用与导出数据的总大小无关。
+        workers 不为 1 时（None 表示 CPU 核数）使用多进程并行解析 JSON 文件：非流式模式一次解析全部文件，
+        流式模式由 iter_msgs 按顺序分批提交（见 iter_load_json_files）。
+        """
         self.folder_path = folder_path
+        self.stream = stream
+        self.workers = workers
         self.file_paths = self.read_all_files_in_folder()
-        self.users, self.msgs = self.read_users_and_msgs(self.file_paths)
+        self.msg_paths = {}
+        self.file_msgs = {}  # 聊天记录文件路径 -> 消息（非流式模式），同一联系人的多个文件都保留
+        self.file_meta = {}  # 聊天记录文件路径 -> 读取时的 size/mtime/hash
+        if stream:
+            self.users = self.read_users([p for p in self.file_paths if os.path.basename(p) == "users.json"])
+            self.msgs = None
+        else:
+            self.users, self.msgs = self.read_users_and_msgs(self.file_paths, workers=workers)
         self.wxid_list = [k for k in self.users.keys() if isinstance(k, str) and k.startswith("wxid_")]
 
     def read_all_files_in_folder(self):
         """
         读取指定文件夹下的所有文件（包括子文件夹中的文件），返回文件的完整路径列表。
-        先读取一级子目录，判断是否跳过，再递归读取。
+        先读取一级子目录，判断是否跳过，再递归读取。路径排序后返回，保证读取与合并顺序确定。
         """
         file_paths = []
         for direction in os.listdir(self.folder_path):
             dir_path = os.path.join(self.folder_path, direction)
             if not os.path.isdir(dir_path):
                 continue
-            if direction.startswith("gh_") or direction.startswith("@") or direction.endswith("@openim"):
+            if is_skipped_folder(direction):
                 continue
             for root, _, files in os.walk(dir_path):
                 file_paths += [os.path.join(root, file) for file in files]
-        return file_paths
+        return sorted(file_paths)
 
-    def read_users_and_msgs(self, paths, encoding="utf-8"):
+    def read_users_and_msgs(self, paths, encoding="utf-8", workers=1):
         """
         读取所有文件，将 users.json 文件内容存入 users，其余文件内容存入 msgs。
+        workers > 1 时（None 表示 CPU 核数）用进程池并行解析，结果按路径顺序合并，与串行读取一致。
         返回 (users, msgs) 两个字典。
         """
         users = {}
         msgs = {}
-        for path in paths:
-            try:
-                with open(path, "r", encoding=encoding) as f:
-                    id = os.path.basename(os.path.dirname(path))
-                    data = json.load(f)
-                    if os.path.basename(path) == "users.json":
-                        users[id] = data
-                    else:
-                        msgs[id] = data
-            except Exception:
-                if os.path.basename(path) == "users.json":
-                    users = None
-                else:
-                    msgs[path] = None
-
-        def process_users(raw_users):
-            """
-            从self.users中提取所有唯一的用户信息（以wxid为唯一标识）。
-            返回一个以wxid为key，用户信息为value的字典。
-            """
-            processed_users = {}
-            for user_dict in raw_users.values():
-                # user_dict 可能是一个包含多个用户的dict
-                for wxid, user_info in user_dict.items():
-                    if wxid not in processed_users:
-                        processed_users[wxid] = user_info
-            return processed_users
-        
+        if workers == 1 or len(paths) < 2:
+            results = (load_json_file(path, encoding) for path in paths)
+            self._merge_loaded(results, users, msgs)
+        else:
+            workers = workers or os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunksize = max(1, len(paths) // (workers * 8))
+                results = executor.map(load_json_file, paths, [encoding] * len(paths), chunksize=chunksize)
+                self._merge_loaded(results, users, msgs)
+
         def process_msgs(raw_msgs):
             ...
-        
-        users = process_users(users)
+
+        users = self.process_users(users)
 
         return users, msgs
+
+    def _merge_loaded(self, results, users, msgs):
+        """
+        按顺序合并 load_json_file 的结果，读取失败的 users.json 被跳过。
+        msgs 中每个联系人只保留最后一个文件，全部文件的消息按路径保存在 self.file_msgs 中（导入时使用）。
+        """
+        for path, data, ok, meta in results:
+            id = os.path.basename(os.path.dirname(path))
+            if os.path.basename(path) == "users.json":
+                if ok:
+                    users[id] = data
+            elif ok:
+                msgs[id] = data
+                self.msg_paths[id] = path
+                self.file_msgs[path] = data
+                self.file_meta[path] = meta
+            else:
+                msgs[path] = None
+
+    @staticmethod
+    def process_users(raw_users):
+        """
+        从self.users中提取所有唯一的用户信息（以wxid为唯一标识）。
+        返回一个以wxid为key，用户信息为value的字典。
+        """
+        processed_users = {}
+        for user_dict in raw_users.values():
+            # user_dict 可能是一个包含多个用户的dict
+            for wxid, user_info in user_dict.items():
+                if wxid not in processed_users:
+                    processed_users[wxid] = user_info
+        return processed_users
+
+    def read_users(self, paths, encoding="utf-8"):
+        """
+        只读取 users.json 文件，返回处理后的 users 字典（流式模式使用）。
+        """
+        users = {}
+        msgs = {}
+        self._merge_loaded((load_json_file(path, encoding) for path in paths), users, msgs)
+        return self.process_users(users)
+
+    @staticmethod
+    def iter_file_msgs(path, encoding="utf-8", meta=None):
+        """
+        逐条读取单个聊天记录文件中的消息。
+        安装了 ijson 且文件较大时增量解析，否则整体解码（优先 orjson）。
+        meta 为字典时写入读取时的 size/mtime/hash（见 read_file_bytes）：
+        整体解码时在产出第一条消息之前写入，增量解析时在读完文件后写入。
+        """
+        if is_big_file(path):
+            with open(path, "rb") as f:
+                mtime = os.fstat(f.fileno()).st_mtime
+                reader = HashingReader(f)
+                yield from ijson.items(reader, "item", use_float=True)
+                while reader.read(1024 * 1024):
+                    pass
+            if meta is not None:
+                meta.update(size=reader.size, mtime=mtime, hash=reader.digest.hexdigest())
+        else:
+            raw, file_meta = read_file_bytes(path)
+            if meta is not None:
+                meta.update(file_meta)
+            yield from decode_json(raw, encoding)
+
+    def iter_msgs(self, encoding="utf-8", lazy=False, exclude=()):
+        """
+        逐个文件读取聊天记录，每次 yield (id, path, msgs)，两种模式产出的文件集合相同
+        （同一联系人目录中的多个文件各产出一次）。
+        - 非流式模式下直接从 self.file_msgs 中取出；
+        - 流式模式下逐个解析文件，读取失败的文件会被跳过；workers 不为 1 时由进程池提前并行解析后续文件，
+          增量解析的大文件仍在当前进程中读取；exclude 中的文件不读取。
+        lazy=True 时在当前进程中读取的文件以生成器逐条产出消息，不会把整个文件的消息放进列表。
+        流式模式下读取时的 size/mtime/hash 写入 self.file_meta[path]（见 iter_file_msgs）。
+        """
+        if self.msgs is not None:
+            for path, msgs in self.file_msgs.items():
+                yield os.path.basename(os.path.dirname(path)), path, msgs
+            return
+
+        paths = [p for p in self.file_paths if os.path.basename(p) != "users.json" and p not in exclude]
+        if self.workers != 1 and len(paths) > 1:
+            loaded = iter_load_json_files(paths, encoding, self.workers, local=is_big_file)
+        else:
+            loaded = ((path, None, None, None) for path in paths)
+        for path, data, ok, meta in loaded:
+            id = os.path.basename(os.path.dirname(path))
+            if ok is None:
+                # 在当前进程中读取：串行模式或增量解析的大文件
+                meta = self.file_meta[path] = {}
+                if lazy:
+                    yield id, path, self.iter_file_msgs(path, encoding, meta)
+                    continue
+                try:
+                    msgs = list(self.iter_file_msgs(path, encoding, meta))
+                except Exception:
+                    continue
+                yield id, path, msgs
+            elif ok:
+                self.file_meta[path] = meta
+                yield id, path, data
     
-    def store_data_to_sqlite(self, engine, Session):
+    def iter_contacts(self, encoding="utf-8"):
         """
-        将预处理后的数据存储到SQLite数据库中。
-        需要实现具体的存储逻辑。
+        逐个联系人读取聊天记录，每次 yield (id, msgs)，每个联系人只出现一次。
+        与非流式载入的 self.msgs 一致：同一联系人目录中有多个文件时取按路径排序的最后一个可读文件。
+        - 非流式模式下直接从 self.msgs 中取出；
+        - 流式模式下 msgs 为生成器，在被迭代时才读取文件，调用方可以先根据 id 决定是否处理，
+          不处理的联系人不会读取任何文件。
         """
-        from sqlalchemy.exc import IntegrityError
-        import datetime
+        if self.msgs is not None:
+            for id, msgs in self.msgs.items():
+                if msgs is not None:
+                    yield id, msgs
+            return
 
-        with Session() as session:
-            # 存储用户数据
-            for wxid, user_info in self.users.items():
-                # 确保 user_info 是 dict
-                if not isinstance(user_info, dict):
+        paths_by_id = {}
+        for path in self.file_paths:
+            if os.path.basename(path) != "users.json":
+                paths_by_id.setdefault(os.path.basename(os.path.dirname(path)), []).append(path)
+
+        def read(paths):
+            for path in reversed(paths):
+                meta = self.file_meta[path] = {}
+                try:
+                    msgs = list(self.iter_file_msgs(path, encoding, meta))
+                except Exception:
                     continue
-                extra = user_info.get("ExtraBuf", {}) or {}
-                wx_user = WxUser(
-                    wxid=wxid,
-                    nickname=user_info.get("nickname"),
-                    remark=user_info.get("remark"),
-                    account=user_info.get("account"),
-                    describe=user_info.get("describe"),
-                    headImgUrl=user_info.get("headImgUrl"),
-                    gender=extra.get("性别[1男2女]", 0),
-                    signature=extra.get("个性签名", ""),
-                    country=extra.get("国", ""),
-                    province=extra.get("省", ""),
-                    city=extra.get("市", ""),
-                    mobile=extra.get("手机号", ""),
+                yield from msgs
+                return
+
+        for id, paths in paths_by_id.items():
+            yield id, read(paths)
+
+    @staticmethod
+    def user_to_row(wxid, user_info):
+        """
+        将 users.json 中的一条用户信息转换为 wx_user 表的一行。
+        """
+        extra = user_info.get("ExtraBuf", {}) or {}
+        return dict(
+            wxid=wxid,
+            nickname=user_info.get("nickname"),
+            remark=user_info.get("remark"),
+            account=user_info.get("account"),
+            describe=user_info.get("describe"),
+            headImgUrl=user_info.get("headImgUrl"),
+            gender=extra.get("性别[1男2女]", 0),
+            signature=extra.get("个性签名", ""),
+            country=extra.get("国", ""),
+            province=extra.get("省", ""),
+            city=extra.get("市", ""),
+            mobile=extra.get("手机号", ""),
+        )
+
+    @staticmethod
+    def msgs_to_rows(msgs):
+        """
+        将一批原始消息转换为 wx_msg 表的行，时间字段整批解析。
+        """
+        create_times = parse_create_times([msg.get("CreateTime") for msg in msgs])
+        rows = [
+            dict(
+                type_name=msg.get("type_name"),
+                is_sender=bool(msg.get("is_sender", 0)),
+                talker=msg.get("talker"),
+                room_name=msg.get("room_name"),
+                is_chatroom=is_chatroom_name(msg.get("room_name")),
+                msg=safe_json(msg.get("msg")),
+                src=safe_json(msg.get("src")),
+                extra=safe_json(msg.get("extra", {})),
+                CreateTime=create_time,
+            )
+            for msg, create_time in zip(msgs, create_times)
+        ]
+        for row in rows:
+            row["fingerprint"] = msg_fingerprint(
+                row["talker"], row["room_name"], row["is_sender"], row["type_name"], row["CreateTime"], row["msg"]
+            )
+        return rows
+
+    def store_data_to_sqlite(self, engine, Session=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        将预处理后的数据存储到SQLite数据库中，支持增量导入。
+        - 使用 Core 批量插入，不再逐条构造 ORM 对象；导入使用单独的连接并启用 INGEST_PRAGMAS，用完后丢弃（见 ingest_connection）；
+        - 用户逐行去重：wxid 已存在的行直接跳过，不会回滚其它数据；
+        - 导入清单 source_file 记录每个文件的 path/size/mtime/hash，大小与修改时间不变、
+          或内容哈希不变的文件直接跳过；
+        - 消息按指纹去重（ON CONFLICT DO NOTHING），重复导入只会追加新消息；
+        - 每批新消息在同一事务内累加进 pair_daily_stats；
+        - 消息按联系人逐个读取，每 batch_size 条一次 executemany 并提交，流式模式下内存占用有上界。
+        Session 参数仅为兼容旧调用保留。
+        """
+        with ingest_connection(engine) as conn:
+
+            # 存储用户数据
+            user_rows = [
+                self.user_to_row(wxid, user_info)
+                for wxid, user_info in (self.users or {}).items()
+                if isinstance(user_info, dict)  # 确保 user_info 是 dict
+            ]
+            if user_rows:
+                conn.execute(
+                    sqlite_insert(WxUser.__table__).on_conflict_do_nothing(index_elements=["wxid"]),
+                    user_rows,
                 )
-                session.add(wx_user)
+                conn.commit()
 
             # 存储消息数据
-            for msg_list in self.msgs.values():
-                for msg in msg_list:
-                    # 解析时间
-                    create_time = msg.get("CreateTime")
+            source_table = SourceFile.__table__
+            manifest = {row.path: row for row in conn.execute(select(source_table))}
+            msg_insert = sqlite_insert(WxMsg.__table__).on_conflict_do_nothing(index_elements=["fingerprint"])
+            source_upsert = sqlite_insert(source_table)
+            source_upsert = source_upsert.on_conflict_do_update(
+                index_elements=["path"],
+                set_={c: source_upsert.excluded[c] for c in ("size", "mtime", "hash", "msg_count", "ingested_at")},
+            )
+            # 流式模式下大小与修改时间都未变化的文件在读取之前跳过，并行解析时也不会提交给进程池
+            unchanged = set()
+            if self.msgs is None:
+                for path in self.file_paths:
+                    record = manifest.get(os.path.abspath(path))
+                    if record is None:
+                        continue
                     try:
-                        if create_time:
-                            create_time = datetime.datetime.strptime(create_time, "%Y-%m-%d %H:%M:%S")
-                        else:
-                            create_time = None
-                    except Exception:
-                        create_time = None
-
-
-                    def safe_json(val):
-                        if isinstance(val, (dict, list)):
-                            return json.dumps(val, ensure_ascii=False)
-                        return val
-
-                    wx_msg = WxMsg(
-                        type_name=msg.get("type_name"),
-                        is_sender=bool(msg.get("is_sender", 0)),
-                        talker=msg.get("talker"),
-                        room_name=msg.get("room_name"),
-                        msg=safe_json(msg.get("msg")),
-                        src=safe_json(msg.get("src")),
-                        extra=safe_json(msg.get("extra", {})),
-                        CreateTime=create_time
-                    )
-                    session.add(wx_msg)
-
-            try:
-                session.commit()
-            except IntegrityError as e:
-                session.rollback()
-                print("数据写入时发生唯一性冲突，部分数据未写入。")
-                print("详细错误信息：", e.orig)
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if record.size == stat.st_size and record.mtime == stat.st_mtime:
+                        unchanged.add(path)
+
+            skipped_files = len(unchanged)
+            ingested_files = new_msgs = 0
+            for id, path, msg_list in self.iter_msgs(lazy=True, exclude=unchanged):
+                record = manifest.get(os.path.abspath(path))
+                try:
+                    # 清单按读取时的 size/mtime/hash 判断与记录：非流式模式在载入时已取得，
+                    # 流式模式在开始读取文件时取得（增量解析的大文件在读完后取得）
+                    # 取出第一条消息，使流式读取先完成读文件与计算哈希
+                    msg_iter = iter(msg_list)
+                    head = list(islice(msg_iter, 1))
+                    meta = self.file_meta.get(path) or {}
+                    if record is not None and meta.get("size") == record.size and meta.get("mtime") == record.mtime:
+                        skipped_files += 1
+                        continue
+                    # 增量解析的大文件此时尚无哈希，单独计算一次只用于跳过判断，清单仍记录读取时的哈希
+                    digest = meta.get("hash") or (file_hash(path) if record is not None else None)
+                    if record is not None and record.hash == digest:
+                        conn.execute(
+                            source_table.update().where(source_table.c.path == record.path)
+                            .values(mtime=meta.get("mtime", record.mtime))
+                        )
+                        conn.commit()
+                        skipped_files += 1
+                        continue
+                    msg_iter = itertools.chain(head, msg_iter)
+
+                    msg_count = 0
+                    for batch in iter_batches(msg_iter, batch_size):
+                        last_id = max_msg_id(conn)
+                        result = conn.execute(msg_insert, self.msgs_to_rows(batch))
+                        # 只有真正插入的新消息（id > last_id）会累加进每日统计表
+                        aggregate_pair_daily_stats(conn, after_id=last_id)
+                        new_msgs += max(result.rowcount, 0)
+                        msg_count += len(batch)
+                        conn.commit()
+                    meta = self.file_meta[path]
+                    conn.execute(source_upsert, dict(
+                        path=os.path.abspath(path), size=meta["size"], mtime=meta["mtime"], hash=meta["hash"],
+                        msg_count=msg_count, ingested_at=datetime.datetime.now(),
+                    ))
+                    conn.commit()
+                    ingested_files += 1
+                except Exception as e:
+                    conn.rollback()
+                    print(f"写入 {path} 的消息失败，已跳过。")
+                    print("详细错误信息：", e)
+
+            print(f"导入完成：新导入文件 {ingested_files} 个，跳过未变化文件 {skipped_files} 个，新增消息 {new_msgs} 条。")
 
 
 # 示例用法
@@ -148,3 +520,8 @@ if __name__ == "__main__":
     dp = DataPreprocessing(r"/Users/lige/data/DYKYRSC/wechat/json")
     print("users:", type(dp.users), len(dp.users) if dp.users else 0)
     print("msgs:", type(dp.msgs), len(dp.msgs))
+
+    # 流式模式：逐个联系人读取
+    dp = DataPreprocessing(r"/Users/lige/data/DYKYRSC/wechat/json", stream=True)
+    for id, path, msgs in dp.iter_msgs():
+        print(id, len(msgs))
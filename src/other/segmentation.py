@@ -0,0 +1,166 @@
+import os
+import re
+import atexit
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import jieba
+
+# 关键词统计时过滤的停用词与标点（模块级常量，只构建一次）
+STOPWORDS = frozenset([
+    "我", "你", "的", "了", "在", "是", "和", "也", "有", "就", "不", "都", "吗", "啊", "吧", "哦", "呢", "着", "很", "还", "但", "与", "及", "或", "被", "为", "到", "说", "要", "会", "去", "他", "她", "它", "我们", "他们", "你们", "自己"
+])
+PUNCTUATION = frozenset("，。！？、；：“”‘’（）《》〈〉【】[]{}——-…,.!?;:\"'()<>[]{}")
+WORD_PATTERN = re.compile(r'\w')
+
+# 每批分词的消息数；消息数不足两批时在当前进程分词，不启动进程池
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def is_valid_word(word):
+    return word not in STOPWORDS and word not in PUNCTUATION and WORD_PATTERN.match(word) is not None
+
+
+def tokenizer_version(hmm=True):
+    """
+    分词结果的版本标识：jieba 版本、HMM 开关与过滤规则，任一变化都会使分词缓存失效。
+    """
+    rules = "|".join(sorted(STOPWORDS)) + "|" + "".join(sorted(PUNCTUATION)) + "|" + WORD_PATTERN.pattern
+    digest = hashlib.blake2b(rules.encode("utf-8"), digest_size=4).hexdigest()
+    return f"jieba-{jieba.__version__}-hmm{int(hmm)}-{digest}"
+
+
+def init_worker():
+    """
+    进程池的初始化函数：每个子进程只加载一次 jieba 词典。
+    """
+    jieba.setLogLevel(jieba.logging.WARNING)
+    jieba.initialize()
+
+
+def count_tokens(items, hmm=True):
+    """
+    对一批消息分词并统计有效词的词频，返回 Counter。items 为 (消息, 出现次数) 列表。
+    - 出现次数相同的消息以换行拼接后一次调用 jieba（换行是 jieba 的分隔符，词不会跨消息），
+      词频再乘以出现次数，重复的消息（“好的”“哈哈哈”等）只分词一次；
+    - 先统计全部词频，再对不重复的词做一次过滤，过滤代价与词表大小相关而不是与词数相关。
+    hmm=False 时关闭 jieba 的新词发现，分词速度约快一倍，但未登录词会被切成单字。
+    """
+    by_repeat = {}
+    for text, repeat in items:
+        by_repeat.setdefault(repeat, []).append(text)
+    counts = Counter()
+    for repeat, texts in by_repeat.items():
+        batch = Counter(jieba.lcut("\n".join(texts), HMM=hmm))
+        if repeat != 1:
+            batch = Counter({word: c * repeat for word, c in batch.items()})
+        counts.update(batch)
+    for word in [w for w in counts if not is_valid_word(w)]:
+        del counts[word]
+    return counts
+
+
+def tokenize_batch(texts, hmm=True):
+    """
+    对一批消息分词，返回与 texts 对齐的过滤后词列表（用于写入分词缓存）。
+    消息内的换行先替换为空格（都是 jieba 的分隔符，分词结果不变），
+    再以换行拼接后一次调用 jieba，按换行切回各条消息。
+    """
+    result = [[]]
+    valid = {}
+    joined = "\n".join(t.replace("\r", " ").replace("\n", " ") for t in texts)
+    for word in jieba.cut(joined, HMM=hmm):
+        if word == "\n":
+            result.append([])
+            continue
+        ok = valid.get(word)
+        if ok is None:
+            ok = valid[word] = is_valid_word(word)
+        if ok:
+            result[-1].append(word)
+    return result if texts else []
+
+
+def segment_tokens(texts, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, hmm=True):
+    """
+    批量分词，返回与 texts 对齐的词列表；消息足够多时分发到共享进程池。
+    """
+    texts = list(texts)
+    if workers <= 1 or len(texts) < batch_size * 2:
+        return tokenize_batch(texts, hmm=hmm)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    result = []
+    for tokens in get_executor(workers).map(partial(tokenize_batch, hmm=hmm), batches):
+        result.extend(tokens)
+    return result
+
+
+def get_executor(workers=DEFAULT_WORKERS):
+    """
+    进程级共享的分词进程池，按需创建，多个线程（如 WxidProcessor 的工作线程）共用，
+    避免每个联系人重复启动进程并加载词典。
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+            _executor_workers = workers
+        return _executor
+
+
+def shutdown_executor():
+    """
+    关闭共享的分词进程池（之后再分词会重新创建）。进程退出时通过 atexit 自动调用，
+    长时间运行的调用方可以在分词结束后主动调用，尽早释放子进程。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+atexit.register(shutdown_executor)
+
+
+def segment_counts(texts, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE, hmm=True, cache=None):
+    """
+    批量分词并统计词频。相同的消息先合并计数，再按 batch_size 分批；
+    workers > 1 且消息足够多时分发到共享进程池。
+    cache 为 TokenCache 时先批量读取已缓存的分词结果，只对未命中的消息分词并写回缓存。
+    """
+    repeats = Counter(texts)
+    if cache is None:
+        items = list(repeats.items())
+        if workers <= 1 or len(items) < batch_size * 2:
+            return count_tokens(items, hmm=hmm)
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        total = Counter()
+        for counts in get_executor(workers).map(partial(count_tokens, hmm=hmm), batches):
+            total.update(counts)
+        return total
+
+    version = tokenizer_version(hmm)
+    tokens = cache.get_many(repeats, version)
+    missing = [text for text in repeats if text not in tokens]
+    if missing:
+        segmented = dict(zip(missing, segment_tokens(missing, workers=workers, batch_size=batch_size, hmm=hmm)))
+        cache.put_many(segmented, version)
+        tokens.update(segmented)
+    total = Counter()
+    for text, repeat in repeats.items():
+        if repeat == 1:
+            total.update(tokens[text])
+        else:
+            for word in tokens[text]:
+                total[word] += repeat
+    return total
@@ -0,0 +1,206 @@
+import numpy as np
+from sqlalchemy import func
+from other.database import PairDailyStat
+from other.graph_core import GraphCore, top_n
+
+# 时间粒度 -> numpy datetime64 单位
+INTERVAL_UNITS = {
+    "day": "D",
+    "week": "W",
+    "month": "M",
+    "year": "Y",
+}
+
+
+class TemporalGraph:
+    """
+    DataGraph 的按时间切片视图：把 pair_daily_stats 的每日消息数按 interval（默认月）汇总到图中的每条边上。
+    - 按时间段存储（CSR）：period_ptr[p]:period_ptr[p+1] 为第 p 个时间段内有消息的边 entry_edge 及其权重 entry_weight，
+      任意时间窗口只需读取窗口内的条目，代价为 O(窗口内的边数)，不再扫描消息表；
+    - 按边存储累计和：edge_ptr[e]:edge_ptr[e+1] 为第 e 条边有消息的时间段 edge_period（升序）及累计消息数 edge_cumsum，
+      查询单条边在任意窗口内的权重为 O(log P)。
+    边的下标与 graph.core 一致，端点规则与 DataGraph.add_edges_to_net 相同；
+    但私聊边的权重为双方消息数之和（graph.core 中同一对节点只保留最先加入的那个方向的权重）。
+    """
+
+    def __init__(self, graph, interval="month"):
+        self.graph = graph
+        self.core = graph.core
+        self.interval = interval
+        self.unit = INTERVAL_UNITS[interval]
+
+        edges, periods, weights = self.load_edge_periods()
+        # 时间段编号为相对最早时间段的偏移，periods[p] 为第 p 个时间段的起点
+        if len(periods):
+            self.start = periods.min()
+            self.periods = np.arange(self.start, periods.max() + 1)
+            period_code = (periods - self.start).astype(np.int64)
+        else:
+            self.start = None
+            self.periods = np.zeros(0, dtype=f"datetime64[{self.unit}]")
+            period_code = np.zeros(0, dtype=np.int64)
+        num_periods = len(self.periods)
+
+        # 按时间段排序
+        order = np.lexsort((edges, period_code))
+        self.entry_edge = edges[order]
+        self.entry_weight = weights[order]
+        self.period_ptr = np.zeros(num_periods + 1, dtype=np.int64)
+        np.cumsum(np.bincount(period_code, minlength=num_periods), out=self.period_ptr[1:])
+
+        # 按边排序，并计算每条边的累计和
+        order = np.lexsort((period_code, edges))
+        self.edge_period = period_code[order]
+        self.edge_cumsum = np.cumsum(weights[order])
+        self.edge_ptr = np.zeros(self.core.num_edges + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edges, minlength=self.core.num_edges), out=self.edge_ptr[1:])
+
+    def load_edge_periods(self):
+        """
+        一次查询读取每个 (talker, room_name, 日期) 的消息数，换算为 (边下标, 时间段, 权重) 三个数组，
+        同一条边同一时间段的多行合并。合并图按来源账号逐个读取（私聊边的端点取各自的 master）。
+        """
+        core = self.core
+        edges, days, weights = [], [], []
+        for source in self.graph.sources:
+            rows = (
+                source.session.query(
+                    PairDailyStat.talker,
+                    PairDailyStat.room_name,
+                    PairDailyStat.is_chatroom,
+                    PairDailyStat.day,
+                    func.sum(PairDailyStat.msg_count),
+                )
+                .filter(PairDailyStat.day != "")
+                .group_by(PairDailyStat.talker, PairDailyStat.room_name, PairDailyStat.is_chatroom, PairDailyStat.day)
+                .all()
+            )
+            # 私聊边为 master - 联系人，群聊边为 发言人 - 群聊
+            a = [room_name if is_chatroom else source.master for _, room_name, is_chatroom, _, _ in rows]
+            b = [talker if is_chatroom else room_name for talker, room_name, is_chatroom, _, _ in rows]
+            edge = core.find_edges(a, b)
+            found = edge >= 0
+            edges.append(edge[found])
+            days.append(np.array([day for _, _, _, day, _ in rows], dtype="datetime64[D]")[found])
+            weights.append(np.array([count for _, _, _, _, count in rows], dtype=np.int64)[found])
+
+        edges = np.concatenate(edges) if edges else np.zeros(0, dtype=np.int64)
+        periods = np.concatenate(days).astype(f"datetime64[{self.unit}]") if days else np.zeros(0, dtype="datetime64[D]")
+        weights = np.concatenate(weights) if weights else np.zeros(0, dtype=np.int64)
+        if len(edges) == 0:
+            return edges, periods.astype(f"datetime64[{self.unit}]"), weights
+
+        # 同一条边同一时间段合并
+        period_code = (periods - periods.min()).astype(np.int64)
+        num_periods = int(period_code.max()) + 1
+        keys, inverse = np.unique(edges * num_periods + period_code, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights, minlength=len(keys)).astype(np.int64)
+        return keys // num_periods, periods.min() + (keys % num_periods), weights
+
+    def period_index(self, value, end=False):
+        """
+        把 '2023-03' / '2023-03-15' / datetime64 等换算为时间段下标。
+        end=True 时返回该时间段之后的下标（窗口右端包含该时间段）。
+        """
+        if self.start is None:
+            return 0
+        if value is None:
+            return len(self.periods) if end else 0
+        p = int((np.datetime64(value).astype(f"datetime64[{self.unit}]") - self.start).astype(np.int64))
+        return min(max(p + 1 if end else p, 0), len(self.periods))
+
+    def window(self, start=None, end=None):
+        """
+        时间窗口 [start, end]（两端包含，按时间段对齐，为空表示不限）内每条有消息的边及其消息数。
+        返回 (edges, weights)，只读取窗口内的条目。
+        """
+        lo = self.period_ptr[self.period_index(start)]
+        hi = self.period_ptr[max(self.period_index(end, end=True), self.period_index(start))]
+        edges, inverse = np.unique(self.entry_edge[lo:hi], return_inverse=True)
+        weights = np.bincount(inverse, weights=self.entry_weight[lo:hi], minlength=len(edges)).astype(np.int64)
+        return edges, weights
+
+    def edge_weight(self, e, start=None, end=None):
+        """
+        第 e 条边在时间窗口内的消息数，由累计和二分查找得到，O(log P)。
+        """
+        lo, hi = self.edge_ptr[e], self.edge_ptr[e + 1]
+        periods, cumsum = self.edge_period[lo:hi], self.edge_cumsum[lo:hi]
+        before = self.edge_cumsum[lo - 1] if lo > 0 else 0
+
+        def upto(p):
+            k = np.searchsorted(periods, p)
+            return cumsum[k - 1] if k > 0 else before
+
+        return int(upto(self.period_index(end, end=True)) - upto(self.period_index(start)))
+
+    def totals(self):
+        """
+        每个时间段的消息总数与累计消息总数，返回 (periods, counts, cumulative)。
+        """
+        counts = np.add.reduceat(self.entry_weight, self.period_ptr[:-1]) if len(self.entry_weight) else np.zeros(0)
+        counts = np.where(np.diff(self.period_ptr) > 0, counts, 0).astype(np.int64)
+        return self.periods, counts, np.cumsum(counts)
+
+    def window_core(self, start=None, end=None):
+        """
+        时间窗口内的图：节点与 graph.core 相同，只保留窗口内有消息的边，权重为窗口内的消息数。
+        """
+        edges, weights = self.window(start, end)
+        state = self.core.to_state()
+        state.update(
+            src=self.core.src[edges],
+            dst=self.core.dst[edges],
+            weight=weights,
+            edge_group=self.core.edge_group[edges],
+        )
+        return GraphCore.from_state(state)
+
+    def window_graph(self, start=None, end=None):
+        """
+        时间窗口内的 DataGraph，可直接 visualize / 社区发现，如 window_graph('2023-03', '2023-09')。
+        """
+        return self.graph.with_core(self.window_core(start, end))
+
+    def node_weights(self, start=None, end=None):
+        edges, weights = self.window(start, end)
+        n = self.core.num_nodes
+        return np.bincount(self.core.src[edges], weights=weights, minlength=n) + np.bincount(
+            self.core.dst[edges], weights=weights, minlength=n
+        )
+
+    def diff(self, before, after, n=10, group="user"):
+        """
+        比较两个时间窗口（均为 (start, end) 元组）中每个节点的消息数：
+        - drifted：消息数下降最多的 N 个节点（渐渐疏远的联系人）
+        - growing：消息数增加最多的 N 个节点
+        group 为节点类型（user / chatroom，None 为不限）；master 不参与排名。
+        """
+        core = self.core
+        weight_before = self.node_weights(*before)
+        weight_after = self.node_weights(*after)
+        change = weight_after - weight_before
+        candidates = np.ones(core.num_nodes, dtype=bool)
+        if group is not None:
+            candidates &= core.node_group == (core.group_names.index(group) if group in core.group_names else -1)
+        for master in self.graph.masters:
+            if master in core.index:
+                candidates[core.index[master]] = False
+
+        def ranking(values):
+            values = np.where(candidates, values, 0)
+            return [
+                {
+                    "id": core.ids[i],
+                    "label": self.graph.node_label(core.ids[i]),
+                    "before": int(weight_before[i]),
+                    "after": int(weight_after[i]),
+                    "change": int(change[i]),
+                }
+                for i in top_n(values, n) if values[i] > 0
+            ]
+
+        return {
+            "drifted": ranking(-change),
+            "growing": ranking(change),
+        }
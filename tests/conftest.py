@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import random
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+MASTER = "wxid_master"
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def make_msg(talker, room_name, is_sender, msg, create_time):
+    return {
+        "type_name": "文本",
+        "is_sender": is_sender,
+        "talker": talker,
+        "room_name": room_name,
+        "msg": msg,
+        "src": "",
+        "extra": {},
+        "CreateTime": create_time,
+    }
+
+
+def make_export(root, n_users=8, n_rooms=3, seed=1):
+    """
+    生成一份小的合成导出数据：users/users.json、每个联系人一个私聊文件、若干群聊与一个应跳过的公众号目录。
+    """
+    rng = random.Random(seed)
+    users = {MASTER: {"wxid": MASTER, "nickname": "me", "ExtraBuf": {"性别[1男2女]": 1, "国": "CN", "省": "ZJ", "市": "HZ"}}}
+    texts = ["你好啊", "今天吃什么", "哈哈哈", "我们去杭州玩吧"]
+    for i in range(n_users):
+        wxid = f"wxid_u{i}"
+        users[wxid] = {"wxid": wxid, "nickname": f"u{i}", "ExtraBuf": {"性别[1男2女]": i % 3, "国": "CN", "省": "JS", "市": "NJ"}}
+        msgs = []
+        for j in range(rng.randint(3, 20)):
+            sender = rng.random() < 0.5
+            msgs.append(make_msg(
+                MASTER if sender else wxid, wxid, int(sender), rng.choice(texts),
+                f"2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {j % 24:02d}:{rng.randint(0, 59):02d}:00",
+            ))
+        write_json(os.path.join(root, wxid, f"{wxid}.json"), msgs)
+    for r in range(n_rooms):
+        room = f"{r}@chatroom"
+        msgs = [
+            make_msg(f"wxid_u{rng.randrange(n_users)}", room, 0, "群消息", f"2023-{rng.randint(1, 12):02d}-01 10:{k:02d}:00")
+            for k in range(30)
+        ]
+        write_json(os.path.join(root, room, f"{room}.json"), msgs)
+    write_json(os.path.join(root, "gh_x", "a.json"), [])
+    write_json(os.path.join(root, "users", "users.json"), users)
+    return root
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    return make_export(str(tmp_path / "export"))
+
+
+@pytest.fixture
+def database(tmp_path):
+    from other.database import init_database
+    engine, Session = init_database(f"sqlite:///{tmp_path / 'wxdata.db'}")
+    yield engine, Session
+    engine.dispose()
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import func
+from analyzer import GraphAnalyzer
+from other.database import WxMsg
+from other.graph import DataGraph
+from other.preprocessing import DataPreprocessing
+from conftest import MASTER
+
+
+@pytest.fixture
+def graph(export_dir, database, tmp_path):
+    engine, Session = database
+    DataPreprocessing(export_dir, stream=True).store_data_to_sqlite(engine, Session)
+    return DataGraph(Session, MASTER, cache_dir=str(tmp_path / "cache"))
+
+
+def test_top_contacts_count_both_directions(graph):
+    session = graph.session
+    result = GraphAnalyzer([graph]).analyze_top_n_contacts(n=100)
+    assert result["top_users"]
+    for entry in result["top_users"]:
+        wxid = entry["id"]
+        private = session.query(func.count()).filter(WxMsg.room_name == wxid).scalar()
+        chatroom = session.query(func.count()).filter(WxMsg.talker == wxid, WxMsg.is_chatroom).scalar()
+        assert entry["count"] == private + chatroom, wxid
+    counts = [entry["count"] for entry in result["top_users"]]
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_top_chatrooms_count_all_members(graph):
+    session = graph.session
+    result = GraphAnalyzer([graph]).analyze_top_n_contacts(n=100)
+    assert result["top_chatrooms"]
+    for entry in result["top_chatrooms"]:
+        total = session.query(func.count()).filter(WxMsg.room_name == entry["id"]).scalar()
+        assert entry["count"] == total
@@ -0,0 +1,66 @@
+from sqlalchemy import text
+from other.cache import TokenCache, ResponseCache
+
+
+def real_bytes(cache):
+    with cache.engine.connect() as conn:
+        return conn.execute(text(f"SELECT COALESCE(SUM(size), 0) FROM {cache.table}")).scalar()
+
+
+def test_token_cache_hits_and_versions(tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.db"))
+    cache.put_many({"你好啊": ["你好"], "哈哈哈": []}, "v1")
+    assert cache.get_many(["你好啊", "哈哈哈", "没见过"], "v1") == {"你好啊": ["你好"], "哈哈哈": []}
+    assert cache.get_many(["你好啊"], "v2") == {}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["bytes"] == real_bytes(cache)
+
+    # 重复写入不改变总大小
+    cache.put_many({"你好啊": ["你好"]}, "v1")
+    assert cache.stats()["bytes"] == real_bytes(cache)
+
+
+def test_token_cache_evicts_least_recently_used(tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.db"), max_bytes=2000)
+    for i in range(40):
+        cache.put_many({f"消息{i}": [f"词{i}"] * 5}, "v1")
+        cache.get_many(["消息0"], "v1")  # 持续使用的条目不被淘汰
+    assert cache.total_bytes == real_bytes(cache) <= 2000
+    found = cache.get_many([f"消息{i}" for i in range(40)], "v1")
+    assert "消息0" in found and "消息39" in found
+    assert "消息1" not in found
+
+
+def test_token_cache_size_survives_reopen(tmp_path):
+    path = str(tmp_path / "tokens.db")
+    cache = TokenCache(path)
+    cache.put_many({f"m{i}": ["a", "b"] for i in range(10)}, "v1")
+    assert TokenCache(path).total_bytes == cache.total_bytes
+
+
+def test_response_cache_roundtrip_and_bypass(tmp_path):
+    path = str(tmp_path / "llm.db")
+    cache = ResponseCache(path)
+    assert cache.get("prompt", "model") is None
+    cache.put("prompt", "model", "raw", {"nodes": [1]})
+    assert cache.get("prompt", "model") == {"nodes": [1]}
+    assert cache.get("prompt", "other-model") is None
+
+    # 覆盖时只累加大小差值
+    cache.put("prompt", "model", "raw" * 100, {"nodes": [2]})
+    assert cache.total_bytes == real_bytes(cache)
+    assert cache.get("prompt", "model") == {"nodes": [2]}
+
+    bypass = ResponseCache(path, bypass=True)
+    assert bypass.get("prompt", "model") is None
+    assert bypass.stats()["bypass"] is True
+
+
+def test_response_cache_evicts(tmp_path):
+    cache = ResponseCache(str(tmp_path / "llm.db"), max_bytes=3000)
+    for i in range(30):
+        cache.put(f"prompt{i}", "model", "x" * 100, {"i": i})
+    assert cache.total_bytes == real_bytes(cache) <= 3000
+    assert cache.get("prompt0", "model") is None
+    assert cache.get("prompt29", "model") == {"i": 29}
@@ -0,0 +1,110 @@
+import pytest
+from pyvis.network import Network
+from other.community import detect_communities
+from other.database import WxUser, WxMsg
+from other.graph import DataGraph
+from other.graph_core import GraphCore, merge_cores
+from other.preprocessing import DataPreprocessing
+from conftest import MASTER
+
+
+def baseline_edges(session, master):
+    """
+    原先的建图方式：逐对 COUNT(*) 查询 wx_msg，边加入 pyvis Network（同一对节点只保留第一条边）。
+    """
+    net = Network()
+    for user in session.query(WxUser).filter(~WxUser.wxid.like('%@chatroom')).all():
+        net.add_node(user.wxid, group='user')
+    for (room_name,) in session.query(WxMsg.room_name).filter(WxMsg.room_name.like('%@chatroom')).distinct():
+        net.add_node(room_name, group='chatroom')
+
+    def pairs(chatroom):
+        condition = WxMsg.room_name.like('%@chatroom')
+        rows = session.query(WxMsg.talker, WxMsg.room_name).filter(condition if chatroom else ~condition)
+        return [
+            (talker, room_name) for talker, room_name in rows.group_by(WxMsg.talker, WxMsg.room_name)
+            if talker in net.node_ids and room_name in net.node_ids
+        ]
+
+    def weight(talker, room_name):
+        return session.query(WxMsg).filter(WxMsg.talker == talker, WxMsg.room_name == room_name).count()
+
+    for talker, room_name in pairs(chatroom=False):
+        ends = (master, room_name) if talker == master else (room_name, master)
+        net.add_edge(*ends, weight=weight(talker, room_name), group='private_msg')
+    for talker, room_name in pairs(chatroom=True):
+        net.add_edge(talker, room_name, weight=weight(talker, room_name), group='chatroom_msg')
+    return sorted((e['from'], e['to'], e['weight'], e['group']) for e in net.edges)
+
+
+def core_edges(core):
+    return sorted(
+        (core.ids[s], core.ids[d], int(w), core.edge_group_names[g])
+        for s, d, w, g in zip(core.src, core.dst, core.weight, core.edge_group)
+    )
+
+
+@pytest.fixture
+def graph(export_dir, database, tmp_path):
+    engine, Session = database
+    DataPreprocessing(export_dir, stream=True).store_data_to_sqlite(engine, Session)
+    return DataGraph(Session, MASTER, cache_dir=str(tmp_path / "cache"))
+
+
+def test_edges_match_baseline(graph):
+    expected = baseline_edges(graph.session, MASTER)
+    assert expected
+    assert core_edges(graph.core) == expected
+
+
+def test_graph_cache_roundtrip(graph, database, tmp_path):
+    _, Session = database
+    cached = DataGraph(Session, MASTER, cache_dir=str(tmp_path / "cache"))
+    assert cached.core.ids == graph.core.ids
+    assert core_edges(cached.core) == core_edges(graph.core)
+
+
+def test_add_edges_keeps_first_undirected_edge():
+    core = GraphCore()
+    core.add_nodes(["a", "b", "c"], group="user")
+    core.add_edges(["a", "b", "a", "x"], ["b", "a", "c", "a"], [1, 2, 3, 4], group="g")
+    assert core_edges(core) == [("a", "b", 1, "g"), ("a", "c", 3, "g")]
+
+
+def test_merge_cores_sums_shared_edges():
+    first, second = GraphCore(), GraphCore()
+    first.add_nodes(["a", "b"], group="user")
+    first.add_edges(["a"], ["b"], [2], group="g")
+    second.add_nodes(["b", "a", "c"], group="user")
+    second.add_edges(["b", "b"], ["a", "c"], [3, 5], group="g")
+    merged, source_weight = merge_cores([first, second])
+    assert core_edges(merged) == [("a", "b", 5, "g"), ("b", "c", 5, "g")]
+    assert source_weight.sum(axis=0).tolist() == [2, 8]
+
+
+def test_merge_requires_graphs():
+    with pytest.raises(ValueError):
+        DataGraph.merge([])
+
+
+@pytest.mark.parametrize("method", ["louvain", "label_propagation"])
+def test_communities_split_two_cliques(method):
+    core = GraphCore()
+    names = [f"n{i}" for i in range(8)]
+    core.add_nodes(names, group="user")
+    src, dst = [], []
+    for block in (names[:4], names[4:]):
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                src.append(a)
+                dst.append(b)
+    src.append("n0")
+    dst.append("n4")
+    core.add_edges(src, dst, [5] * (len(src) - 1) + [1], group="g")
+
+    result = detect_communities(core, method=method)
+    labels = result["labels"]
+    assert len(set(labels[:4])) == 1 and len(set(labels[4:])) == 1
+    assert labels[0] != labels[4]
+    assert result["num_communities"] == 2
+    assert result["modularity"] > 0.3
@@ -0,0 +1,57 @@
+import time
+from other.journal import JobJournal, DONE, FAILED, PENDING, RUNNING
+
+
+def test_resume_after_close(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    journal = JobJournal(path)
+    for wxid in ("a", "b", "c", "d"):
+        journal.mark_pending(wxid)
+    journal.start("a")
+    journal.finish("a")
+    journal.start("b")
+    journal.fail("b", RuntimeError("boom"))
+    journal.start("c")  # 中断时仍在运行
+    journal.close()
+
+    resumed = JobJournal(path)
+    assert resumed.done_wxids() == {"a"}
+    assert [resumed.state(w) for w in "abcd"] == [DONE, FAILED, RUNNING, PENDING]
+    assert [w for w in "abcde" if resumed.is_unfinished(w)] == ["b", "c", "d", "e"]
+    assert [w for w in "abcde" if resumed.is_unfinished(w, retry_failed_only=True)] == ["b"]
+    assert resumed.jobs["b"]["attempts"] == 1
+    assert resumed.jobs["b"]["last_error"] == "boom"
+
+    # 重试时保留尝试次数与错误信息
+    resumed.mark_pending("b")
+    resumed.start("b")
+    resumed.finish("b")
+    resumed.close()
+    again = JobJournal(path)
+    assert again.done_wxids() == {"a", "b"}
+    assert again.jobs["b"]["attempts"] == 2
+    assert again.summary() == {PENDING: 1, RUNNING: 1, DONE: 2, FAILED: 0}
+    again.close()
+
+
+def test_batch_flush_without_close(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    journal = JobJournal(path, batch_size=3, flush_interval=3600)
+    for wxid in ("a", "b"):
+        journal.mark_pending(wxid)
+    assert JobJournal(path).jobs == {}
+    journal.mark_pending("c")
+    assert set(JobJournal(path).jobs) == {"a", "b", "c"}
+    journal.close()
+
+
+def test_timer_flush_without_state_changes(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    journal = JobJournal(path, batch_size=1000, flush_interval=0.05)
+    journal.mark_pending("a")
+    journal.start("a")
+    deadline = time.monotonic() + 5
+    while JobJournal(path).state("a") != RUNNING and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert JobJournal(path).state("a") == RUNNING
+    journal.close()
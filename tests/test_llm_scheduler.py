@@ -0,0 +1,110 @@
+import sys
+import types
+import pytest
+
+# llm 在导入时引用 google-genai 与 pandas，调度器本身不依赖它们；测试环境没有安装时用空模块代替
+for name in ("google", "google.genai", "pandas"):
+    try:
+        __import__(name)
+    except ImportError:
+        sys.modules[name] = types.ModuleType(name)
+if not hasattr(sys.modules["google"], "genai"):
+    sys.modules["google"].genai = sys.modules["google.genai"]
+
+import llm
+from llm import GeminiApiPOOL, KeyState, classify_error, MIN_HEALTH
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class ApiError(Exception):
+    def __init__(self, code=None, status=None):
+        super().__init__(f"{code} {status}")
+        self.code = code
+        self.status = status
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm.time, "monotonic", clock)
+    return clock
+
+
+def make_pool(keys, rpm=None, tpm=None):
+    pool = GeminiApiPOOL.__new__(GeminiApiPOOL)
+    pool.api_keys = list(keys)
+    pool.condition = llm.threading.Condition()
+    pool.states = [KeyState(key, rpm, tpm) for key in keys]
+    return pool
+
+
+def test_classify_error_by_status():
+    assert classify_error(ApiError(429)) == "rate_limit"
+    assert classify_error(ApiError(403)) == "auth"
+    assert classify_error(ApiError(503)) == "server"
+    assert classify_error(ApiError(400)) == "other"
+    assert classify_error(ApiError(status="RESOURCE_EXHAUSTED")) == "rate_limit"
+    assert classify_error(ConnectionError("reset")) == "server"
+    # 不按错误消息文本判断
+    assert classify_error(RuntimeError("429 quota exceeded")) == "other"
+
+
+def test_rate_limited_key_cools_down_and_recovers(clock):
+    pool = make_pool(["key-aaaa", "key-bbbb"])
+    lease, _ = pool.try_acquire()
+    first = lease.state
+    lease.release(error=ApiError(429))
+    assert first.cooldown_until == clock.now + llm.ERROR_COOLDOWNS["rate_limit"]
+
+    # 冷却中的 key 不会被选中
+    for _ in range(3):
+        lease, _ = pool.try_acquire()
+        assert lease.state is not first
+        lease.release(tokens_used=10)
+
+    # 冷却结束后重新可用，健康分随时间恢复
+    health = first.current_health(clock.now)
+    assert health < 1.0
+    clock.now += llm.ERROR_COOLDOWNS["rate_limit"] + 1
+    assert first.current_health(clock.now) > max(health, MIN_HEALTH)
+    leases = [pool.try_acquire()[0] for _ in range(2)]
+    assert {l.state for l in leases} == set(pool.states)
+
+
+def test_all_keys_cooling_returns_wait(clock):
+    pool = make_pool(["key-aaaa"])
+    lease, _ = pool.try_acquire()
+    lease.release(error=ApiError(429))
+    lease, wait = pool.try_acquire()
+    assert lease is None
+    assert wait == pytest.approx(llm.ERROR_COOLDOWNS["rate_limit"])
+
+    # 连续限流时冷却时间加倍
+    clock.now += wait
+    lease, _ = pool.try_acquire()
+    lease.release(error=ApiError(429))
+    assert pool.states[0].cooldown_until == clock.now + 2 * llm.ERROR_COOLDOWNS["rate_limit"]
+
+    # 成功调用后连续错误清零
+    clock.now = pool.states[0].cooldown_until
+    lease, _ = pool.try_acquire()
+    lease.release(tokens_used=5)
+    assert pool.states[0].consecutive_errors == 0
+
+
+def test_rpm_limit_waits_for_refill(clock):
+    pool = make_pool(["key-aaaa"], rpm=2)
+    for _ in range(2):
+        pool.try_acquire()[0].release(tokens_used=1)
+    lease, wait = pool.try_acquire()
+    assert lease is None
+    assert wait == pytest.approx(30)
+    clock.now += wait
+    assert pool.try_acquire()[0] is not None
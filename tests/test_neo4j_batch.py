@@ -0,0 +1,33 @@
+import types
+from other.neo4j_batch import Neo4jBatchWriter
+
+
+def fake_graph():
+    return types.SimpleNamespace(service=types.SimpleNamespace(uri="bolt://test"), run=lambda *a, **k: [])
+
+
+def relation_rows(writer, rel_type):
+    return [row for key, rows in writer.relations.items() if key[0] == rel_type for row in rows]
+
+
+def test_addresses_skip_incomplete_merge_keys():
+    writer = Neo4jBatchWriter(fake_graph())
+    writer.add_addresses({"nodes": [
+        {"id": "a", "label": "User", "country": "CN", "province": "ZJ", "city": "HZ"},
+        {"id": "b", "label": "User", "province": "JS", "city": "NJ"},  # 缺少国家
+    ]})
+
+    labels = {label: list(group) for (label, _), group in writer.nodes.items()}
+    assert labels == {"Country": [("CN",)], "Province": [("ZJ", "CN")], "City": [("ZJ", "CN", "HZ")]}
+    addresses = relation_rows(writer, "WECHAT_ADDRESS")
+    assert [(row["start"]["id"], row["end"]["cityName"]) for row in addresses] == [("a", "HZ")]
+    for rows in writer.relations.values():
+        for row in rows:
+            assert None not in row["start"].values() and None not in row["end"].values()
+
+
+def test_addresses_fall_back_to_complete_level():
+    writer = Neo4jBatchWriter(fake_graph())
+    writer.add_addresses({"nodes": [{"id": "a", "label": "User", "country": "CN", "city": "HZ"}]})
+    addresses = relation_rows(writer, "WECHAT_ADDRESS")
+    assert [row["end"] for row in addresses] == [{"countryName": "CN"}]
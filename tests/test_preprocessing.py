@@ -0,0 +1,92 @@
+import json
+import os
+import pytest
+from sqlalchemy import func, select, text
+from other.database import WxMsg, PairDailyStat, SourceFile
+from other.preprocessing import DataPreprocessing
+from conftest import MASTER, make_msg
+
+
+def counts(engine):
+    with engine.connect() as conn:
+        return (
+            conn.execute(select(func.count()).select_from(WxMsg.__table__)).scalar(),
+            conn.execute(select(func.coalesce(func.sum(PairDailyStat.msg_count), 0))).scalar(),
+            conn.execute(select(func.count()).select_from(SourceFile.__table__)).scalar(),
+        )
+
+
+@pytest.mark.parametrize("stream, workers", [(False, 1), (True, 1), (True, 2)])
+def test_reingest_is_idempotent(export_dir, database, stream, workers):
+    engine, Session = database
+    DataPreprocessing(export_dir, stream=stream, workers=workers).store_data_to_sqlite(engine, Session)
+    first = counts(engine)
+    assert first[0] > 0 and first[0] == first[1]
+
+    DataPreprocessing(export_dir, stream=stream, workers=workers).store_data_to_sqlite(engine, Session)
+    assert counts(engine) == first
+
+
+def test_ingest_pragmas_do_not_leak(export_dir, database):
+    engine, Session = database
+    DataPreprocessing(export_dir, stream=True).store_data_to_sqlite(engine, Session)
+    session = Session()
+    try:
+        assert session.execute(text("PRAGMA synchronous")).scalar() == 2  # FULL，SQLite 默认值
+        assert session.execute(text("PRAGMA cache_size")).scalar() == -2000
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize("stream, workers", [(False, 1), (True, 1), (True, 2)])
+def test_reingest_picks_up_appended_message(export_dir, database, stream, workers):
+    engine, Session = database
+    DataPreprocessing(export_dir, stream=stream, workers=workers).store_data_to_sqlite(engine, Session)
+    before = counts(engine)
+
+    path = os.path.join(export_dir, "wxid_u0", "wxid_u0.json")
+    with open(path, encoding="utf-8") as f:
+        msgs = json.load(f)
+    msgs.append(make_msg(MASTER, "wxid_u0", 1, "新消息", "2024-01-01 08:00:00"))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(msgs, f, ensure_ascii=False)
+
+    DataPreprocessing(export_dir, stream=stream, workers=workers).store_data_to_sqlite(engine, Session)
+    after = counts(engine)
+    assert after[0] == before[0] + 1
+    assert after[1] == before[1] + 1
+    assert after[2] == before[2]
+
+
+def test_batch_and_stream_ingest_the_same_files(export_dir, tmp_path):
+    from other.database import init_database
+    extra = os.path.join(export_dir, "wxid_u1", "wxid_u1_2.json")
+    with open(extra, "w", encoding="utf-8") as f:
+        json.dump([make_msg("wxid_u1", "wxid_u1", 0, "另一个文件", "2024-01-01 08:00:00")], f, ensure_ascii=False)
+
+    results = []
+    for stream, workers in ((False, 1), (True, 1), (True, 2)):
+        engine, Session = init_database(f"sqlite:///{tmp_path / f'stream_{stream}_{workers}.db'}")
+        DataPreprocessing(export_dir, stream=stream, workers=workers).store_data_to_sqlite(engine, Session)
+        results.append(counts(engine))
+        with engine.connect() as conn:
+            assert conn.execute(select(func.count()).where(WxMsg.msg == "另一个文件")).scalar() == 1
+        engine.dispose()
+    assert results[0] == results[1] == results[2]
+
+
+def test_iter_contacts_yields_each_contact_once(export_dir):
+    extra = os.path.join(export_dir, "wxid_u1", "wxid_u1_2.json")
+    with open(extra, "w", encoding="utf-8") as f:
+        json.dump([make_msg("wxid_u1", "wxid_u1", 0, "另一个文件", "2024-01-01 08:00:00")], f, ensure_ascii=False)
+
+    batch = DataPreprocessing(export_dir)
+    stream = DataPreprocessing(export_dir, stream=True)
+    streamed = {wxid: list(msgs) for wxid, msgs in stream.iter_contacts()}
+    loaded = dict(batch.iter_contacts())
+
+    assert list(streamed) == sorted(set(streamed))
+    assert set(streamed) == set(loaded)
+    for wxid, msgs in loaded.items():
+        assert [m["msg"] for m in streamed[wxid]] == [m["msg"] for m in msgs]
+    assert [m["msg"] for m in streamed["wxid_u1"]] == ["另一个文件"]